@@ -0,0 +1,97 @@
+""" Lecturas pesadas (reportes, historiales) a la réplica; todo lo demás al primario.
+
+El alias 'replica' siempre existe: con DATABASE_REPLICA_URL es otra base; sin ella apunta a
+la misma que 'default'. En pruebas es TEST.MIRROR del primario. """
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+
+REPLICA = 'replica'
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+def replica_enabled():
+    return REPLICA in settings.DATABASES
+
+
+@contextmanager
+def read_from_replica():
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def _pins():
+    # Caché compartida entre workers (tabla en el primario); la LocMem sería por proceso
+    return caches[getattr(settings, 'REPLICA_PIN_CACHE', 'replica-pins')]
+
+
+def _pin_key(user_id):
+    return f"db-pin:{user_id}"
+
+
+def pin_to_primary(user):
+    """ Después de escribir, las lecturas de ese usuario van al primario por unos segundos """
+    if user is not None and user.is_authenticated:
+        _pins().set(_pin_key(user.pk), True, getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+
+
+def is_pinned(user):
+    return user is not None and user.is_authenticated and bool(_pins().get(_pin_key(user.pk)))
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and replica_enabled():
+            return REPLICA
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Ambas bases tienen los mismos datos
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaReadMixin:
+    """ Para vistas DRF de solo lectura: los GET van a la réplica salvo que el usuario
+    haya escrito hace muy poco (leer lo que uno mismo acaba de escribir). """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)  # aquí ya está autenticado request.user
+        if request.method in ('GET', 'HEAD', 'OPTIONS') and not is_pinned(request.user):
+            self._replica_token = _use_replica.set(True)
+
+    def dispatch(self, request, *args, **kwargs):
+        # finally y no finalize_response: si la vista lanza una excepción no manejada DRF
+        # la relanza sin pasar por finalize_response y el hilo quedaría leyendo de la réplica
+        self._replica_token = None
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            if self._replica_token is not None:
+                _use_replica.reset(self._replica_token)
+                self._replica_token = None
+
+
+class ReplicaPinningMiddleware:
+    """ Marca al usuario que acaba de escribir (POST/PUT/PATCH/DELETE exitoso) """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            # DRF deja en request.user al usuario autenticado por JWT
+            pin_to_primary(getattr(request, 'user', None))
+        return response
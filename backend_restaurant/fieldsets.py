@@ -0,0 +1,110 @@
+""" Payloads a la medida para clientes móviles y POS, solo en lecturas (GET):
+
+    ?fields=id,name       solo esos campos
+    ?omit=description     todos menos esos
+    ?expand=cash_register el id de la relación se reemplaza por el objeto anidado
+
+La vista ajusta la consulta a lo que se va a mostrar: .only() con las columnas usadas y
+JOIN (select_related) únicamente para las relaciones expandidas o leídas con 'rel.campo'. """
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.relations import RelatedField
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+PARAMS = ('fields', 'omit', 'expand')
+
+
+def requested(request, param):
+    raw = request.query_params.get(param, '')
+    return {name.strip() for name in raw.split(',') if name.strip()}
+
+
+class SparseFieldsMixin:
+    """ Serializer: expandable_fields = {'nombre': (SerializerAnidado, {'source': ...})} """
+    expandable_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Solo el serializer raíz de la vista: los anidados se construyen sin contexto
+        request = self.context.get('request')
+        if request is not None and request.method in SAFE_METHODS:
+            self.apply_fieldset(request)
+
+    def apply_fieldset(self, request):
+        expand = requested(request, 'expand') & set(self.expandable_fields)
+        fields = requested(request, 'fields')
+        omit = requested(request, 'omit')
+        if not (expand or fields or omit):
+            return
+        unknown = fields - set(self.fields) - expand
+        if unknown:
+            raise ValidationError({'fields': f"Campos desconocidos: {', '.join(sorted(unknown))}"})
+        for name in expand:
+            serializer_class, options = self.expandable_fields[name]
+            self.fields[name] = serializer_class(read_only=True, **options)
+        for name in list(self.fields):
+            if (fields and name not in fields and name not in expand) or name in omit:
+                self.fields.pop(name)
+
+
+def narrow(queryset, serializer):
+    """ Aplica .only()/select_related/prefetch_related según los campos del serializer.
+    Si algún campo lee algo que no es una columna (métodos, propiedades) no se toca nada. """
+    plan = _plan(queryset.model, serializer)
+    if plan is None:
+        return queryset
+    only, joins, prefetch = plan
+    queryset = queryset.select_related(None).only(*only)
+    if joins:
+        queryset = queryset.select_related(*joins)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+def _plan(model, serializer, prefix=''):
+    only = {prefix + model._meta.pk.name}
+    joins, prefetch = [], []
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        source = field.source_attrs
+        if not source:
+            return None  # source='*' / SerializerMethodField: necesita el objeto completo
+        try:
+            model_field = model._meta.get_field(source[0])
+        except FieldDoesNotExist:
+            return None
+        path = prefix + source[0]
+        if model_field.one_to_many or model_field.many_to_many:
+            prefetch.append(path)
+        elif isinstance(field, BaseSerializer) and not isinstance(field, ListSerializer):
+            nested = _plan(model_field.related_model, field, prefix=path + '__')
+            if nested is None:
+                return None
+            only.add(path)
+            only.update(nested[0])
+            joins.append(path)
+            joins.extend(nested[1])
+        elif len(source) > 1 and model_field.is_relation:
+            only.update((path, prefix + '__'.join(source[:2])))
+            joins.append(path)
+        elif isinstance(field, RelatedField) and model_field.is_relation and not field.use_pk_only_optimization():
+            # SlugRelatedField, StringRelatedField...: leen atributos del objeto relacionado
+            only.add(path)
+            joins.append(path)
+        else:
+            only.add(path)
+    return only, joins, prefetch
+
+
+class SparseFieldsViewMixin:
+    """ ViewSet: achica la consulta cuando el cliente pide ?fields=, ?omit= o ?expand= """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        params = self.request.query_params
+        if self.request.method in SAFE_METHODS and any(params.get(p) for p in PARAMS):
+            queryset = narrow(queryset, self.get_serializer())
+        return queryset
@@ -1,4 +1,5 @@
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from core import refdata
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     def validate(self, attrs):
@@ -7,12 +8,14 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         data['username'] = self.user.username
         data['is_superuser'] = self.user.is_superuser
         
-        # LÓGICA DE ROLES MEJORADA
+        # LÓGICA DE ROLES MEJORADA (los ids de los grupos están en memoria del worker)
+        groups = refdata.get('auth.groups')
+        member_of = set(self.user.groups.values_list('id', flat=True)) if not self.user.is_superuser else set()
         if self.user.is_superuser:
             data['role'] = 'ADMIN'
-        elif self.user.groups.filter(name='Cocineros').exists():
+        elif groups.get('Cocineros') in member_of:
             data['role'] = 'COOK'     # Nuevo Rol
-        elif self.user.groups.filter(name='Cajeros').exists():
+        elif groups.get('Cajeros') in member_of:
             data['role'] = 'CASHIER'  # Rol Cajero
         else:
             data['role'] = 'USER'     # Rol por defecto sin permisos
@@ -1,6 +1,7 @@
 from pathlib import Path
 import os
 import dj_database_url
+from corsheaders.defaults import default_headers
 from datetime import timedelta
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -28,6 +29,7 @@ INSTALLED_APPS = [
     'corsheaders',
     
     # MIS APPS
+    'core',
     'finance',
     'inventory',
 ]
@@ -35,6 +37,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware', # <--- VITAL PARA ESTILOS EN RENDER
+    'backend_restaurant.compression.CompressionMiddleware',  # JSON grande -> brotli/gzip
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',      # <--- CORS SIEMPRE ARRIBA
     'django.middleware.common.CommonMiddleware',
@@ -42,6 +45,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'backend_restaurant.db_router.ReplicaPinningMiddleware',
 ]
 
 ROOT_URLCONF = 'backend_restaurant.urls'
@@ -69,10 +73,79 @@ WSGI_APPLICATION = 'backend_restaurant.wsgi.application'
 DATABASES = {
     'default': dj_database_url.config(
         default='sqlite:///db.sqlite3',
-        conn_max_age=600
+        conn_max_age=600,
+        conn_health_checks=True,  # descarta conexiones muertas (ej. tras reiniciar la BD)
     )
 }
 
+# POOL DE CONEXIONES (PostgreSQL + psycopg 3)
+# DB_POOL=1 activa el pool nativo de Django: las conexiones se comparten entre hilos del
+# worker en vez de mantener una conexión persistente por hilo (CONN_MAX_AGE debe ser 0).
+if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql' and os.environ.get('DB_POOL', '') in ('1', 'true', 'True'):
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),       # espera máxima por una conexión libre
+        'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', 300)),     # cierra las ociosas
+        'max_lifetime': float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+        # El chequeo de salud al prestar cada conexión lo activa CONN_HEALTH_CHECKS
+    }
+
+# SQLITE PARA SUCURSALES CHICAS (un servidor, varios workers de gunicorn)
+# - WAL: los lectores no bloquean al que escribe ni al revés.
+# - BEGIN IMMEDIATE: cada transacción toma el candado de escritura al empezar; con el modo
+#   por defecto (DEFERRED) una lectura que luego quiere escribir falla en el acto con
+#   "database is locked", sin esperar el timeout. Los reportes de solo lectura no pagan
+#   esa espera: leen por el alias 'replica', la misma base en modo DEFERRED (ver abajo).
+# - timeout: segundos que se espera el candado antes de fallar.
+# SQLITE_PROFILE=legacy vuelve al comportamiento de SQLite por defecto.
+SQLITE_CONCURRENT_OPTIONS = {
+    'transaction_mode': 'IMMEDIATE',
+    'timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 20)),
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'      # con WAL no se pierde integridad, solo el último commit si se corta la luz
+        'PRAGMA cache_size=-20000;'       # ~20 MB de caché de páginas por conexión
+        'PRAGMA temp_store=MEMORY;'
+        'PRAGMA mmap_size=134217728;'     # 128 MB de lectura por mmap
+    ),
+}
+SQLITE_CONCURRENT = (
+    DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3'
+    and os.environ.get('SQLITE_PROFILE', 'concurrent') == 'concurrent'
+)
+if SQLITE_CONCURRENT:
+    DATABASES['default'].setdefault('OPTIONS', {}).update(SQLITE_CONCURRENT_OPTIONS)
+
+# RÉPLICA DE LECTURA: reportes e historiales leen por el alias 'replica'.
+# Con DATABASE_REPLICA_URL es otra base; sin ella, la misma que 'default' (en SQLite con
+# transacciones DEFERRED, ver arriba). En las pruebas siempre es espejo (TEST.MIRROR) del primario.
+if os.environ.get('DATABASE_REPLICA_URL'):
+    DATABASES['replica'] = dj_database_url.parse(
+        os.environ['DATABASE_REPLICA_URL'], conn_max_age=600, conn_health_checks=True
+    )
+else:
+    DATABASES['replica'] = {**DATABASES['default'], 'OPTIONS': dict(DATABASES['default'].get('OPTIONS', {}))}
+    DATABASES['replica']['OPTIONS'].pop('transaction_mode', None)
+DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['backend_restaurant.db_router.ReplicaRouter']
+# Segundos que un usuario lee del primario después de escribir (lee lo que acaba de escribir).
+# La marca vive en una tabla del primario (la crea la migración core 0004) para que la vean todos los workers.
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'replica-pins': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'replica_pin_cache'},
+}
+
+# Días que una caja cerrada conserva su libro detallado antes de compactarse (compact_ledger)
+LEDGER_RETENTION_DAYS = int(os.environ.get('LEDGER_RETENTION_DAYS', 90))
+
+# Unidades, carta, recetas y grupos viven en memoria de cada worker (core.refdata).
+# Segundos entre revisiones de su versión: lo más que otro worker tarda en ver un cambio.
+REFDATA_CHECK_SECONDS = float(os.environ.get('REFDATA_CHECK_SECONDS', 2))
+
 # VALIDACIÓN DE PASSWORD (Desactivada para desarrollo, activar en prod si quieres)
 AUTH_PASSWORD_VALIDATORS = []
 
@@ -99,18 +172,45 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # orjson: mismo JSON que el renderer por defecto, bastante menos CPU
+    'DEFAULT_RENDERER_CLASSES': (
+        'backend_restaurant.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'backend_restaurant.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
+# Respuestas JSON a partir de este tamaño se comprimen (backend_restaurant.compression)
+API_COMPRESSION_MIN_BYTES = int(os.environ.get('API_COMPRESSION_MIN_BYTES', 1024))
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
 }
 
+# COLA DE TRABAJOS EN SEGUNDO PLANO (core.jobs)
+# 'thread': corre en un hilo del mismo proceso tras el commit (por defecto). Los reintentos
+#           los revisa un hilo que arranca wsgi.py, no los comandos de manage.py
+# 'worker': solo se encola; lo procesa 'python manage.py run_jobs'
+# 'sync':   corre tras el commit dentro del mismo request (útil en pruebas)
+JOBS_MODE = os.environ.get('JOBS_MODE', 'thread')
+JOBS_THREADS = int(os.environ.get('JOBS_THREADS', 2))
+# Modo 'thread': cada cuántos segundos se revisan reintentos y trabajos colgados sin esperar otra venta
+JOBS_POLL_SECONDS = float(os.environ.get('JOBS_POLL_SECONDS', 15))
+# Un trabajo RUNNING por más que esto se da por perdido (su proceso murió) y vuelve a la cola
+JOBS_LOCK_TIMEOUT = int(os.environ.get('JOBS_LOCK_TIMEOUT', 600))
+
 # CORS - PERMISOS
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:4200",
     # AQUÍ AGREGAREMOS TU URL DE VERCEL CUANDO LA TENGAS
     # "https://mi-proyecto.vercel.app"
 ]
+# Cabecera con la que el POS indica su terminal (caja propia por terminal)
+CORS_ALLOW_HEADERS = (*default_headers, 'x-terminal')
 # Opción nuclear para evitar dolores de cabeza al principio (luego la quitas)
 CORS_ALLOW_ALL_ORIGINS = True
\ No newline at end of file
@@ -0,0 +1,216 @@
+import importlib.util
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+from contextlib import closing
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from unittest import mock
+
+from django.core.cache import caches
+from django.conf import settings
+from django.db import connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.views import APIView
+
+from .db_router import REPLICA, ReplicaRouter, _use_replica, is_pinned, pin_to_primary, read_from_replica
+from .renderers import ORJSONRenderer, money
+
+
+class ReplicaRouterTests(TestCase):
+    def test_reads_go_to_the_replica_only_inside_read_from_replica(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(User), 'default')
+        with read_from_replica():
+            self.assertEqual(router.db_for_read(User), REPLICA)
+            self.assertEqual(router.db_for_write(User), 'default')
+        self.assertEqual(router.db_for_read(User), 'default')
+
+    def test_migrations_only_run_on_the_primary(self):
+        router = ReplicaRouter()
+        self.assertTrue(router.allow_migrate('default', 'inventory'))
+        self.assertFalse(router.allow_migrate(REPLICA, 'inventory'))
+
+
+class ReplicaReadTests(TransactionTestCase):
+    """ La réplica es un espejo (TEST.MIRROR) del primario: se ve en qué conexión cae cada consulta """
+    databases = {'default', REPLICA}
+
+    def setUp(self):
+        caches['replica-pins'].clear()
+        self.user = User.objects.create_superuser('admin', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_report(self):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = self.client.get('/api/finance/report/')
+        self.assertEqual(response.status_code, 200)
+        # La consulta de la marca (caché compartida) siempre va al primario
+        primary = [q for q in primary.captured_queries if 'replica_pin_cache' not in q['sql']]
+        return len(primary), len(replica)
+
+    def test_report_reads_from_the_replica(self):
+        primary, replica = self.get_report()
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_successful_write_pins_the_user_to_the_primary(self):
+        response = self.client.post('/api/inventory/units/', {'name': 'Kilo', 'base_unit': 'KG'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(is_pinned(self.user))
+        primary, replica = self.get_report()
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_failed_write_and_reads_do_not_pin(self):
+        response = self.client.post('/api/inventory/units/', {'name': ''}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.client.get('/api/inventory/units/')
+        self.assertFalse(is_pinned(self.user))
+
+    def test_pin_is_per_user(self):
+        other = User.objects.create_user('cajero', password='x')
+        pin_to_primary(other)
+        self.assertTrue(is_pinned(other))
+        self.assertFalse(is_pinned(self.user))
+        self.assertEqual(self.get_report()[0], 0)
+
+    def test_pin_is_stored_in_the_shared_table(self):
+        # Otro worker (otro proceso) lee la misma tabla del primario
+        pin_to_primary(self.user)
+        with connections['default'].cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM replica_pin_cache")
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_unhandled_error_does_not_leave_the_thread_on_the_replica(self):
+        self.client.raise_request_exception = False
+        with mock.patch('finance.views.FinancialReportView.get', side_effect=RuntimeError):
+            response = self.client.get('/api/finance/report/')
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(_use_replica.get())
+        self.assertEqual(ReplicaRouter().db_for_read(User), 'default')
+
+
+class ReplicaSettingsTests(SimpleTestCase):
+    def test_replica_alias_always_mirrors_the_primary_in_tests(self):
+        self.assertIn(REPLICA, settings.DATABASES)
+        self.assertEqual(settings.DATABASES[REPLICA]['TEST']['MIRROR'], 'default')
+        self.assertNotIn('transaction_mode', settings.DATABASES[REPLICA].get('OPTIONS', {}))
+
+
+class ORJSONRendererTests(TestCase):
+    def test_bare_decimals_render_as_exact_strings(self):
+        data = {'balance': Decimal('0.10') + Decimal('0.20'), 'big': Decimal('12345678901234567.89')}
+        body = ORJSONRenderer().render(data)
+        self.assertEqual(body, b'{"balance":"0.30","big":"12345678901234567.89"}')
+
+    def test_hand_built_report_renders_every_amount_the_same_way(self):
+        class Report(APIView):
+            permission_classes = []
+
+            def get(self, request):
+                # Como los reportes: sumas vacías (None) y sumas de SQLite sin escala fija
+                return Response({'empty': money(None), 'sum': money(Decimal('30')), 'avg': money(Decimal('282.800000'))})
+
+        response = Report.as_view()(APIRequestFactory().get('/'))
+        response.render()
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.content, b'{"empty":"0.00","sum":"30.00","avg":"282.80"}')
+
+
+class SQLiteProfileTests(SimpleTestCase):
+    """ Dos transacciones que leen y después escriben, sobre un archivo SQLite abierto como lo
+    abre Django con las OPTIONS de settings (init_command, timeout y BEGIN según transaction_mode) """
+
+    def setUp(self):
+        if not settings.SQLITE_CONCURRENT:
+            self.skipTest("Solo con SQLite y el perfil concurrente")
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        self.path = os.path.join(folder, 'profile.sqlite3')
+        with closing(self.connect({})) as db:
+            db.execute("CREATE TABLE counter (n integer)")
+
+    def connect(self, options):
+        db = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        db.executescript(options.get('init_command', ''))
+        return db
+
+    def race(self, options):
+        """ B lee y espera; A lee, escribe y confirma; recién entonces B escribe """
+        begin = f"BEGIN {options.get('transaction_mode', '')}"
+        b_read, a_done, errors = threading.Event(), threading.Event(), []
+
+        def run(first):
+            with closing(self.connect(options)) as db:
+                try:
+                    if first:
+                        b_read.wait(2)
+                    db.execute(begin)
+                    db.execute("SELECT count(*) FROM counter").fetchone()
+                    if not first:
+                        b_read.set()
+                        a_done.wait(0.5)  # con IMMEDIATE, A espera el candado hasta que B termine
+                    db.execute("INSERT INTO counter VALUES (1)")
+                    db.execute("COMMIT")
+                except sqlite3.OperationalError as e:
+                    errors.append(str(e))
+                finally:
+                    if first:
+                        a_done.set()
+
+        threads = [threading.Thread(target=run, args=(first,)) for first in (True, False)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return errors
+
+    def test_default_profile_takes_the_write_lock_up_front(self):
+        options = settings.DATABASES['default']['OPTIONS']
+        self.assertEqual(options['transaction_mode'], 'IMMEDIATE')
+        self.assertEqual(self.race(options), [])
+
+    def test_deferred_read_then_write_fails_under_contention(self):
+        # Por eso el alias de solo lectura es el único sin IMMEDIATE
+        options = settings.DATABASES['replica']['OPTIONS']
+        self.assertNotIn('transaction_mode', options)
+        self.assertEqual(len(self.race(options)), 1)
+
+
+class ConnectionPoolSettingsTests(SimpleTestCase):
+    """ Lee settings.py de nuevo con otras variables de entorno (sin tocar la configuración activa) """
+
+    def load(self, **env):
+        path = os.path.join(os.path.dirname(__file__), 'settings.py')
+        spec = importlib.util.spec_from_file_location('settings_probe', path)
+        module = importlib.util.module_from_spec(spec)
+        clean = {k: v for k, v in os.environ.items() if not k.startswith(('DATABASE', 'DB_POOL'))}
+        with mock.patch.dict(os.environ, {**clean, **env}, clear=True):
+            spec.loader.exec_module(module)
+        return module.DATABASES['default']
+
+    def test_pool_on_postgres_drops_persistent_connections(self):
+        db = self.load(DATABASE_URL='postgres://u:p@db:5432/pos', DB_POOL='1', DB_POOL_MAX_SIZE='4')
+        self.assertEqual(db['CONN_MAX_AGE'], 0)
+        self.assertTrue(db['CONN_HEALTH_CHECKS'])
+        self.assertEqual((db['OPTIONS']['pool']['min_size'], db['OPTIONS']['pool']['max_size']), (2, 4))
+
+    def test_without_pool_connections_persist_with_health_checks(self):
+        db = self.load(DATABASE_URL='postgres://u:p@db:5432/pos')
+        self.assertEqual(db['CONN_MAX_AGE'], 600)
+        self.assertTrue(db['CONN_HEALTH_CHECKS'])
+        self.assertNotIn('pool', db.get('OPTIONS', {}))
+
+    def test_pool_is_ignored_on_sqlite(self):
+        db = self.load(DB_POOL='1')
+        self.assertEqual(db['ENGINE'], 'django.db.backends.sqlite3')
+        self.assertNotIn('pool', db['OPTIONS'])
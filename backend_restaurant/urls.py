@@ -6,9 +6,10 @@ from finance.views import UserViewSet
 # IMPORTS...
 from inventory.views import (
     ProductViewSet, SaleViewSet, CurrentCashRegisterView, 
-    ProductionViewSet, PurchaseViewSet, UnitViewSet
+    ProductionViewSet, PurchaseViewSet, UnitViewSet, StockMovementViewSet,
+    StockAlertViewSet, CatalogImportView, ForecastView, SalesAnalyticsView
 )
-from finance.views import FinancialReportView, CashRegisterViewSet, TransactionViewSet, ExpenseViewSet
+from finance.views import FinancialReportView, MarginReportView, CashRegisterViewSet, TransactionViewSet, ExpenseViewSet
 
 # 1. IMPORTAR VISTAS JWT
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
@@ -25,6 +26,8 @@ router.register(r'inventory/sales', SaleViewSet)
 router.register(r'inventory/production', ProductionViewSet)
 router.register(r'inventory/purchases', PurchaseViewSet)
 router.register(r'inventory/units', UnitViewSet)
+router.register(r'inventory/stock-movements', StockMovementViewSet)
+router.register(r'inventory/stock-alerts', StockAlertViewSet)
 router.register(r'finance/cajas', CashRegisterViewSet)
 router.register(r'finance/transactions', TransactionViewSet)
 router.register(r'finance/expenses', ExpenseViewSet, basename='expenses')
@@ -34,7 +37,11 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include(router.urls)),
     path('api/finance/current-caja/', CurrentCashRegisterView.as_view()),
+    path('api/inventory/catalog/', CatalogImportView.as_view()),
+    path('api/inventory/forecast/', ForecastView.as_view()),
+    path('api/inventory/sales-analytics/', SalesAnalyticsView.as_view()),
     path('api/finance/report/', FinancialReportView.as_view()),
+    path('api/finance/margin/', MarginReportView.as_view()),
 
     # USAR LA NUEVA VISTA AQUÍ 👇
     path('api/token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_restaurant.settings')
 
 application = get_wsgi_application()
+
+# Cola de trabajos en modo 'thread': el hilo que revisa reintentos corre solo donde se atienden requests
+from django.conf import settings  # noqa: E402
+
+if settings.JOBS_MODE == 'thread':
+    from core.jobs import start_poller
+    start_poller()
@@ -0,0 +1,44 @@
+from django.contrib import admin
+from django.core.paginator import Paginator
+from django.forms.models import BaseInlineFormSet
+from .models import Job
+
+
+# --- INLINES PAGINADOS (libros largos: movimientos de una caja, ventas de un plato) ---
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """ Solo una página de las filas relacionadas: un COUNT y un SELECT con LIMIT """
+    per_page = 20
+    page_number = 1
+
+    def get_queryset(self):
+        if not hasattr(self, 'page'):
+            self.page = Paginator(super().get_queryset(), self.per_page).get_page(self.page_number)
+            self._queryset = self.page.object_list
+        return self._queryset
+
+
+class PaginatedTabularInline(admin.TabularInline):
+    """ Inline de solo lectura que se recorre por páginas (?<prefijo>-page=N) """
+    formset = PaginatedInlineFormSet
+    template = 'admin/edit_inline/paginated_tabular.html'
+    per_page = 20
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None): return False
+    def has_change_permission(self, request, obj=None): return False
+    def has_delete_permission(self, request, obj=None): return False
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        page = request.GET.get(f"{formset.get_default_prefix()}-page", 1)
+        return type(formset.__name__, (formset,), {'per_page': self.per_page, 'page_number': page})
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'created_at', 'locked_at', 'finished_at')
+    list_filter = ('status', 'name')
+    search_fields = ('=id', '^dedupe_key')
+    readonly_fields = ('name', 'payload', 'dedupe_key', 'attempts', 'created_at', 'locked_at', 'finished_at', 'last_error')
+    show_full_result_count = False
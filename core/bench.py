@@ -0,0 +1,229 @@
+""" Utilidades para los comandos de benchmark (bench_*). Crean sus propios datos de prueba
+(usuario 'bench', terminal 'BENCH'): ejecutarlos solo contra una base de pruebas. """
+import statistics
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import connections, transaction
+from rest_framework.test import APIClient
+
+
+class InProcessClient:
+    """ Peticiones por la pila completa de Django (middlewares incluidos), sin red """
+
+    def __init__(self, user, terminal):
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        # La señal got_request_exception es global: con varios hilos, el cliente de pruebas
+        # relanzaría la excepción de otro hilo. Los errores se leen de la respuesta 500.
+        self.client.raise_request_exception = False
+        self.terminal = terminal
+
+    def request(self, method, path, data=None):
+        response = getattr(self.client, method)(
+            path, data, format='json', HTTP_ACCEPT='application/json', HTTP_X_TERMINAL=self.terminal
+        )
+        return response.status_code, response.content
+
+
+def require_scratch_database(force):
+    if not settings.DEBUG and not force:
+        raise CommandError("Este benchmark escribe datos de prueba. Úsalo en local (DEBUG) o pasa --force.")
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    low = int(k)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+
+def summarize(latencies, elapsed, errors=0):
+    """ Latencias en segundos -> métricas en milisegundos """
+    ms = [v * 1000 for v in latencies]
+    return {
+        "requests": len(ms),
+        "errors": errors,
+        "throughput": len(ms) / elapsed if elapsed else 0.0,
+        "mean": statistics.fmean(ms) if ms else 0.0,
+        "p50": percentile(ms, 50),
+        "p95": percentile(ms, 95),
+        "p99": percentile(ms, 99),
+    }
+
+
+def format_row(label, stats):
+    return (
+        f"{label:<28} {stats['requests']:>6} req {stats['errors']:>4} err "
+        f"{stats['throughput']:>9.1f} req/s  p50 {stats['p50']:>8.2f} ms  "
+        f"p95 {stats['p95']:>8.2f} ms  p99 {stats['p99']:>8.2f} ms"
+    )
+
+
+def run_threads(worker, threads, iterations):
+    """ Ejecuta worker(hilo, i) en paralelo. Devuelve (latencias, errores, segundos, mensajes) """
+    latencies, errors, messages = [], [0], []
+    lock = threading.Lock()
+
+    def loop(n):
+        try:
+            for i in range(iterations):
+                start = time.perf_counter()
+                try:
+                    worker(n, i)
+                except Exception as e:  # se cuenta y se sigue: medimos también los fallos
+                    with lock:
+                        errors[0] += 1
+                        if len(messages) < 5:
+                            messages.append(f"{type(e).__name__}: {e}")
+                    continue
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+        finally:
+            connections.close_all()
+
+    pool = [threading.Thread(target=loop, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return latencies, errors[0], time.perf_counter() - started, messages
+
+
+def bench_fixture(stock=100000):
+    """ Usuario, caja abierta, insumo y plato con stock suficiente para vender en los benchmarks """
+    from django.contrib.auth.models import User
+    from finance.models import CashRegister
+    from inventory.models import (
+        Batch, BaseUnit, MovementType, Product, Recipe, StockMovement, UnitOfMeasure
+    )
+
+    with transaction.atomic():
+        user, created = User.objects.get_or_create(
+            username='bench', defaults={'is_staff': True, 'is_superuser': True}
+        )
+        if created:
+            user.set_unusable_password()
+            user.save()
+        unit, _ = UnitOfMeasure.objects.get_or_create(name='Kg (bench)', defaults={'base_unit': BaseUnit.KILO})
+        ingredient, _ = Product.objects.get_or_create(name='Insumo (bench)', defaults={'is_dish': False})
+        dish, _ = Product.objects.get_or_create(
+            name='Plato (bench)', defaults={'is_dish': True, 'base_unit': BaseUnit.UNIT, 'sales_price': 10}
+        )
+        Recipe.objects.get_or_create(dish=dish, ingredient=ingredient, defaults={'quantity_required': Decimal('0.1')})
+        register = CashRegister.objects.open_for(user, 'BENCH') or CashRegister.objects.create(
+            start_amount=Decimal('1000000'), opened_by=user, terminal='BENCH'
+        )
+        for product, cost in ((ingredient, Decimal('1')), (dish, Decimal('3'))):
+            if product.current_stock < stock:
+                batch = Batch.objects.create(
+                    product=product, initial_quantity=stock, current_quantity=stock, unit_cost=cost
+                )
+                StockMovement.objects.create(
+                    product=product, batch=batch, movement_type=MovementType.OPENING,
+                    quantity=stock, unit_cost=cost
+                )
+                product.recalculate_stock()
+    return {'user': user, 'unit': unit, 'ingredient': ingredient, 'dish': dish, 'register': register}
+
+
+def open_registers(user, count, prefix):
+    """ Una caja abierta por hilo, cada una en su propia terminal: {terminal: caja_id} """
+    from finance.models import CashRegister
+
+    registers = {}
+    for n in range(count):
+        terminal = f"{prefix}-{n + 1}"
+        caja = CashRegister.objects.open_for(user, terminal) or CashRegister.objects.create(
+            start_amount=Decimal('1000000'), opened_by=user, terminal=terminal
+        )
+        registers[terminal] = caja.id
+    return registers
+
+
+def check_invariants():
+    """ Reglas que deben cumplirse siempre, por mucha concurrencia que haya.
+    Devuelve una lista de (regla, problemas encontrados) solo con las que fallan. """
+    from django.db.models import F, OuterRef, Subquery, Sum, Value, DecimalField
+    from django.db.models.functions import Coalesce
+    from finance.models import CashRegister, CategoryType, Transaction, TransactionType
+    from inventory.models import Batch, Product, Sale, SaleItem, SalesCube, StockMovement
+
+    qty = DecimalField(max_digits=14, decimal_places=3)
+    money = DecimalField(max_digits=14, decimal_places=2)
+
+    def total(queryset, field, output):
+        rows = queryset.order_by().annotate(total=Sum(field)).values('total')
+        return Coalesce(Subquery(rows), Value(0), output_field=output)
+
+    problems = []
+    negative = list(Batch.objects.filter(current_quantity__lt=0).values_list('id', flat=True)[:10])
+    if negative:
+        problems.append(("lotes con cantidad negativa", negative))
+
+    products = Product.objects.annotate(
+        in_batches=total(Batch.objects.filter(product=OuterRef('pk')).values('product'), 'current_quantity', qty),
+        available=total(
+            Batch.objects.available().filter(product=OuterRef('pk')).values('product'), 'current_quantity', qty
+        ),
+        in_kardex=total(StockMovement.objects.filter(product=OuterRef('pk')).values('product'), 'quantity', qty),
+    )
+    stale = list(products.exclude(current_stock=F('available')).values_list('name', 'current_stock', 'available')[:10])
+    if stale:
+        problems.append(("stock del producto != suma de sus lotes vigentes", stale))
+    kardex = list(products.exclude(in_kardex=F('in_batches')).values_list('name', 'in_kardex', 'in_batches')[:10])
+    if kardex:
+        problems.append(("kardex != suma de lotes", kardex))
+
+    sales = Sale.objects.annotate(
+        items_total=total(SaleItem.objects.filter(sale=OuterRef('pk')).values('sale'), 'subtotal', money)
+    ).exclude(total_amount=F('items_total'))
+    broken = list(sales.values_list('id', 'total_amount', 'items_total')[:10])
+    if broken:
+        problems.append(("total de la venta != suma de sus líneas", broken))
+
+    registers = CashRegister.objects.filter(is_closed=False).annotate(
+        sold=total(Sale.objects.filter(cash_register=OuterRef('pk')).values('cash_register'), 'total_amount', money),
+        cashed=total(
+            Transaction.objects.filter(
+                cash_register=OuterRef('pk'), type=TransactionType.INCOME, category=CategoryType.SALES
+            ).values('cash_register'),
+            'amount', money
+        ),
+    )
+    unbalanced = list(registers.exclude(sold=F('cashed')).values_list('id', 'sold', 'cashed')[:10])
+    if unbalanced:
+        problems.append(("ventas de la caja != ingresos por ventas", unbalanced))
+    overdrawn = list(
+        CashRegister.objects.filter(is_closed=False).with_balance().filter(balance__lt=0).values_list('id', 'balance')[:10]
+    )
+    if overdrawn:
+        problems.append(("cajas abiertas con saldo negativo", overdrawn))
+
+    # El cubo se mantiene en la cola: con la cola vacía debe cuadrar con las líneas de venta
+    lines = {
+        row['sale__cash_register_id']: (row['quantity'], row['revenue'])
+        for row in SaleItem.objects.values('sale__cash_register_id')
+        .annotate(quantity=Sum('quantity'), revenue=Sum('subtotal')).order_by()
+    }
+    cube = {
+        row['cash_register_id']: (row['quantity'], row['revenue'])
+        for row in SalesCube.objects.values('cash_register_id')
+        .annotate(quantity=Sum('quantity'), revenue=Sum('revenue')).order_by()
+    }
+    stale_cube = [
+        (register_id, lines.get(register_id), cube.get(register_id))
+        for register_id in sorted(lines.keys() | cube.keys())
+        if lines.get(register_id) != cube.get(register_id)
+    ][:10]
+    if stale_cube:
+        problems.append(("cubo de ventas != suma de las líneas (caja, líneas, cubo)", stale_cube))
+    return problems
@@ -0,0 +1,166 @@
+""" Cola local de trabajos: se guardan en la tabla Job dentro de la misma transacción
+que los origina y se ejecutan después del commit, en un hilo del proceso o con el
+comando 'run_jobs' (settings.JOBS_MODE = 'thread' | 'worker' | 'sync'). """
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job, JobStatus
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+_executor = None
+_poller = None
+_lock = threading.Lock()
+
+
+def job(name):
+    """ Registra una función como trabajo: @job('inventory.recalculate_stock') """
+    def register(func):
+        _registry[name] = func
+        return func
+    return register
+
+
+def enqueue(name, payload=None, dedupe_key=''):
+    """ Encola un trabajo. Si hay una transacción abierta, corre solo si ésta hace commit.
+    La fila se inserta siempre, dentro de esa transacción: los duplicados por dedupe_key
+    se descartan al tomarlos (claim), cuando todas sus transacciones ya hicieron commit. """
+    if name not in _registry:
+        raise ValueError(f"Trabajo desconocido: {name}")
+    Job.objects.create(name=name, payload=payload or {}, dedupe_key=dedupe_key)
+    mode = getattr(settings, 'JOBS_MODE', 'thread')
+    if mode == 'sync':
+        transaction.on_commit(run_pending)
+    elif mode == 'thread':
+        transaction.on_commit(_kick)
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'JOBS_THREADS', 2), thread_name_prefix='jobs'
+            )
+    return _executor
+
+
+def _kick():
+    _get_executor().submit(_run_in_thread)
+
+
+def start_poller():
+    """ Modo 'thread': revisa cada tanto reintentos programados y trabajos de otro proceso
+    que murió, aunque no se encole nada nuevo. Lo arranca solo wsgi.py (los procesos que
+    atienden requests): migrate, shell, run_jobs o las pruebas no dejan un hilo dando vueltas. """
+    global _poller
+    with _lock:
+        if _poller is None:
+            _poller = threading.Thread(target=_poll, name='jobs-poll', daemon=True)
+            _poller.start()
+
+
+def _poll():
+    interval = getattr(settings, 'JOBS_POLL_SECONDS', 15)
+    while True:
+        time.sleep(interval)
+        _get_executor().submit(_run_in_thread, reclaim=True)
+
+
+def _run_in_thread(reclaim=False):
+    close_old_connections()
+    try:
+        if reclaim:
+            reclaim_stale()
+        run_pending()
+    except Exception:
+        logger.exception("Error procesando la cola de trabajos")
+    finally:
+        close_old_connections()
+
+
+def reclaim_stale():
+    """ Trabajos que quedaron RUNNING porque su proceso murió: vuelven a la cola
+    (o fallan si ya agotaron sus intentos). Devuelve cuántos recuperó. """
+    timeout = timedelta(seconds=getattr(settings, 'JOBS_LOCK_TIMEOUT', 600))
+    now = timezone.now()
+    stale = Job.objects.filter(status=JobStatus.RUNNING, locked_at__lt=now - timeout)
+    failed = stale.filter(attempts__gte=getattr(settings, 'JOBS_MAX_ATTEMPTS', 3)).update(
+        status=JobStatus.FAILED, finished_at=now, locked_at=None,
+        last_error="El proceso que lo ejecutaba no terminó (tiempo de bloqueo agotado)."
+    )
+    retried = stale.update(status=JobStatus.PENDING, run_after=now, locked_at=None)
+    if failed or retried:
+        logger.warning("Trabajos colgados recuperados: %s a la cola, %s fallidos", retried, failed)
+    return failed + retried
+
+
+def claim(limit=50):
+    """ Toma trabajos pendientes. El UPDATE condicionado evita que dos procesos tomen el mismo.
+    Los demás pendientes con la misma dedupe_key quedan cubiertos por el tomado: ya hicieron
+    commit (si no, no se verían), así que el trabajo, que corre después, ve sus datos. """
+    now = timezone.now()
+    candidates = Job.objects.filter(status=JobStatus.PENDING, run_after__lte=now).values_list(
+        'id', 'dedupe_key'
+    )[:limit]
+    claimed, keys = [], set()
+    for pk, key in list(candidates):
+        if key and key in keys:
+            continue
+        taken = Job.objects.filter(pk=pk, status=JobStatus.PENDING).update(
+            status=JobStatus.RUNNING, attempts=F('attempts') + 1, locked_at=now
+        )
+        if taken:
+            claimed.append(pk)
+            if key:
+                keys.add(key)
+    if keys:
+        Job.objects.filter(status=JobStatus.PENDING, dedupe_key__in=keys).update(
+            status=JobStatus.DONE, finished_at=now, last_error="Cubierto por otro trabajo con la misma clave."
+        )
+    return Job.objects.filter(pk__in=claimed)
+
+
+def run_pending(limit=50):
+    """ Ejecuta los trabajos pendientes. Devuelve cuántos procesó. """
+    processed = 0
+    for current in claim(limit):
+        run_job(current)
+        processed += 1
+    return processed
+
+
+def run_job(current):
+    func = _registry.get(current.name)
+    try:
+        if func is None:
+            raise ValueError(f"Trabajo desconocido: {current.name}")
+        with transaction.atomic():
+            func(**current.payload)
+    except Exception:
+        max_attempts = getattr(settings, 'JOBS_MAX_ATTEMPTS', 3)
+        current.last_error = traceback.format_exc()
+        if current.attempts < max_attempts:
+            # Si mientras tanto se encola otro con la misma clave, el primero que se tome cubre al otro
+            current.status = JobStatus.PENDING
+            current.run_after = timezone.now() + timedelta(seconds=30 * current.attempts)
+        else:
+            current.status = JobStatus.FAILED
+            current.finished_at = timezone.now()
+        logger.warning("Trabajo %s #%s falló (intento %s)", current.name, current.pk, current.attempts)
+    else:
+        current.status = JobStatus.DONE
+        current.finished_at = timezone.now()
+        current.last_error = ''
+    current.locked_at = None
+    current.save(update_fields=['status', 'run_after', 'finished_at', 'last_error', 'locked_at'])
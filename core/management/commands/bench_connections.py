@@ -0,0 +1,66 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.test import APIClient
+from core.bench import bench_fixture, format_row, require_scratch_database, run_threads, summarize
+
+
+class Command(BaseCommand):
+    help = ("Mide la latencia de obtener una conexión a la BD y el rendimiento de los endpoints "
+            "de venta y reporte. Comparar con DB_POOL=0 y DB_POOL=1.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--iterations', type=int, default=50, help="Peticiones por hilo")
+        parser.add_argument('--acquire', type=int, default=200, help="Conexiones a abrir en la prueba de latencia")
+        parser.add_argument('--force', action='store_true', help="Permitir correr con DEBUG=False")
+
+    def handle(self, *args, **options):
+        require_scratch_database(options['force'])
+        db = settings.DATABASES['default']
+        pool = db.get('OPTIONS', {}).get('pool')
+        self.stdout.write(
+            f"Motor: {db['ENGINE']} | pool: {'sí ' + str(pool) if pool else 'no'} | "
+            f"CONN_MAX_AGE={db.get('CONN_MAX_AGE')} | CONN_HEALTH_CHECKS={db.get('CONN_HEALTH_CHECKS')}"
+        )
+
+        # 1. Latencia de adquirir conexión (con pool: devolver/prestar; sin pool: conectar de cero)
+        latencies = []
+        for _ in range(options['acquire']):
+            connection.close()
+            start = time.perf_counter()
+            connection.ensure_connection()
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            latencies.append(time.perf_counter() - start)
+        connection.close()
+        self.stdout.write(format_row("adquirir conexión + SELECT 1", summarize(latencies, sum(latencies))))
+
+        # 2. Rendimiento de endpoints con varios hilos (cada hilo usa su propia conexión/préstamo)
+        fixture = bench_fixture()
+        dish = fixture['dish']
+        payload = {'items': [{'dish_id': dish.id, 'quantity': 1, 'unit_price': '10'}]}
+
+        def client():
+            c = APIClient()
+            c.force_authenticate(fixture['user'])
+            return c
+
+        clients = [client() for _ in range(options['threads'])]
+
+        def sale(n, i):
+            r = clients[n].post('/api/inventory/sales/', payload, format='json', HTTP_X_TERMINAL='BENCH')
+            if r.status_code != 201:
+                raise RuntimeError(f"venta {r.status_code}: {r.content[:120]!r}")
+
+        def report(n, i):
+            r = clients[n].get('/api/finance/report/')
+            if r.status_code != 200:
+                raise RuntimeError(f"reporte {r.status_code}")
+
+        for label, worker in (("POST /inventory/sales/", sale), ("GET /finance/report/", report)):
+            latencies, errors, elapsed, messages = run_threads(worker, options['threads'], options['iterations'])
+            self.stdout.write(format_row(label, summarize(latencies, elapsed, errors)))
+            for message in messages:
+                self.stdout.write(self.style.WARNING(f"  {message}"))
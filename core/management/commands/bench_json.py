@@ -0,0 +1,67 @@
+import gzip
+import time
+import orjson
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from backend_restaurant.compression import brotli
+from backend_restaurant.renderers import ORJSONRenderer
+from core.bench import bench_fixture, require_scratch_database
+from finance.views import TransactionViewSet
+from inventory.views import ProductViewSet, SaleViewSet
+
+
+class Command(BaseCommand):
+    help = ("Compara JSONRenderer de DRF contra ORJSONRenderer (tiempo de serializar) y el tamaño "
+            "en la red sin comprimir, con gzip y con brotli, para los listados más pesados.")
+
+    VIEWSETS = (
+        ('transactions', TransactionViewSet),
+        ('sales', SaleViewSet),
+        ('products', ProductViewSet),
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help="Ventas de prueba a crear antes de medir")
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--force', action='store_true', help="Permitir correr con DEBUG=False")
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            require_scratch_database(options['force'])
+            self.seed(options['seed'])
+
+        self.stdout.write(
+            f"{'listado':<14}{'filas':>7}{'drf ms':>10}{'orjson ms':>11}{'x':>6}"
+            f"{'bytes':>10}{'gzip':>9}{'brotli':>9}"
+        )
+        for label, viewset in self.VIEWSETS:
+            view = viewset()
+            data = viewset.serializer_class(view.queryset.all(), many=True).data
+            drf = self.timed(JSONRenderer(), data, options['repeat'])
+            fast = self.timed(ORJSONRenderer(), data, options['repeat'])
+            body = ORJSONRenderer().render(data)
+            # Mismo JSON, no los mismos bytes (U+2028/2029 sin escapar): se comparan ya parseados
+            if orjson.loads(body) != orjson.loads(JSONRenderer().render(data)):
+                self.stdout.write(self.style.WARNING(f"  {label}: el contenido difiere del de DRF"))
+            br = len(brotli.compress(body, quality=5)) if brotli else None
+            self.stdout.write(
+                f"{label:<14}{len(data):>7}{drf * 1000:>10.2f}{fast * 1000:>11.2f}{drf / fast if fast else 0:>6.1f}"
+                f"{len(body):>10}{len(gzip.compress(body)):>9}{br if br is not None else '-':>9}"
+            )
+        if brotli is None:
+            self.stdout.write("brotli no está instalado: las respuestas se comprimen solo con gzip.")
+
+    def timed(self, renderer, data, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            renderer.render(data)
+        return (time.perf_counter() - start) / repeat
+
+    def seed(self, sales):
+        fixture = bench_fixture()
+        client = APIClient()
+        client.force_authenticate(fixture['user'])
+        payload = {'items': [{'dish_id': fixture['dish'].id, 'quantity': 1, 'unit_price': '10'}]}
+        for _ in range(sales):
+            client.post('/api/inventory/sales/', payload, format='json', HTTP_X_TERMINAL='BENCH')
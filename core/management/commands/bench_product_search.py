@@ -0,0 +1,83 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core.bench import InProcessClient, bench_fixture, require_scratch_database
+from inventory.models import BaseUnit, Product, normalize_search
+
+# Sílabas para nombres de producto con y sin tildes, como en una carta real
+WORDS = (
+    'pollo', 'ají', 'maní', 'papa', 'limón', 'plátano', 'queso', 'cebolla', 'tomate', 'arroz', 'fideo',
+    'chuño', 'charque', 'locoto', 'perejil', 'huevo', 'carne', 'lechón', 'pescado', 'camarón', 'picante',
+)
+QUERIES = ('po', 'aj', 'pol', 'aji', 'mani', 'limon', 'chu', 'pollo ', 'LECHON', 'camaron pic', 'zzz')
+
+
+class Command(BaseCommand):
+    help = ("Carga un catálogo sintético y compara la búsqueda de productos de antes (icontains sobre el "
+            "nombre) con Product.objects.search (nombre normalizado con índice de prefijo y, en PostgreSQL, "
+            "de trigramas).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--limit', type=int, default=20, help="Resultados por búsqueda (como el POS)")
+        parser.add_argument('--repeat', type=int, default=20, help="Repeticiones por consulta (se toma la mejor)")
+        parser.add_argument('--force', action='store_true', help="Permitir correr con DEBUG=False")
+
+    def handle(self, *args, **options):
+        require_scratch_database(options['force'])
+        created = self.seed(options['products'])
+        total = Product.objects.count()
+        self.stdout.write(f"{created} productos sintéticos nuevos, {total} en el catálogo ({connection.vendor})")
+
+        limit, repeat = options['limit'], options['repeat']
+        self.stdout.write(f"{'búsqueda':<14}{'icontains ms':>14}{'search ms':>11}{'x':>7}{'encontrados':>13}")
+        for term in QUERIES:
+            before = lambda: list(Product.objects.filter(name__icontains=term.strip()).order_by('name')[:limit])
+            after = lambda: list(Product.objects.search(term)[:limit])
+            found = Product.objects.matching(term).count()
+            slow_ms = self.best(before, repeat) * 1000
+            fast_ms = self.best(after, repeat) * 1000
+            self.stdout.write(
+                f"{term!r:<14}{slow_ms:>14.2f}{fast_ms:>11.2f}{slow_ms / fast_ms if fast_ms else 0:>7.1f}{found:>13}"
+            )
+
+        # Por la pila completa: antes el POS bajaba la lista entera y filtraba en el navegador
+        client = InProcessClient(bench_fixture()['user'], 'SEARCH')
+        whole = self.best(lambda: client.request('get', '/api/inventory/products/'), min(repeat, 5))
+        typed = [
+            self.best(lambda: client.request('get', f"/api/inventory/products/search/?q={term}&limit={limit}"), repeat)
+            for term in ('p', 'po', 'pol', 'poll', 'pollo')
+        ]
+        self.stdout.write(
+            f"GET lista completa: {whole * 1000:.1f} ms; GET search mientras se escribe 'pollo': "
+            f"{max(typed) * 1000:.1f} ms como máximo por tecla"
+        )
+
+    def best(self, func, repeat):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    def seed(self, count):
+        """ Nombres de dos o tres palabras; bulk_create arma el nombre de búsqueda como el catálogo """
+        rng = random.Random(0)
+        existing = set(Product.objects.filter(name__endswith='(bench)').values_list('name', flat=True))
+        names = set()
+        while len(names) < count:
+            words = rng.sample(WORDS, rng.randint(2, 3))
+            names.add(f"{' '.join(words).capitalize()} {rng.randint(1, 999)} (bench)")
+        fresh = sorted(names - existing)
+        Product.objects.bulk_create([
+            Product(
+                name=name, search_name=normalize_search(name), is_dish=rng.random() < 0.4,
+                base_unit=BaseUnit.UNIT, sales_price=rng.randint(5, 60)
+            )
+            for name in fresh
+        ], batch_size=1000, ignore_conflicts=True)
+        return len(fresh)
@@ -0,0 +1,149 @@
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay
+from django.utils import timezone
+
+from core.bench import bench_fixture, open_registers, require_scratch_database
+from finance.models import CategoryType, Transaction, TransactionType
+from inventory.models import BaseUnit, Product, Sale, SaleItem, SalesCube
+
+# Peso de cada hora del día: almuerzo y cena concentran las ventas
+HOURS = {8: 1, 9: 1, 10: 2, 11: 5, 12: 10, 13: 9, 14: 4, 15: 2, 16: 2, 17: 2, 18: 4, 19: 7, 20: 7, 21: 3}
+
+
+class Command(BaseCommand):
+    help = ("Carga un año de ventas sintéticas y compara las consultas de analítica (más vendidos, "
+            "mapa de calor, ventas por caja) sobre SaleItem contra el cubo de ventas preagregado.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--sales-per-day', type=int, default=200)
+        parser.add_argument('--dishes', type=int, default=30)
+        parser.add_argument('--repeat', type=int, default=5, help="Repeticiones por consulta (se toma la mejor)")
+        parser.add_argument('--no-seed', action='store_true', help="Usar las ventas que ya hay en la base")
+        parser.add_argument('--force', action='store_true', help="Permitir correr con DEBUG=False")
+
+    def handle(self, *args, **options):
+        require_scratch_database(options['force'])
+        if not options['no_seed']:
+            started = time.perf_counter()
+            created = self.seed(options['days'], options['sales_per_day'], options['dishes'])
+            self.stdout.write(f"{created} ventas sintéticas en {time.perf_counter() - started:.1f} s")
+
+        started = time.perf_counter()
+        cells = SalesCube.refresh()
+        rebuild = time.perf_counter() - started
+        lines = SaleItem.objects.count()
+        self.stdout.write(f"Reconstrucción completa: {lines} líneas -> {cells} celdas en {rebuild:.2f} s")
+
+        cell = SalesCube.objects.order_by('-period').values('period', 'cash_register_id').first()
+        if cell:
+            start = cell['period']
+            incremental = self.best(lambda: SalesCube.refresh(
+                start, start + timedelta(hours=1), cash_register_id=cell['cash_register_id']
+            ), options['repeat'])
+            self.stdout.write(f"Celda (hora, caja) tras una venta: {incremental * 1000:.2f} ms")
+
+        end = timezone.localdate()
+        first = end - timedelta(days=options['days'])
+        since = timezone.make_aware(datetime.combine(first, datetime.min.time()))
+        items = SaleItem.objects.filter(sale__date__gte=since)
+        cube = SalesCube.objects.filter(date__range=[first, end])
+
+        queries = (
+            ('top 10 platos',
+             lambda: list(items.values('dish_id', 'dish__name').annotate(quantity=Sum('quantity'), revenue=Sum('subtotal'))
+                          .order_by('-quantity')[:10]),
+             lambda: list(cube.rollup('dish').order_by('-quantity')[:10])),
+            ('mapa de calor',
+             lambda: list(items.annotate(weekday=ExtractIsoWeekDay('sale__date'), hour=ExtractHour('sale__date'))
+                          .values('weekday', 'hour').annotate(quantity=Sum('quantity'), revenue=Sum('subtotal'))
+                          .order_by('weekday', 'hour')),
+             lambda: list(cube.rollup('heatmap'))),
+            ('ventas por caja',
+             lambda: list(items.values('sale__cash_register_id', 'sale__cash_register__terminal', 'sale__cash_register__date')
+                          .annotate(quantity=Sum('quantity'), revenue=Sum('subtotal'), lines=Count('id'))
+                          .order_by('sale__cash_register_id')),
+             lambda: list(cube.rollup('register'))),
+        )
+        self.stdout.write(f"{'consulta':<18}{'SaleItem ms':>13}{'cubo ms':>10}{'x':>8}  resultado")
+        for label, raw, fast in queries:
+            raw_rows, fast_rows = raw(), fast()
+            same = [r['quantity'] for r in raw_rows] == [r['quantity'] for r in fast_rows]
+            slow_ms = self.best(raw, options['repeat']) * 1000
+            cube_ms = self.best(fast, options['repeat']) * 1000
+            self.stdout.write(
+                f"{label:<18}{slow_ms:>13.2f}{cube_ms:>10.2f}{slow_ms / cube_ms if cube_ms else 0:>8.1f}  "
+                + ("igual" if same else self.style.ERROR("DISTINTO"))
+            )
+
+    def best(self, func, repeat):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    def seed(self, days, per_day, dish_count):
+        """ Ventas con su ingreso en caja (uno por caja y día), sin pasar por los lotes """
+        fixture = bench_fixture()
+        registers = list(open_registers(fixture['user'], 4, 'CUBE').values())
+        dishes = []
+        for n in range(dish_count):
+            dish, _ = Product.objects.get_or_create(
+                name=f"Plato cubo {n + 1} (bench)",
+                defaults={'is_dish': True, 'base_unit': BaseUnit.UNIT, 'sales_price': 10 + n}
+            )
+            dishes.append(dish)
+        # Unos platos se venden mucho más que otros
+        popularity = [1 / (n + 1) for n in range(dish_count)]
+        rng = random.Random(0)
+        hours, weights = zip(*HOURS.items())
+        today = timezone.localdate()
+        created = 0
+
+        for offset in range(days, 0, -1):
+            day = today - timedelta(days=offset)
+            with transaction.atomic():
+                by_hour = {}
+                for hour in rng.choices(hours, weights, k=per_day):
+                    by_hour[hour] = by_hour.get(hour, 0) + 1
+                income = {}
+                for hour, count in by_hour.items():
+                    sales, lines = [], []
+                    for _ in range(count):
+                        picks = rng.choices(dishes, popularity, k=rng.randint(1, 3))
+                        sale_lines = [(dish, rng.randint(1, 2)) for dish in picks]
+                        total = sum(dish.sales_price * qty for dish, qty in sale_lines)
+                        sales.append(Sale(cash_register_id=rng.choice(registers), total_amount=total))
+                        lines.append(sale_lines)
+                    Sale.objects.bulk_create(sales)
+                    # auto_now_add pisa la fecha: todas las ventas de esa hora a la vez
+                    moment = timezone.make_aware(datetime.combine(day, datetime.min.time()).replace(hour=hour, minute=30))
+                    Sale.objects.filter(pk__in=[s.pk for s in sales]).update(date=moment)
+                    SaleItem.objects.bulk_create([
+                        SaleItem(
+                            sale=sale, dish=dish, quantity=qty, unit_price=dish.sales_price,
+                            subtotal=dish.sales_price * qty, cost_total=Decimal('3') * qty
+                        )
+                        for sale, sale_lines in zip(sales, lines)
+                        for dish, qty in sale_lines
+                    ], batch_size=1000)
+                    for sale in sales:
+                        income[sale.cash_register_id] = income.get(sale.cash_register_id, 0) + sale.total_amount
+                    created += count
+                Transaction.objects.bulk_create([
+                    Transaction(
+                        cash_register_id=register_id, type=TransactionType.INCOME, category=CategoryType.SALES,
+                        description=f"Ventas sintéticas {day} (bench)", amount=amount
+                    )
+                    for register_id, amount in income.items()
+                ])
+        return created
@@ -0,0 +1,89 @@
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from core.bench import (
+    InProcessClient, bench_fixture, format_row, open_registers, require_scratch_database, summarize
+)
+
+PROFILES = {
+    # Lo que trae SQLite por defecto: diario de rollback y transacciones DEFERRED
+    'legacy': {'init_command': 'PRAGMA journal_mode=DELETE;PRAGMA synchronous=FULL', 'timeout': 5},
+    # WAL y busy timeout, pero transacciones DEFERRED (como el alias 'replica')
+    'deferred': {k: v for k, v in settings.SQLITE_CONCURRENT_OPTIONS.items() if k != 'transaction_mode'},
+    'concurrent': settings.SQLITE_CONCURRENT_OPTIONS,
+}
+
+
+def worker(user, terminal, dish_id, iterations, results):
+    """ Un proceso como un worker de gunicorn: sus ventas y, tras cada commit, su trabajo de stock """
+    settings.JOBS_MODE = 'sync'
+    client = InProcessClient(user, terminal)
+    payload = {'items': [{'dish_id': dish_id, 'quantity': 1, 'unit_price': '10'}]}
+    latencies, errors, messages = [], 0, []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        code, body = client.request('post', '/api/inventory/sales/', payload)
+        if code == 201:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors += 1
+            if len(messages) < 3:
+                messages.append(f"{code}: {body[:100]!r}")
+    connections.close_all()
+    results.put((latencies, errors, messages))
+
+
+class Command(BaseCommand):
+    help = ("Compara ventas simultáneas desde varios procesos en SQLite con el perfil por defecto "
+            "(legacy), con WAL en modo DEFERRED y con el perfil concurrente (WAL + BEGIN IMMEDIATE + busy timeout).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4, help="Procesos (como workers de gunicorn)")
+        parser.add_argument('--iterations', type=int, default=40, help="Ventas por proceso")
+        parser.add_argument('--force', action='store_true', help="Permitir correr con DEBUG=False")
+
+    def handle(self, *args, **options):
+        require_scratch_database(options['force'])
+        if connection.vendor != 'sqlite':
+            raise CommandError("Este benchmark es solo para SQLite.")
+        db = connections.settings['default']
+        original = db.get('OPTIONS', {})
+        fixture = bench_fixture()
+        registers = open_registers(fixture['user'], options['processes'], 'SQLITE')
+        context = multiprocessing.get_context('fork')
+        try:
+            for name, profile in PROFILES.items():
+                # Ninguna conexión abierta debe cruzar el fork; los hijos abren las suyas
+                connections.close_all()
+                db['OPTIONS'] = dict(profile)
+                with connection.cursor() as cursor:
+                    cursor.execute("PRAGMA journal_mode")
+                    journal = cursor.fetchone()[0]
+                connections.close_all()
+
+                results = context.Queue()
+                processes = [
+                    context.Process(target=worker, args=(
+                        fixture['user'], terminal, fixture['dish'].id, options['iterations'], results
+                    ))
+                    for terminal in registers
+                ]
+                started = time.perf_counter()
+                for p in processes:
+                    p.start()
+                collected = [results.get() for _ in processes]
+                for p in processes:
+                    p.join()
+                elapsed = time.perf_counter() - started
+
+                latencies = [v for lat, _, _ in collected for v in lat]
+                errors = sum(err for _, err, _ in collected)
+                self.stdout.write(format_row(f"{name} ({journal})", summarize(latencies, elapsed, errors)))
+                for message in {m for _, _, msgs in collected for m in msgs}:
+                    self.stdout.write(self.style.WARNING(f"  {message}"))
+        finally:
+            connections.close_all()
+            db['OPTIONS'] = original
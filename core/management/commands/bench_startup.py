@@ -0,0 +1,119 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.bench import bench_fixture, require_scratch_database
+
+# Proceso nuevo, como un worker de gunicorn: arranca la app WSGI y atiende los primeros
+# requests de un POS (carta, caja actual, una venta) llamando a la app sin red.
+PROBE = r'''
+import json, os, sys, time
+from io import BytesIO
+started = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_restaurant.settings')
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+timings = {'boot': time.perf_counter() - started}
+mode, token, terminal, dish_id = sys.argv[1:5]
+if mode == 'warm':
+    from core.refdata import warm_up
+    for step, seconds in warm_up().items():
+        timings['warm_' + step] = seconds
+
+def call(method, path, payload=None):
+    body = json.dumps(payload).encode() if payload is not None else b''
+    environ = {
+        'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': '', 'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http',
+        'wsgi.input': BytesIO(body), 'wsgi.errors': sys.stderr, 'wsgi.multithread': False,
+        'wsgi.multiprocess': True, 'wsgi.run_once': False, 'CONTENT_LENGTH': str(len(body)),
+        'CONTENT_TYPE': 'application/json', 'HTTP_ACCEPT': 'application/json',
+        'HTTP_AUTHORIZATION': 'Bearer ' + token, 'HTTP_X_TERMINAL': terminal,
+    }
+    status = []
+    b''.join(application(environ, lambda s, headers, exc_info=None: status.append(s)))
+    if int(status[0][:3]) >= 400:
+        raise SystemExit(f"{method} {path}: {status[0]}")
+
+requests = [
+    ('GET', '/api/inventory/products/', None),
+    ('GET', '/api/finance/current-caja/', None),
+    ('POST', '/api/inventory/sales/', {'items': [{'dish_id': int(dish_id), 'quantity': 1, 'unit_price': '10'}]}),
+]
+for label in ('first', 'second'):
+    started = time.perf_counter()
+    for method, path, payload in requests:
+        call(method, path, payload)
+    timings[label] = time.perf_counter() - started
+print(json.dumps(timings))
+'''
+
+BOOT = (
+    "import os; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_restaurant.settings'); "
+    "from django.core.wsgi import get_wsgi_application; get_wsgi_application()"
+)
+
+PROJECT = ('backend_restaurant', 'core', 'inventory', 'finance')
+
+
+class Command(BaseCommand):
+    help = ("Mide el arranque de un worker en un proceso nuevo: importar y configurar la app, "
+            "y los primeros requests de un POS con y sin precalentamiento (core.refdata.warm_up). "
+            "También lista los imports que más tardan (python -X importtime).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=3, help="Procesos por variante (se reporta la mediana)")
+        parser.add_argument('--top', type=int, default=10, help="Imports más lentos a listar")
+        parser.add_argument('--force', action='store_true', help="Permitir correr con DEBUG=False")
+
+    def handle(self, *args, **options):
+        require_scratch_database(options['force'])
+        fixture = bench_fixture()
+        args = [str(AccessToken.for_user(fixture['user'])), 'BENCH', str(fixture['dish'].id)]
+
+        for mode, label in (('cold', "sin precalentar"), ('warm', "con precalentamiento")):
+            runs = [self.probe(mode, args) for _ in range(options['runs'])]
+            median = {key: statistics.median(run[key] for run in runs) * 1000 for key in runs[0]}
+            warm = " + ".join(f"{key[5:]} {value:.0f}" for key, value in median.items() if key.startswith('warm_'))
+            self.stdout.write(
+                f"{label:<22} arranque {median['boot']:>7.0f} ms"
+                + (f"  precalentado {warm} ms" if warm else "")
+                + f"  primeros requests {median['first']:>7.1f} ms  siguientes {median['second']:>7.1f} ms"
+            )
+
+        self.stdout.write(f"\nImports más lentos al arrancar (acumulado):")
+        for name, cumulative in self.import_times()[:options['top']]:
+            self.stdout.write(f"  {cumulative / 1000:>8.1f} ms  {name}")
+
+    def probe(self, mode, args):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'backend_restaurant.settings'))
+        result = subprocess.run(
+            [sys.executable, '-c', PROBE, mode, *args],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise CommandError(f"El proceso de prueba falló:\n{result.stderr[-2000:]}{result.stdout[-500:]}")
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def import_times(self):
+        """ Imports de primer nivel y módulos del proyecto, por tiempo acumulado (µs) """
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', BOOT],
+            cwd=settings.BASE_DIR, capture_output=True, text=True
+        )
+        rows = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            module = name.strip()
+            top_level = not name[1:].startswith(' ')
+            if top_level or module.split('.')[0] in PROJECT:
+                rows[module] = max(rows.get(module, 0), int(cumulative))
+        return sorted(rows.items(), key=lambda row: -row[1])
@@ -0,0 +1,207 @@
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.utils import timezone
+
+from core.bench import (
+    InProcessClient, bench_fixture, check_invariants, format_row, open_registers,
+    require_scratch_database, summarize
+)
+from core.jobs import run_pending
+from core.models import Job, JobStatus
+
+
+class HTTPClient:
+    """ Contra un servidor ya levantado (runserver, gunicorn) que use la misma base de datos """
+
+    def __init__(self, base_url, user, terminal):
+        from rest_framework_simplejwt.tokens import AccessToken
+        self.base_url = base_url.rstrip('/')
+        self.headers = {
+            'Authorization': f"Bearer {AccessToken.for_user(user)}",
+            'Accept': 'application/json',
+            'Content-Type': 'application/json',
+            'X-Terminal': terminal,
+        }
+
+    def request(self, method, path, data=None):
+        body = json.dumps(data).encode() if data is not None and method != 'get' else None
+        req = urllib.request.Request(self.base_url + path, data=body, headers=self.headers, method=method.upper())
+        try:
+            with urllib.request.urlopen(req, timeout=60) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+class LockMonitor(threading.Thread):
+    """ En PostgreSQL muestrea cuántas sesiones esperan un bloqueo (pg_stat_activity) """
+
+    def __init__(self, interval=0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.samples = self.waiting_samples = self.max_waiting = 0
+
+    def run(self):
+        try:
+            with connection.cursor() as cursor:
+                while not self.stopped.is_set():
+                    cursor.execute(
+                        "SELECT count(*) FROM pg_stat_activity "
+                        "WHERE wait_event_type = 'Lock' AND datname = current_database()"
+                    )
+                    waiting = cursor.fetchone()[0]
+                    self.samples += 1
+                    self.waiting_samples += bool(waiting)
+                    self.max_waiting = max(self.max_waiting, waiting)
+                    self.stopped.wait(self.interval)
+        finally:
+            connection.close()
+
+
+class Command(BaseCommand):
+    help = ("Simula una hora pico: varios hilos mezclan ventas, producciones, compras, gastos y "
+            "consultas del dashboard. Reporta rendimiento, latencias, esperas por bloqueos y "
+            "reglas del negocio que se rompieron (lotes negativos, stock o caja descuadrados).")
+
+    DEFAULT_MIX = 'sale=60,production=10,purchase=10,expense=5,dashboard=15'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=7, help="Usuarios simultáneos (p. ej. 5 cajeros + 2 cocineros)")
+        parser.add_argument('--duration', type=float, default=20, help="Segundos de carga")
+        parser.add_argument('--mix', default=self.DEFAULT_MIX, help=f"Pesos por operación (por defecto {self.DEFAULT_MIX})")
+        parser.add_argument('--url', help="Servidor a probar (p. ej. http://127.0.0.1:8000). Sin --url se llama en proceso")
+        parser.add_argument('--seed', type=int, help="Semilla aleatoria para repetir la misma secuencia")
+        parser.add_argument('--force', action='store_true', help="Permitir correr con DEBUG=False")
+
+    def handle(self, *args, **options):
+        require_scratch_database(options['force'])
+        mix = self.parse_mix(options['mix'])
+        fixture = bench_fixture()
+        registers = open_registers(fixture['user'], options['threads'], 'LOAD')
+        if options['url']:
+            clients = [HTTPClient(options['url'], fixture['user'], terminal) for terminal in registers]
+        else:
+            clients = [InProcessClient(fixture['user'], terminal) for terminal in registers]
+        operations = self.operations(fixture)
+
+        rng = random.Random(options['seed'])
+        seeds = [rng.random() for _ in clients]
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+        lock_errors = [0]
+        messages = []
+        guard = threading.Lock()
+        deadline = time.perf_counter() + options['duration']
+
+        def user(n):
+            local = random.Random(seeds[n])
+            names, weights = zip(*mix.items())
+            register_id = list(registers.values())[n]
+            try:
+                while time.perf_counter() < deadline:
+                    name = local.choices(names, weights)[0]
+                    method, path, data = operations[name](register_id)
+                    start = time.perf_counter()
+                    try:
+                        code, body = clients[n].request(method, path, data)
+                        failure = None if code < 400 else f"{name} {code}: {body[:160]!r}"
+                    except Exception as e:
+                        failure = f"{name} {type(e).__name__}: {e}"
+                    elapsed = time.perf_counter() - start
+                    with guard:
+                        if failure is None:
+                            latencies[name].append(elapsed)
+                            continue
+                        errors[name] += 1
+                        if 'lock' in failure.lower():
+                            lock_errors[0] += 1
+                        if len(messages) < 8 and failure not in messages:
+                            messages.append(failure)
+            finally:
+                connections.close_all()
+
+        monitor = LockMonitor() if connection.vendor == 'postgresql' else None
+        if monitor:
+            monitor.start()
+        started = time.perf_counter()
+        threads = [threading.Thread(target=user, args=(n,)) for n in range(len(clients))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+        if monitor:
+            monitor.stopped.set()
+            monitor.join()
+
+        self.stdout.write(f"{len(clients)} usuarios durante {elapsed:.1f} s ({connection.vendor})")
+        every = []
+        for name in mix:
+            every.extend(latencies[name])
+            self.stdout.write(format_row(name, summarize(latencies[name], elapsed, errors[name])))
+        self.stdout.write(format_row("TOTAL", summarize(every, elapsed, sum(errors.values()))))
+        for message in messages:
+            self.stdout.write(self.style.WARNING(f"  {message}"))
+
+        if monitor:
+            share = monitor.waiting_samples * 100 / monitor.samples if monitor.samples else 0
+            self.stdout.write(
+                f"Esperas por bloqueo: en {share:.1f}% de {monitor.samples} muestras, "
+                f"máximo {monitor.max_waiting} sesiones a la vez"
+            )
+        self.stdout.write(f"Errores por bloqueo (timeouts/deadlocks): {lock_errors[0]}")
+
+        # El stock de cada producto se recalcula en la cola: se vacía antes de verificar
+        pending = Job.objects.filter(status=JobStatus.PENDING)
+        self.stdout.write(f"Trabajos en cola al terminar: {pending.count()}")
+        pending.update(run_after=timezone.now())
+        while run_pending():
+            pass
+
+        problems = check_invariants()
+        if not problems:
+            self.stdout.write(self.style.SUCCESS("Reglas del negocio: todas se cumplen."))
+        for rule, examples in problems:
+            self.stdout.write(self.style.ERROR(f"ROTO: {rule}: {examples}"))
+
+    def parse_mix(self, raw):
+        mix = {}
+        for part in raw.split(','):
+            name, _, weight = part.partition('=')
+            name = name.strip()
+            if name not in ('sale', 'production', 'purchase', 'expense', 'dashboard'):
+                raise CommandError(f"Operación desconocida en --mix: {name}")
+            try:
+                mix[name] = float(weight or 1)
+            except ValueError:
+                raise CommandError(f"Peso inválido en --mix: {part}")
+        return {name: weight for name, weight in mix.items() if weight > 0}
+
+    def operations(self, fixture):
+        dish, ingredient, unit = fixture['dish'].id, fixture['ingredient'].id, fixture['unit'].id
+        return {
+            'sale': lambda caja: ('post', '/api/inventory/sales/', {
+                'items': [{'dish_id': dish, 'quantity': 1, 'unit_price': '10'}],
+            }),
+            'production': lambda caja: ('post', '/api/inventory/production/', {
+                'dish_id': dish, 'quantity_produced': 5,
+                'ingredients_used': [{'ingredient_id': ingredient, 'quantity_used': '0.5'}],
+            }),
+            'purchase': lambda caja: ('post', '/api/inventory/purchases/', {
+                'cash_register': caja, 'description': 'Compra (carga)',
+                'items': [{'product_id': ingredient, 'unit_id': unit, 'quantity_bought': '5', 'total_cost': '20'}],
+            }),
+            'expense': lambda caja: ('post', '/api/finance/expenses/', {
+                'cash_register': caja, 'category': 'SERVICE', 'description': 'Gasto (carga)', 'amount': '5',
+            }),
+            'dashboard': lambda caja: ('get', '/api/finance/report/', None),
+        }
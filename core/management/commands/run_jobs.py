@@ -0,0 +1,33 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from core.jobs import reclaim_stale, run_pending
+from core.models import Job, JobStatus
+
+
+class Command(BaseCommand):
+    help = "Procesa la cola de trabajos en segundo plano (usar con JOBS_MODE=worker)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Procesa lo pendiente y termina")
+        parser.add_argument('--interval', type=float, default=2.0, help="Segundos entre revisiones de la cola")
+        parser.add_argument('--purge-days', type=int, default=7, help="Borra trabajos terminados más antiguos que esto")
+
+    def handle(self, *args, **options):
+        self.purge(options['purge_days'])
+        while True:
+            reclaim_stale()
+            processed = run_pending()
+            if processed:
+                self.stdout.write(f"{processed} trabajos procesados")
+            if options['once']:
+                break
+            if not processed:
+                time.sleep(options['interval'])
+
+    def purge(self, days):
+        limit = timezone.now() - timedelta(days=days)
+        purged, _ = Job.objects.filter(status=JobStatus.DONE, finished_at__lt=limit).delete()
+        if purged:
+            self.stdout.write(f"{purged} trabajos antiguos eliminados")
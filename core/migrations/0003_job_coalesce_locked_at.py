@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-19 17:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_cache_version'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='job',
+            name='job_pending_dedupe_uniq',
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='locked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(condition=models.Q(('status', 'PENDING'), models.Q(('dedupe_key', ''), _negated=True)), fields=['dedupe_key'], name='job_pending_dedupe_idx'),
+        ),
+    ]
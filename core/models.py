@@ -0,0 +1,48 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+# --- ENUMS ---
+class JobStatus(models.TextChoices):
+    PENDING = 'PENDING', _('Pendiente')
+    RUNNING = 'RUNNING', _('Ejecutando')
+    DONE = 'DONE', _('Terminado')
+    FAILED = 'FAILED', _('Fallido')
+
+# 1. COLA DE TRABAJOS EN SEGUNDO PLANO (tabla en la propia BD, sin broker externo)
+class Job(models.Model):
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=JobStatus.choices, default=JobStatus.PENDING)
+    # Trabajos pendientes con la misma clave corren una sola vez (ej. "stock:15"): ver core.jobs.claim
+    dedupe_key = models.CharField(max_length=150, blank=True, default='')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    # Cuándo lo tomó un proceso: si queda RUNNING demasiado tiempo, el proceso murió
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+            models.Index(
+                fields=['dedupe_key'], condition=Q(status='PENDING') & ~Q(dedupe_key=''),
+                name='job_pending_dedupe_idx'
+            ),
+        ]
+
+    def __str__(self): return f"{self.name} #{self.id} ({self.get_status_display()})"
+
+# 2. VERSIONES DE LOS DATOS DE REFERENCIA (ver core.refdata)
+class CacheVersion(models.Model):
+    """ Cada escritura a unidades, platos, recetas o grupos sube la versión de su conjunto:
+    los workers comparan contra ella para saber si su copia en memoria quedó vieja """
+    name = models.CharField(max_length=100, unique=True)
+    version = models.PositiveBigIntegerField(default=1)
+    changed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self): return f"{self.name} v{self.version}"
@@ -0,0 +1,116 @@
+""" Datos de referencia en memoria de cada proceso (unidades, platos, recetas, grupos).
+Cambian poco y se leen en casi todos los requests: se cargan una vez por worker
+(warm_up, desde el hook de gunicorn) y se recargan solo cuando sube su versión en la
+tabla CacheVersion. La versión se consulta como mucho cada REFDATA_CHECK_SECONDS. """
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+
+from .models import CacheVersion
+
+_registry = {}
+_cache = {}      # nombre -> (versión, datos)
+_versions = {}   # última lectura de CacheVersion; se reemplaza entera, nunca se modifica
+_checked_at = [0.0]
+_lock = threading.Lock()
+
+
+def reference(name, models=(), ignore_fields=()):
+    """ Registra un cargador: @reference('inventory.units', models=[UnitOfMeasure]).
+    Guardar o borrar cualquiera de 'models' invalida el conjunto en todos los procesos,
+    salvo los save(update_fields=...) que solo tocan 'ignore_fields'. """
+    def register(loader):
+        _registry[name] = loader
+
+        def changed(sender, update_fields=None, **kwargs):
+            if update_fields and set(update_fields) <= set(ignore_fields):
+                return
+            bump(name)
+
+        for model in models:
+            post_save.connect(changed, sender=model, weak=False, dispatch_uid=f"refdata:{name}:save:{model.__name__}")
+            post_delete.connect(changed, sender=model, weak=False, dispatch_uid=f"refdata:{name}:delete:{model.__name__}")
+        return loader
+    return register
+
+
+def bump(*names):
+    """ Marca los conjuntos como cambiados. Las escrituras masivas (bulk_create, update)
+    no disparan señales: quien las haga debe llamar a bump() """
+    # Al menos la hora en nanosegundos: si la transacción se revierte, el próximo bump no
+    # repite el número que algún proceso ya vio (y cacheó) dentro de esa transacción
+    stamp = time.time_ns()
+    for name in names:
+        if not CacheVersion.objects.filter(name=name).update(version=Greatest(F('version') + 1, Value(stamp))):
+            CacheVersion.objects.get_or_create(name=name, defaults={'version': stamp})
+    # En este proceso se nota al instante; en los demás, en la próxima revisión
+    transaction.on_commit(_expire)
+
+
+def _expire():
+    _checked_at[0] = 0.0
+
+
+def _current_versions():
+    global _versions
+    interval = getattr(settings, 'REFDATA_CHECK_SECONDS', 2)
+    now = time.monotonic()
+    if now - _checked_at[0] < interval:
+        return _versions
+    versions = dict(CacheVersion.objects.filter(name__in=_registry).values_list('name', 'version'))
+    if connection.in_atomic_block:
+        # Dentro de una transacción se ven versiones sin confirmar: no se comparten con los demás hilos
+        return versions
+    with _lock:
+        _versions = versions
+        _checked_at[0] = now
+    return versions
+
+
+def get(name):
+    """ Datos del conjunto 'name'. No modificar: se comparten entre hilos. Sirven para
+    validar y mostrar; lo que se escribe debe leerse de la base. """
+    version = _current_versions().get(name, 0)
+    cached = _cache.get(name)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    if connection.in_atomic_block:
+        # Lo leído en una transacción puede revertirse: se usa sin guardarlo en memoria
+        return _registry[name]()
+    with _lock:
+        cached = _cache.get(name)
+        if cached is None or cached[0] != version:
+            cached = _cache[name] = (version, _registry[name]())
+    return cached[1]
+
+
+def warm_up():
+    """ Deja listo un worker recién creado: conexión a la BD, URLs y vistas importadas y
+    datos de referencia en memoria. Devuelve los segundos de cada paso. """
+    from django.apps import apps
+    from django.contrib.contenttypes.models import ContentType
+    from django.urls import get_resolver
+
+    timings = {}
+    started = time.perf_counter()
+    connection.ensure_connection()
+    timings['db'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    get_resolver().url_patterns  # importa urls.py con todas las vistas y serializers
+    timings['urls'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    # Tipos de contenido (permisos, admin) de todos los modelos en una sola consulta
+    ContentType.objects.get_for_models(*apps.get_models())
+    _checked_at[0] = 0.0
+    for name in _registry:
+        get(name)
+    timings['refdata'] = time.perf_counter() - started
+    return timings
+
@@ -0,0 +1,219 @@
+import importlib
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from . import refdata
+from .bench import InProcessClient, bench_fixture, check_invariants, percentile, summarize
+from .jobs import claim, enqueue, job, reclaim_stale, run_pending
+from .management.commands.load_test import Command as LoadTestCommand
+from .models import CacheVersion, Job, JobStatus
+
+calls = []
+
+
+@job('tests.record')
+def record(value=None):
+    calls.append(value)
+
+
+@job('tests.fail')
+def fail():
+    raise RuntimeError("falla a propósito")
+
+
+@override_settings(JOBS_MODE='worker', JOBS_MAX_ATTEMPTS=3, JOBS_LOCK_TIMEOUT=60)
+class JobQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_unknown_job_is_rejected(self):
+        with self.assertRaises(ValueError):
+            enqueue('tests.nope')
+
+    def test_same_key_runs_once(self):
+        enqueue('tests.record', {'value': 1}, dedupe_key='k')
+        enqueue('tests.record', {'value': 1}, dedupe_key='k')
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(calls, [1])
+        self.assertFalse(Job.objects.filter(status=JobStatus.PENDING).exists())
+        self.assertEqual(Job.objects.filter(status=JobStatus.DONE).count(), 2)
+
+    def test_job_enqueued_after_claim_is_not_dropped(self):
+        # A ya fue tomado cuando B hace commit: B debe correr aparte (vería datos que A no vio)
+        enqueue('tests.record', {'value': 'a'}, dedupe_key='k')
+        first = list(claim())
+        enqueue('tests.record', {'value': 'b'}, dedupe_key='k')
+        self.assertEqual(len(first), 1)
+        self.assertEqual(Job.objects.filter(status=JobStatus.PENDING, dedupe_key='k').count(), 1)
+        run_pending()
+        self.assertEqual(calls, ['b'])
+
+    def test_different_keys_all_run(self):
+        enqueue('tests.record', {'value': 1}, dedupe_key='a')
+        enqueue('tests.record', {'value': 2}, dedupe_key='b')
+        enqueue('tests.record', {'value': 3})
+        self.assertEqual(run_pending(), 3)
+        self.assertEqual(sorted(calls), [1, 2, 3])
+
+    def test_failed_job_is_retried_later(self):
+        enqueue('tests.fail')
+        run_pending()
+        current = Job.objects.get()
+        self.assertEqual(current.status, JobStatus.PENDING)
+        self.assertEqual(current.attempts, 1)
+        self.assertGreater(current.run_after, timezone.now())
+        self.assertIn("falla a propósito", current.last_error)
+
+    def test_failed_job_gives_up_after_max_attempts(self):
+        enqueue('tests.fail')
+        for _ in range(3):
+            Job.objects.update(run_after=timezone.now())
+            run_pending()
+        self.assertEqual(Job.objects.get().status, JobStatus.FAILED)
+
+    def test_stale_running_job_is_reclaimed(self):
+        old = timezone.now() - timedelta(minutes=5)
+        stuck = Job.objects.create(name='tests.record', status=JobStatus.RUNNING, attempts=1, locked_at=old)
+        spent = Job.objects.create(name='tests.record', status=JobStatus.RUNNING, attempts=3, locked_at=old)
+        fresh = Job.objects.create(name='tests.record', status=JobStatus.RUNNING, attempts=1, locked_at=timezone.now())
+        self.assertEqual(reclaim_stale(), 2)
+        stuck.refresh_from_db(), spent.refresh_from_db(), fresh.refresh_from_db()
+        self.assertEqual(stuck.status, JobStatus.PENDING)
+        self.assertEqual(spent.status, JobStatus.FAILED)
+        self.assertEqual(fresh.status, JobStatus.RUNNING)
+
+
+@override_settings(JOBS_MODE='worker')
+class JobTransactionTests(TransactionTestCase):
+    def test_rolled_back_transaction_discards_its_job(self):
+        try:
+            with transaction.atomic():
+                enqueue('tests.record', {'value': 1})
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(Job.objects.exists())
+
+
+@override_settings(JOBS_MODE='thread')
+class JobPollerTests(TransactionTestCase):
+    def test_enqueue_does_not_start_the_poller(self):
+        calls.clear()
+        enqueue('tests.record', {'value': 1})
+        deadline = time.monotonic() + 5
+        while not calls and time.monotonic() < deadline:  # el trabajo corre en un hilo del executor
+            time.sleep(0.01)
+        self.assertEqual(calls, [1])
+        self.assertNotIn('jobs-poll', [thread.name for thread in threading.enumerate()])
+
+    def test_wsgi_entrypoint_starts_the_poller(self):
+        import backend_restaurant.wsgi
+        with mock.patch('core.jobs.start_poller') as start:
+            importlib.reload(backend_restaurant.wsgi)
+        start.assert_called_once_with()
+
+
+def job_names():
+    return sorted(Job.objects.values_list('name', flat=True))
+
+
+@override_settings(JOBS_MODE='worker', REFDATA_CHECK_SECONDS=0)
+class RefDataTests(TransactionTestCase):
+    """ Conjunto de prueba sin señales: se invalida con bump() a mano """
+
+    def setUp(self):
+        refdata.reference('tests.jobs')(job_names)
+
+    def tearDown(self):
+        refdata._registry.pop('tests.jobs', None)
+        refdata._cache.pop('tests.jobs', None)
+
+    def version(self):
+        return CacheVersion.objects.get(name='tests.jobs').version
+
+    def test_rolled_back_bump_never_repeats_a_version(self):
+        refdata.bump('tests.jobs')
+        try:
+            with transaction.atomic():
+                refdata.bump('tests.jobs')
+                seen = self.version()
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        refdata.bump('tests.jobs')
+        self.assertNotEqual(self.version(), seen)
+
+    def test_data_read_inside_a_transaction_is_not_shared(self):
+        refdata.bump('tests.jobs')
+        self.assertEqual(refdata.get('tests.jobs'), [])
+        try:
+            with transaction.atomic():
+                Job.objects.create(name='tests.record')
+                refdata.bump('tests.jobs')
+                self.assertEqual(refdata.get('tests.jobs'), ['tests.record'])
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        refdata.bump('tests.jobs')
+        self.assertEqual(refdata.get('tests.jobs'), [])
+
+    def test_versions_are_swapped_not_mutated(self):
+        refdata.bump('tests.jobs')
+        before = refdata._current_versions()
+        snapshot = dict(before)
+        refdata.bump('tests.jobs')
+        after = refdata._current_versions()
+        self.assertEqual(before, snapshot)
+        self.assertNotEqual(after['tests.jobs'], before['tests.jobs'])
+
+
+@override_settings(JOBS_MODE='worker')
+class LoadTestHarnessTests(TestCase):
+    def setUp(self):
+        self.command = LoadTestCommand()
+
+    def test_mix_keeps_positive_weights(self):
+        self.assertEqual(
+            self.command.parse_mix('sale=3, production=0,expense,dashboard=0.5'),
+            {'sale': 3.0, 'expense': 1.0, 'dashboard': 0.5}
+        )
+        for raw in ('sale=3,refund=1', 'sale=mucho'):
+            with self.assertRaises(CommandError):
+                self.command.parse_mix(raw)
+
+    def test_summary_in_milliseconds(self):
+        self.assertEqual(percentile([], 50), 0.0)
+        self.assertEqual(percentile([4, 1, 3, 2], 50), 2.5)
+        stats = summarize([0.001, 0.002, 0.003, 0.004], elapsed=2, errors=1)
+        self.assertEqual((stats['requests'], stats['errors'], stats['throughput']), (4, 1, 2.0))
+        self.assertAlmostEqual(stats['mean'], 2.5)
+        self.assertAlmostEqual(stats['p99'], 3.97)
+
+    def test_each_write_operation_is_accepted(self):
+        fixture = bench_fixture(stock=100)
+        client = InProcessClient(fixture['user'], 'BENCH')
+        operations = self.command.operations(fixture)
+        for name in ('sale', 'production', 'purchase', 'expense'):
+            status, body = client.request(*operations[name](fixture['register'].id))
+            self.assertLess(status, 400, f"{name}: {body[:200]!r}")
+        run_pending()
+        self.assertEqual(check_invariants(), [])
+
+    def test_invariants_flag_a_corrupted_sale(self):
+        from inventory.models import Sale
+
+        fixture = bench_fixture(stock=100)
+        Sale.record(fixture['register'], [{'dish': fixture['dish'], 'quantity': 1, 'unit_price': Decimal('10')}])
+        run_pending()
+        self.assertEqual(check_invariants(), [])
+        Sale.objects.update(total_amount=Decimal('99'))
+        rules = [rule for rule, _ in check_invariants()]
+        self.assertIn("total de la venta != suma de sus líneas", rules)
@@ -1,17 +1,38 @@
 from django.contrib import admin
-from .models import CashRegister, Transaction
+from .models import CashRegister, Transaction, TransactionArchive
 from django.utils.html import format_html
+from core.admin import PaginatedTabularInline
+
+# Libro de la caja, del más reciente al más antiguo, de a una página
+class TransactionInline(PaginatedTabularInline):
+    model = Transaction
+    fields = ('timestamp', 'type', 'category', 'amount', 'description')
+    readonly_fields = fields
+    ordering = ('-timestamp', '-id')
 
 @admin.register(CashRegister)
 class CashRegisterAdmin(admin.ModelAdmin):
-    list_display = ('date', 'start_amount', 'get_current_balance', 'is_closed', 'status_color')
-    list_filter = ('date', 'is_closed')
-    readonly_fields = ('end_amount_system', 'difference', 'closed_at')
-    
+    list_display = ('date', 'terminal', 'opened_by', 'start_amount', 'get_current_balance', 'is_closed', 'status_color')
+    list_filter = ('is_closed', 'terminal')
+    list_select_related = ('opened_by',)
+    autocomplete_fields = ('opened_by',)
+    date_hierarchy = 'date'
+    inlines = [TransactionInline]
+    search_fields = ('=id', 'date')  # Necesario para los autocompletes de Compras y Transacciones
+    readonly_fields = (
+        'end_amount_system', 'difference', 'closed_at',
+        'total_income', 'total_expense', 'sales_total', 'sales_count', 'transaction_count'
+    )
+
+    def get_queryset(self, request):
+        # El saldo viene anotado desde la BD (una consulta para toda la página)
+        return super().get_queryset(request).with_balance()
+
     # Campo calculado para ver saldo en tiempo real en la lista
     def get_current_balance(self, obj):
-        return f"{obj.calculate_balance()} Bs"
+        return f"{obj.balance} Bs"
     get_current_balance.short_description = "Saldo Actual (Sistema)"
+    get_current_balance.admin_order_field = 'balance'
 
     # Semáforo visual
     def status_color(self, obj):
@@ -23,12 +44,37 @@ class CashRegisterAdmin(admin.ModelAdmin):
 
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
-    list_display = ('timestamp', 'type_colored', 'category', 'amount', 'description', 'cash_register')
-    list_filter = ('type', 'category', 'cash_register__date')
-    search_fields = ('description',)
+    list_display = ('timestamp', 'type_colored', 'category', 'amount', 'description', 'caja')
+    readonly_fields = ('entry_count', 'is_summary')
+    list_filter = ('type', 'category', 'cash_register__is_closed', 'is_summary')
+    date_hierarchy = 'timestamp'
+    # Búsqueda por prefijo (LIKE 'texto%') o por número exacto de caja, nunca '%texto%'
+    search_fields = ('^description', '=cash_register__id')
+    list_select_related = ('cash_register',)
+    autocomplete_fields = ('cash_register',)
+    show_full_result_count = False
     
     # Colorear Ingresos y Egresos
     def type_colored(self, obj):
         color = 'green' if obj.type == 'IN' else 'red'
         return format_html('<span style="color: {}; font-weight: bold;">{}</span>', color, obj.get_type_display())
-    type_colored.short_description = "Tipo"
\ No newline at end of file
+    type_colored.short_description = "Tipo"
+
+    # Etiqueta liviana de la caja (el __str__ de una caja abierta suma su libro)
+    def caja(self, obj):
+        return f"Caja #{obj.cash_register_id} ({obj.cash_register.date})"
+    caja.short_description = "Caja"
+    caja.admin_order_field = 'cash_register__date'
+
+
+@admin.register(TransactionArchive)
+class TransactionArchiveAdmin(admin.ModelAdmin):
+    list_display = ('timestamp', 'type', 'category', 'amount', 'description', 'cash_register_id')
+    list_filter = ('type', 'category')
+    date_hierarchy = 'timestamp'
+    search_fields = ('^description', '=cash_register__id')
+    show_full_result_count = False
+
+    def has_add_permission(self, request): return False
+    def has_change_permission(self, request, obj=None): return False
+    def has_delete_permission(self, request, obj=None): return False
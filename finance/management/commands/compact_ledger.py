@@ -0,0 +1,38 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from finance.models import CashRegister
+
+
+class Command(BaseCommand):
+    help = ("Cierre de periodo: archiva el libro detallado de las cajas cerradas más antiguas que la "
+            "retención y deja una fila de resumen por tipo y categoría. Saldos y reportes no cambian.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.LEDGER_RETENTION_DAYS,
+            help="Compactar cajas cerradas hace más de N días (por defecto LEDGER_RETENTION_DAYS)"
+        )
+        parser.add_argument('--dry-run', action='store_true', help="Solo mostrar qué cajas se compactarían")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        # Las cajas cerradas antes de que existiera closed_at lo tienen vacío: cuenta su fecha de apertura
+        vencidas = Q(closed_at__lt=cutoff) | Q(closed_at__isnull=True, date__lt=cutoff.date())
+        cajas = CashRegister.objects.filter(
+            vencidas, is_closed=True, transactions__is_summary=False
+        ).distinct().order_by('date', 'id')
+
+        if options['dry_run']:
+            ids = list(cajas.values_list('id', flat=True))
+            self.stdout.write(f"{len(ids)} cajas por compactar: {ids[:20]}{' ...' if len(ids) > 20 else ''}")
+            return
+
+        total = count = 0
+        for caja in cajas.iterator():
+            # Una transacción por caja: si algo falla, esa caja queda intacta
+            total += caja.compact()
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"{count} cajas compactadas, {total} movimientos archivados."))
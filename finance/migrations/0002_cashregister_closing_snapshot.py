@@ -0,0 +1,83 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:23
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_closing_snapshots(apps, schema_editor):
+    """ Congela la foto de las cajas que ya estaban cerradas antes de esta migración """
+    CashRegister = apps.get_model('finance', 'CashRegister')
+    Transaction = apps.get_model('finance', 'Transaction')
+    Sale = apps.get_model('inventory', 'Sale')
+
+    for caja in CashRegister.objects.filter(is_closed=True, closing_summary__isnull=True):
+        rows = (
+            Transaction.objects.filter(cash_register=caja)
+            .values('type', 'category')
+            .annotate(total=Sum('amount'), count=Count('id'))
+            .order_by('type', 'category')
+        )
+        by_category = []
+        income = expense = sales = 0
+        count = 0
+        for row in rows:
+            if row['type'] == 'IN':
+                income += row['total']
+                if row['category'] == 'SALES':
+                    sales += row['total']
+            else:
+                expense += row['total']
+            count += row['count']
+            by_category.append({
+                'type': row['type'], 'category': row['category'],
+                'total': f"{row['total']:.2f}", 'count': row['count'],
+            })
+        caja.total_income = income
+        caja.total_expense = expense
+        caja.sales_total = sales
+        caja.transaction_count = count
+        caja.sales_count = Sale.objects.filter(cash_register=caja).count()
+        caja.closing_summary = {'by_category': by_category}
+        caja.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0001_initial'),
+        ('inventory', '0002_alter_batch_options_alter_product_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cashregister',
+            name='closing_summary',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='cashregister',
+            name='sales_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='cashregister',
+            name='sales_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='cashregister',
+            name='total_expense',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='cashregister',
+            name='total_income',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='cashregister',
+            name='transaction_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_closing_snapshots, migrations.RunPython.noop),
+    ]
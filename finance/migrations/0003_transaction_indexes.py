@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0002_cashregister_closing_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['cash_register', 'type'], name='transaction_register_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['-timestamp'], name='transaction_timestamp_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0003_transaction_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cashregister',
+            name='opened_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cash_registers', to=settings.AUTH_USER_MODEL, verbose_name='Abierta por'),
+        ),
+        migrations.AddField(
+            model_name='cashregister',
+            name='terminal',
+            field=models.CharField(blank=True, default='', max_length=50, verbose_name='Terminal'),
+        ),
+        migrations.AddConstraint(
+            model_name='cashregister',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_closed', False), models.Q(('terminal', ''), _negated=True)), fields=('terminal',), name='cashregister_open_terminal_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='cashregister',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_closed', False), ('terminal', '')), fields=('opened_by',), name='cashregister_open_user_uniq'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0004_cashregister_terminal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='entry_count',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='is_summary',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.CreateModel(
+            name='TransactionArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.PositiveBigIntegerField(unique=True)),
+                ('type', models.CharField(choices=[('IN', 'Ingreso 🟢'), ('OUT', 'Egreso 🔴')], max_length=3)),
+                ('category', models.CharField(choices=[('SALES', 'Venta de Comida'), ('PURCHASE', 'Compra de Insumos'), ('SERVICE', 'Pago de Servicios (Luz/Agua)'), ('SALARY', 'Sueldos'), ('OTHER', 'Otros Movimientos')], max_length=20)),
+                ('description', models.CharField(max_length=255)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('timestamp', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('cash_register', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_transactions', to='finance.cashregister')),
+            ],
+            options={
+                'verbose_name': 'Movimiento Archivado',
+                'verbose_name_plural': 'Movimientos Archivados',
+                'indexes': [models.Index(fields=['cash_register', 'type'], name='txarchive_register_type_idx')],
+            },
+        ),
+    ]
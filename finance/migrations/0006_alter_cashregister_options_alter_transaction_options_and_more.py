@@ -0,0 +1,82 @@
+# Generated by Django 5.2.8 on 2026-10-19 17:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0005_transaction_archive'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='cashregister',
+            options={'ordering': ['-date'], 'verbose_name': 'Caja Diaria'},
+        ),
+        migrations.AlterModelOptions(
+            name='transaction',
+            options={},
+        ),
+        migrations.AlterField(
+            model_name='cashregister',
+            name='closed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='cashregister',
+            name='difference',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AlterField(
+            model_name='cashregister',
+            name='end_amount_real',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AlterField(
+            model_name='cashregister',
+            name='end_amount_system',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.AlterField(
+            model_name='cashregister',
+            name='is_closed',
+            field=models.BooleanField(default=False, verbose_name='Cerrada'),
+        ),
+        migrations.AlterField(
+            model_name='cashregister',
+            name='start_amount',
+            field=models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Monto Inicial'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='amount',
+            field=models.DecimalField(decimal_places=2, max_digits=10),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='cash_register',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='transactions', to='finance.cashregister'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='category',
+            field=models.CharField(choices=[('SALES', 'Venta de Comida'), ('PURCHASE', 'Compra de Insumos'), ('SERVICE', 'Pago de Servicios (Luz/Agua)'), ('SALARY', 'Sueldos'), ('OTHER', 'Otros Movimientos')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='description',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='timestamp',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='type',
+            field=models.CharField(choices=[('IN', 'Ingreso 🟢'), ('OUT', 'Egreso 🔴')], max_length=3),
+        ),
+    ]
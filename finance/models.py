@@ -1,7 +1,11 @@
+from django.conf import settings
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
-from django.db.models import Sum
+from django.db import transaction
+from django.db.models import Sum, Max, Case, When, F, OuterRef, Subquery, Value, DecimalField
+from django.db.models.functions import Coalesce
+from decimal import Decimal
 
 # --- ENUMS ---
 class TransactionType(models.TextChoices):
@@ -16,6 +20,47 @@ class CategoryType(models.TextChoices):
     OTHER = 'OTHER', _('Otros Movimientos')
 
 # --- 1. DAILY CASH REGISTER ---
+class CashRegisterQuerySet(models.QuerySet):
+    def with_balance(self):
+        """ Anota 'balance' en la misma consulta: foto del cierre o libro vivo """
+        dinero = DecimalField(max_digits=12, decimal_places=2)
+        libro = Transaction.objects.filter(cash_register=OuterRef('pk')).order_by().values('cash_register')
+        ingresos = libro.filter(type=TransactionType.INCOME).annotate(total=Sum('amount')).values('total')
+        egresos = libro.filter(type=TransactionType.EXPENSE).annotate(total=Sum('amount')).values('total')
+        return self.annotate(balance=Case(
+            When(is_closed=True, then=F('end_amount_system')),
+            default=(
+                F('start_amount')
+                + Coalesce(Subquery(ingresos), Value(Decimal('0')), output_field=dinero)
+                - Coalesce(Subquery(egresos), Value(Decimal('0')), output_field=dinero)
+            ),
+            output_field=dinero,
+        ))
+
+    def open_for(self, user, terminal=''):
+        """ Caja abierta de la terminal indicada o, si no hay terminal, la del usuario """
+        abiertas = self.filter(is_closed=False)
+        if terminal:
+            return abiertas.filter(terminal=terminal).first()
+        caja = None
+        if user is not None and user.is_authenticated:
+            caja = abiertas.filter(opened_by=user, terminal='').first()
+        if caja is None:
+            # Compatibilidad: caja abierta sin dueño ni terminal (anterior a las terminales)
+            caja = abiertas.filter(opened_by__isnull=True, terminal='').order_by('id').last()
+        return caja
+
+    def for_request(self, request):
+        """ La terminal llega en la cabecera 'X-Terminal' """
+        return self.open_for(request.user, request.headers.get('X-Terminal', '').strip())
+
+class InsufficientFunds(ValueError):
+    """ La caja no alcanza para cubrir los egresos (ver CashRegister.add_expenses) """
+    def __init__(self, balance, required):
+        self.balance = balance
+        self.required = required
+        super().__init__(f"¡Fondos Insuficientes! La caja tiene {balance} Bs, intentas gastar {required} Bs.")
+
 class CashRegister(models.Model):
     date = models.DateField(default=timezone.now, verbose_name=_("Fecha de Apertura"))
     
@@ -28,29 +73,182 @@ class CashRegister(models.Model):
     is_closed = models.BooleanField(default=False, verbose_name=_("Cerrada"))
     closed_at = models.DateTimeField(null=True, blank=True)
 
+    # Cada terminal (o cada cajero sin terminal) trabaja con su propia caja
+    terminal = models.CharField(max_length=50, blank=True, default='', verbose_name=_("Terminal"))
+    opened_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='cash_registers', verbose_name=_("Abierta por")
+    )
+
+    # FOTO DEL CIERRE: se escribe una sola vez en close_register y no se vuelve a tocar
+    total_income = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    total_expense = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    sales_total = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    sales_count = models.PositiveIntegerField(default=0, editable=False)
+    transaction_count = models.PositiveIntegerField(default=0, editable=False)
+    closing_summary = models.JSONField(null=True, blank=True, editable=False)
+
+    objects = CashRegisterQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("Caja Diaria")
         ordering = ['-date']
+        constraints = [
+            # Una sola caja abierta por terminal, y una por cajero cuando no usa terminal
+            models.UniqueConstraint(
+                fields=['terminal'], condition=models.Q(is_closed=False) & ~models.Q(terminal=''),
+                name='cashregister_open_terminal_uniq'
+            ),
+            models.UniqueConstraint(
+                fields=['opened_by'], condition=models.Q(is_closed=False, terminal=''),
+                name='cashregister_open_user_uniq'
+            ),
+        ]
 
     def calculate_balance(self):
         """ Calcula el saldo en vivo: Inicial + Ingresos - Egresos """
+        if self.is_closed:
+            # Caja cerrada: el libro ya no cambia, usamos la foto del cierre
+            return self.end_amount_system
         incomes = self.transactions.filter(type=TransactionType.INCOME).aggregate(total=Sum('amount'))['total'] or 0
         expenses = self.transactions.filter(type=TransactionType.EXPENSE).aggregate(total=Sum('amount'))['total'] or 0
         return self.start_amount + incomes - expenses
 
+    def build_snapshot(self):
+        """ Totales del libro por tipo y categoría (una sola consulta agrupada) """
+        rows = []
+        if self.pk:
+            rows = (
+                self.transactions
+                .values('type', 'category')
+                .annotate(total=Sum('amount'), count=Sum('entry_count'))
+                .order_by('type', 'category')
+            )
+        snapshot = {
+            'total_income': 0, 'total_expense': 0, 'sales_total': 0,
+            'transaction_count': 0, 'by_category': [],
+        }
+        for row in rows:
+            if row['type'] == TransactionType.INCOME:
+                snapshot['total_income'] += row['total']
+            else:
+                snapshot['total_expense'] += row['total']
+            if row['type'] == TransactionType.INCOME and row['category'] == CategoryType.SALES:
+                snapshot['sales_total'] += row['total']
+            snapshot['transaction_count'] += row['count']
+            snapshot['by_category'].append({
+                'type': row['type'], 'category': row['category'],
+                'total': f"{row['total']:.2f}", 'count': row['count'],
+            })
+        return snapshot
+
+    def freeze(self):
+        """ Escribe la foto del cierre: totales, conteos y diferencia de efectivo """
+        snapshot = self.build_snapshot()
+        self.total_income = snapshot['total_income']
+        self.total_expense = snapshot['total_expense']
+        self.sales_total = snapshot['sales_total']
+        self.transaction_count = snapshot['transaction_count']
+        self.sales_count = self.sale_set.count() if self.pk else 0
+        self.closing_summary = {'by_category': snapshot['by_category']}
+        self.end_amount_system = self.start_amount + self.total_income - self.total_expense
+        if not self.closed_at:
+            self.closed_at = timezone.now()
+
     # --- ESTE FUE EL MÉTODO QUE FALTABA 👇 ---
     def close_register(self, real_amount):
         """ Lógica de Cierre de Caja """
-        self.end_amount_system = self.calculate_balance()
-        self.end_amount_real = real_amount
-        self.difference = self.end_amount_real - self.end_amount_system
-        self.is_closed = True
-        self.closed_at = timezone.now()
-        self.save()
+        with transaction.atomic():
+            # Bloqueamos la fila para que nadie cierre dos veces la misma caja
+            locked = CashRegister.objects.select_for_update().get(pk=self.pk)
+            if locked.is_closed:
+                raise ValueError("Esta caja ya está cerrada.")
+            self.end_amount_real = real_amount
+            self.is_closed = True
+            self.save()
+
+    def add_expenses(self, lines):
+        """ Registra varios egresos manuales de una sola vez (sueldos, servicios del mes).
+        Con la caja bloqueada: se verifica que siga abierta y que el saldo alcance para
+        todos, y se insertan juntos. Devuelve (movimientos, saldo nuevo). """
+        with transaction.atomic():
+            locked = CashRegister.objects.select_for_update().get(pk=self.pk)
+            if locked.is_closed:
+                raise ValueError("No se pueden mover fondos de una caja cerrada.")
+            saldo = locked.calculate_balance()
+            total = sum(line['amount'] for line in lines)
+            if saldo < total:
+                raise InsufficientFunds(saldo, total)
+            # bulk_create no pasa por Transaction.save: la caja ya se revisó arriba
+            created = Transaction.objects.bulk_create([
+                Transaction(
+                    cash_register=locked, type=TransactionType.EXPENSE, category=line['category'],
+                    description=line['description'], amount=line['amount']
+                )
+                for line in lines
+            ])
+            return created, saldo - total
+
+    def compact(self):
+        """ Pasa el libro detallado de una caja cerrada al archivo y deja una fila de resumen
+        por tipo y categoría. Devuelve cuántos movimientos archivó. """
+        with transaction.atomic():
+            locked = CashRegister.objects.select_for_update().get(pk=self.pk)
+            if not locked.is_closed:
+                raise ValueError("Solo se pueden compactar cajas cerradas.")
+            before = locked.build_snapshot()
+
+            detalle = locked.transactions.filter(is_summary=False)
+            archived = TransactionArchive.objects.bulk_create([
+                TransactionArchive(
+                    original_id=t.id, cash_register_id=t.cash_register_id, type=t.type,
+                    category=t.category, description=t.description, amount=t.amount,
+                    timestamp=t.timestamp
+                )
+                for t in detalle.order_by('id').iterator()
+            ], batch_size=500)
+            if not archived:
+                return 0
+
+            # Se agrupan también los resúmenes previos para no acumular filas
+            groups = list(
+                locked.transactions
+                .values('type', 'category')
+                .annotate(total=Sum('amount'), count=Sum('entry_count'), last=Max('timestamp'))
+                .order_by('type', 'category')
+            )
+            locked.transactions.all().delete()
+            summaries = Transaction.objects.bulk_create([
+                Transaction(
+                    cash_register=locked, type=row['type'], category=row['category'],
+                    description=f"Resumen caja #{locked.pk}: {row['count']} movimientos",
+                    amount=row['total'], entry_count=row['count'], is_summary=True
+                )
+                for row in groups
+            ])
+            # auto_now_add pisa la fecha en bulk_create: conservamos la del último movimiento
+            for summary, row in zip(summaries, groups):
+                Transaction.objects.filter(pk=summary.pk).update(timestamp=row['last'])
+
+            if locked.build_snapshot() != before:
+                raise ValueError(f"La compactación de la caja #{locked.pk} alteraría sus totales.")
+            return len(archived)
+
+    def save(self, *args, **kwargs):
+        # Cierre por API o por el admin: la foto se congela una sola vez
+        if self.is_closed and self.closing_summary is None:
+            self.freeze()
+        elif not self.is_closed:
+            self.closing_summary = None
+        if self.is_closed and self.end_amount_real is not None:
+            self.difference = self.end_amount_real - self.end_amount_system
+        super().save(*args, **kwargs)
 
     def __str__(self):
-        # Muestra el saldo calculado para que sea útil en los dropdowns
-        return f"Caja {self.date} | Disp: {self.calculate_balance()} Bs"
+        # Muestra el saldo calculado para que sea útil en los dropdowns.
+        # Con with_balance() ya viene anotado (lista del admin): sin consultas por fila
+        balance = self.balance if hasattr(self, 'balance') else self.calculate_balance()
+        return f"Caja {self.date} | Disp: {balance} Bs"
 
 
 # --- 2. TRANSACTIONS ---
@@ -61,11 +259,46 @@ class Transaction(models.Model):
     description = models.CharField(max_length=255)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     timestamp = models.DateTimeField(auto_now_add=True)
+    # Las cajas compactadas dejan una fila de resumen que vale por 'entry_count' movimientos
+    entry_count = models.PositiveIntegerField(default=1, editable=False)
+    is_summary = models.BooleanField(default=False, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['cash_register', 'type'], name='transaction_register_type_idx'),
+            models.Index(fields=['-timestamp'], name='transaction_timestamp_idx'),
+        ]
 
     def save(self, *args, **kwargs):
-        if self.cash_register.is_closed:
-            raise ValueError("No se pueden mover fondos de una caja cerrada.")
-        super().save(*args, **kwargs)
+        # Con la caja bloqueada: un cierre en curso espera a este movimiento (entra en su foto)
+        # o termina antes y el movimiento se rechaza, nunca queda fuera de la foto congelada
+        with transaction.atomic():
+            locked = CashRegister.objects.select_for_update().only('is_closed').get(pk=self.cash_register_id)
+            if locked.is_closed:
+                raise ValueError("No se pueden mover fondos de una caja cerrada.")
+            super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.get_type_display()}: {self.amount} Bs"
+
+# --- 3. ARCHIVO DEL LIBRO ---
+class TransactionArchive(models.Model):
+    """ Movimientos detallados de cajas cerradas ya compactadas (ver CashRegister.compact) """
+    original_id = models.PositiveBigIntegerField(unique=True)
+    cash_register = models.ForeignKey(CashRegister, on_delete=models.PROTECT, related_name='archived_transactions')
+    type = models.CharField(max_length=3, choices=TransactionType.choices)
+    category = models.CharField(max_length=20, choices=CategoryType.choices)
+    description = models.CharField(max_length=255)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    timestamp = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("Movimiento Archivado")
+        verbose_name_plural = _("Movimientos Archivados")
+        indexes = [
+            models.Index(fields=['cash_register', 'type'], name='txarchive_register_type_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.get_type_display()}: {self.amount} Bs"
\ No newline at end of file
+        return f"{self.get_type_display()}: {self.amount} Bs (archivado)"
@@ -0,0 +1,9 @@
+""" Grupos de usuarios (roles) en memoria de cada worker (core.refdata) """
+from django.contrib.auth.models import Group
+from core.refdata import reference
+
+
+@reference('auth.groups', models=[Group])
+def groups():
+    """ {nombre: id} """
+    return dict(Group.objects.values_list('name', 'id'))
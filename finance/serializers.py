@@ -1,34 +1,51 @@
+from decimal import Decimal
 from rest_framework import serializers
 from .models import CashRegister, Transaction, TransactionType, CategoryType
 from django.contrib.auth.models import User, Group
+from backend_restaurant.fieldsets import SparseFieldsMixin
 
 # 1. CAJA (Corregido para mostrar cierre real)
-class CashRegisterSerializer(serializers.ModelSerializer):
+class CashRegisterSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     current_balance = serializers.SerializerMethodField()
+    opened_by = serializers.SlugRelatedField(slug_field='username', read_only=True)
 
     class Meta:
         model = CashRegister
         # AQUÍ FALTABAN 'end_amount_real' y 'difference' 👇
         fields = [
             'id', 'date', 'start_amount', 'end_amount_system', 
-            'end_amount_real', 'difference', 'is_closed', 'current_balance'
+            'end_amount_real', 'difference', 'is_closed', 'current_balance',
+            'terminal', 'opened_by',
+            # Foto del cierre (solo lectura)
+            'closed_at', 'total_income', 'total_expense', 'sales_total',
+            'sales_count', 'transaction_count', 'closing_summary'
         ]
+        read_only_fields = ['closed_at']
 
     def get_current_balance(self, obj):
         return obj.calculate_balance()
 
+# Versión corta para ?expand=cash_register (sin saldo: calcularlo es una consulta por caja)
+class CashRegisterBriefSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CashRegister
+        fields = ['id', 'date', 'terminal', 'is_closed']
+
 # 2. TRANSACCIONES 
-class TransactionSerializer(serializers.ModelSerializer):
+class TransactionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {'cash_register': (CashRegisterBriefSerializer, {})}
+
     class Meta:
         model = Transaction
         fields = '__all__'
 
 # SERIALIZER PARA GASTOS MANUALES (Luz, Agua, Sueldos)
-class ExpenseSerializer(serializers.ModelSerializer):
+class ExpenseSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     # Solo permitimos elegir cajas abiertas
     cash_register = serializers.PrimaryKeyRelatedField(
         queryset=CashRegister.objects.filter(is_closed=False)
     )
+    expandable_fields = {'cash_register': (CashRegisterBriefSerializer, {})}
 
     class Meta:
         model = Transaction
@@ -42,9 +59,33 @@ class ExpenseSerializer(serializers.ModelSerializer):
         return value
 
     def create(self, validated_data):
-        # Forzamos que sea un EGRESO
-        validated_data['type'] = TransactionType.EXPENSE
-        return super().create(validated_data)
+        # Siempre un EGRESO, y solo si la caja tiene fondos (como las compras)
+        cash_register = validated_data.pop('cash_register')
+        try:
+            created, _ = cash_register.add_expenses([validated_data])
+        except ValueError as e:
+            raise serializers.ValidationError({"detail": str(e)})
+        return created[0]
+
+# GASTOS EN LOTE (planilla de sueldos, servicios del mes)
+class ExpenseLineSerializer(serializers.Serializer):
+    category = serializers.ChoiceField(choices=CategoryType.choices)
+    description = serializers.CharField(max_length=255)
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+
+    def validate_category(self, value):
+        if value in [CategoryType.SALES, CategoryType.PURCHASE]:
+            raise serializers.ValidationError("Error: Las Ventas y Compras de Insumos deben hacerse desde sus propios módulos.")
+        return value
+
+class ExpenseBulkSerializer(serializers.Serializer):
+    cash_register = serializers.PrimaryKeyRelatedField(
+        queryset=CashRegister.objects.filter(is_closed=False)
+    )
+    items = ExpenseLineSerializer(many=True, allow_empty=False)
+
+    def create(self, validated_data):
+        return validated_data['cash_register'].add_expenses(validated_data['items'])
 
 class UserSerializer(serializers.ModelSerializer):
     role = serializers.CharField(write_only=True) # Recibimos 'CASHIER' o 'COOK'
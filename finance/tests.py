@@ -1,3 +1,326 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import CashRegister, CategoryType, InsufficientFunds, Transaction, TransactionArchive, TransactionType
+
+
+class CashRegisterListTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def open_registers(self, count):
+        for n in range(count):
+            CashRegister.objects.create(
+                start_amount=Decimal('100'), opened_by=self.user, terminal=f"T{CashRegister.objects.count()}"
+            )
+
+    def queries_for(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [q['sql'] for q in queries.captured_queries]
+
+    def test_list_reads_opened_by_without_a_query_per_register(self):
+        self.open_registers(6)
+        queries = self.queries_for('/api/finance/cajas/')
+        # El username viene en el JOIN de la lista, no en una consulta a auth_user por caja
+        self.assertFalse([sql for sql in queries if sql.startswith('SELECT') and 'FROM "auth_user"' in sql])
+
+    def test_sparse_fields_keep_the_opened_by_join(self):
+        self.open_registers(6)
+        for url in ('/api/finance/cajas/?fields=id,opened_by', '/api/finance/cajas/?omit=current_balance'):
+            queries = self.queries_for(url)
+            self.assertEqual(len(queries), 1, url)
+        rows = self.client.get('/api/finance/cajas/?fields=id,opened_by').json()
+        self.assertEqual({row['opened_by'] for row in rows}, {'admin'})
+
+    def test_unknown_sparse_field_is_rejected(self):
+        response = self.client.get('/api/finance/cajas/?fields=id,bogus')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('bogus', str(response.json()))
+
+
+class CompactLedgerTests(TestCase):
+    def closed_register(self, terminal, days_ago):
+        caja = CashRegister.objects.create(start_amount=Decimal('100'), terminal=terminal)
+        for amount in ('10', '20', '30'):
+            Transaction.objects.create(
+                cash_register=caja, type=TransactionType.INCOME, category=CategoryType.SALES,
+                description="Venta", amount=Decimal(amount)
+            )
+        Transaction.objects.create(
+            cash_register=caja, type=TransactionType.EXPENSE, category=CategoryType.OTHER,
+            description="Gas", amount=Decimal('5')
+        )
+        caja.close_register(Decimal('155'))
+        old = timezone.now() - timedelta(days=days_ago)
+        CashRegister.objects.filter(pk=caja.pk).update(date=old.date(), closed_at=old)
+        caja.refresh_from_db()
+        return caja
+
+    def compact(self, days=90):
+        call_command('compact_ledger', days=days, stdout=StringIO())
+
+    def test_old_register_keeps_its_totals_after_compaction(self):
+        caja = self.closed_register('A', 120)
+        balance, snapshot = caja.calculate_balance(), caja.build_snapshot()
+        self.compact()
+        self.assertEqual(TransactionArchive.objects.filter(cash_register=caja).count(), 4)
+        self.assertEqual(caja.transactions.count(), 2)
+        self.assertTrue(all(caja.transactions.values_list('is_summary', flat=True)))
+        self.assertEqual(caja.calculate_balance(), balance)
+        self.assertEqual(caja.build_snapshot(), snapshot)
+
+    def test_recent_register_is_left_alone(self):
+        caja = self.closed_register('A', 10)
+        self.compact()
+        self.assertEqual(caja.transactions.filter(is_summary=False).count(), 4)
+
+    def test_register_closed_without_closed_at_is_compacted_by_its_date(self):
+        legacy = self.closed_register('A', 120)
+        recent = self.closed_register('B', 10)
+        CashRegister.objects.update(closed_at=None)
+        self.compact()
+        self.assertFalse(legacy.transactions.filter(is_summary=False).exists())
+        self.assertEqual(recent.transactions.filter(is_summary=False).count(), 4)
+
+    def test_compacting_twice_archives_nothing_new(self):
+        caja = self.closed_register('A', 120)
+        self.compact()
+        self.compact()
+        self.assertEqual(TransactionArchive.objects.count(), 4)
+        self.assertEqual(caja.transactions.count(), 2)
+
+
+class ClosedRegisterTests(TestCase):
+    def setUp(self):
+        self.caja = CashRegister.objects.create(start_amount=Decimal('100'), terminal='A')
+
+    def test_stale_open_register_cannot_take_a_movement_after_closing(self):
+        # Otra petición cerró la caja después de que esta la leyera abierta
+        CashRegister.objects.get(pk=self.caja.pk).close_register(Decimal('100'))
+        self.assertFalse(self.caja.is_closed)
+        with self.assertRaises(ValueError):
+            Transaction.objects.create(
+                cash_register=self.caja, type=TransactionType.INCOME, category=CategoryType.OTHER,
+                description="Tarde", amount=Decimal('5')
+            )
+        self.caja.refresh_from_db()
+        self.assertEqual(self.caja.transactions.count(), 0)
+        self.assertEqual(self.caja.build_snapshot()['total_income'], self.caja.total_income)
+
+
+@override_settings(JOBS_MODE='worker')
+class MarginReportTests(TransactionTestCase):
+    # El reporte lee por la réplica (espejo del primario): los datos deben estar confirmados
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        from inventory.models import MovementType, Product
+
+        user = User.objects.create_superuser('admin', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        self.caja = CashRegister.objects.create(start_amount=Decimal('100'), opened_by=user)
+        self.dish = Product.objects.create(name='Sopa', is_dish=True, sales_price=10)
+        # Dos lotes con distinto costo: la venta consume primero el más antiguo (PEPS)
+        self.dish.receive(Decimal(2), Decimal('3'), MovementType.PRODUCTION_IN)
+        self.dish.receive(Decimal(5), Decimal('4'), MovementType.PRODUCTION_IN)
+
+    def sell(self, quantity):
+        from inventory.models import Sale
+
+        return Sale.record(self.caja, [{'dish': self.dish, 'quantity': quantity, 'unit_price': Decimal('10')}])
+
+    def test_sale_cost_follows_fifo_batches(self):
+        line = self.sell(3).items.get()
+        self.assertEqual(line.cost_total, Decimal('10.00'))  # 2 x 3 + 1 x 4
+
+    def test_margin_leaves_out_lines_with_unknown_cost(self):
+        self.sell(3)
+        legacy = self.sell(1).items.get()
+        type(legacy).objects.filter(pk=legacy.pk).update(cost_total=None)  # venta anterior al kardex
+        body = self.client.get('/api/finance/margin/?group_by=dish').json()
+        row, summary = body['rows'][0], body['summary']
+        self.assertEqual((Decimal(row['revenue']), Decimal(row['cost'])), (30, 10))
+        self.assertEqual((Decimal(summary['margin']), Decimal(summary['margin_pct'])), (20, Decimal('66.67')))
+        self.assertEqual(summary['without_cost']['lines'], 1)
+        self.assertEqual(Decimal(summary['without_cost']['revenue']), 10)
+
+    def test_migration_marks_lines_without_sale_movements_as_unknown(self):
+        from django.apps import apps
+        from importlib import import_module
+
+        known = self.sell(2).items.get()
+        legacy = self.sell(1).items.get()
+        legacy.sale.stock_movements.all().delete()  # como una venta anterior al kardex
+        import_module('inventory.migrations.0014_saleitem_unknown_cost').forget_unknown_costs(apps, None)
+        known.refresh_from_db(), legacy.refresh_from_db()
+        self.assertEqual(known.cost_total, Decimal('6.00'))
+        self.assertIsNone(legacy.cost_total)
+
+
+@override_settings(JOBS_MODE='worker')
+class FinancialReportWindowTests(TransactionTestCase):
+    """ Cada caja entra al reporte por su día de apertura, cerrada o abierta """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+
+    def register(self, terminal, days_ago, income, close=False):
+        caja = CashRegister.objects.create(start_amount=Decimal('100'), terminal=terminal)
+        Transaction.objects.create(
+            cash_register=caja, type=TransactionType.INCOME, category=CategoryType.SALES,
+            description="Venta", amount=Decimal(income)
+        )
+        if close:
+            caja.close_register(Decimal('100') + Decimal(income))
+        CashRegister.objects.filter(pk=caja.pk).update(date=timezone.localdate() - timedelta(days=days_ago))
+        return caja
+
+    def test_registers_count_on_their_opening_day(self):
+        self.register('viejo', 40, '70', close=True)
+        self.register('cerrado', 10, '50', close=True)
+        self.register('ayer', 1, '5')    # abierta desde ayer, su venta es de hoy
+        self.register('hoy', 0, '20')
+        body = self.client.get('/api/finance/report/').json()
+        self.assertEqual(body['summary']['income'], '75.00')
+        # Sin merma ni ventas: montos en cero con el mismo formato, no el número 0
+        self.assertEqual((body['summary']['waste_cost'], body['summary']['gross_margin']), ('0.00', '0.00'))
+        days = {row['dia']: Decimal(row['ingreso_dia']) for row in body['chart_data']}
+        today = timezone.localdate()
+        self.assertEqual(days, {
+            str(today - timedelta(days=10)): 50, str(today - timedelta(days=1)): 5, str(today): 20,
+        })
+
+
+class AdminQueryTests(TestCase):
+    """ Las páginas del admin cuestan lo mismo con pocas o muchas filas """
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        self.caja = CashRegister.objects.create(start_amount=Decimal('100'), terminal='A')
+
+    def add_movements(self, count):
+        Transaction.objects.bulk_create([
+            Transaction(
+                cash_register=self.caja, type=TransactionType.INCOME, category=CategoryType.SALES,
+                description=f"Venta {n}", amount=Decimal('10')
+            )
+            for n in range(count)
+        ])
+
+    def queries_for(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_register_pages_do_not_grow_with_the_ledger(self):
+        pages = ('/admin/finance/cashregister/', f'/admin/finance/cashregister/{self.caja.pk}/change/')
+        self.add_movements(3)
+        few = [self.queries_for(url)[0] for url in pages]
+        for n in range(4):
+            CashRegister.objects.create(start_amount=Decimal('100'), terminal=f"T{n}")
+        self.add_movements(60)
+        self.assertEqual([self.queries_for(url)[0] for url in pages], few)
+
+    def test_register_ledger_inline_is_paginated(self):
+        self.add_movements(45)
+        url = f'/admin/finance/cashregister/{self.caja.pk}/change/'
+        _, first = self.queries_for(url)
+        self.assertContains(first, 'Página 1 de 3')
+        self.assertContains(first, 'Venta 44')
+        self.assertNotContains(first, 'Venta 0<')
+        _, last = self.queries_for(url + '?transactions-page=3')
+        self.assertContains(last, 'Página 3 de 3')
+        self.assertNotContains(last, 'Venta 44')
+
+
+
+class BulkExpenseTests(TestCase):
+    def setUp(self):
+        self.caja = CashRegister.objects.create(start_amount=Decimal('100'), terminal='A')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+
+    def lines(self, *amounts):
+        return [
+            {'category': CategoryType.SALARY, 'description': f"Sueldo {n}", 'amount': amount}
+            for n, amount in enumerate(amounts, 1)
+        ]
+
+    def bulk(self, *amounts, caja=None):
+        return self.client.post('/api/finance/expenses/bulk/', {
+            'cash_register': (caja or self.caja).pk, 'items': self.lines(*amounts),
+        }, format='json')
+
+    def test_all_lines_go_in_together(self):
+        created, balance = self.caja.add_expenses(self.lines(Decimal('30'), Decimal('70')))
+        self.assertEqual((len(created), balance), (2, 0))
+        self.assertEqual(self.caja.calculate_balance(), 0)
+
+        Transaction.objects.filter(cash_register=self.caja).delete()
+        response = self.bulk('40', '60')
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual((body['count'], Decimal(str(body['total'])), Decimal(str(body['balance']))), (2, 100, 0))
+        self.assertEqual(self.caja.transactions.filter(type=TransactionType.EXPENSE).count(), 2)
+
+    def test_insufficient_funds_rejects_every_line(self):
+        with self.assertRaises(InsufficientFunds) as raised:
+            self.caja.add_expenses(self.lines(Decimal('60'), Decimal('50')))
+        self.assertEqual((raised.exception.balance, raised.exception.required), (100, 110))
+
+        response = self.bulk('60', '50')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Decimal(str(response.json()['required'])), 110)
+        self.assertFalse(self.caja.transactions.exists())
+
+    def test_closed_register_or_invalid_line_rejects_the_batch(self):
+        response = self.client.post('/api/finance/expenses/bulk/', {
+            'cash_register': self.caja.pk,
+            'items': self.lines('10') + [{'category': CategoryType.SALES, 'description': "Venta", 'amount': '5'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        stale = CashRegister.objects.get(pk=self.caja.pk)
+        self.caja.close_register(Decimal('100'))
+        self.assertEqual(self.bulk('10').status_code, 400)
+        with self.assertRaises(ValueError):
+            stale.add_expenses(self.lines(Decimal('10')))
+        self.assertFalse(Transaction.objects.filter(type=TransactionType.EXPENSE).exists())
+
+@override_settings(JOBS_MODE='worker')
+class OpenRegisterTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+
+    def open(self, body, **headers):
+        return self.client.post('/api/finance/cajas/', {'start_amount': '100', 'date': str(timezone.localdate()), **body}, format='json', **headers)
+
+    def test_terminal_that_is_not_text_is_a_400(self):
+        for terminal in (['T1'], {'id': 1}, True, 'T' * 51):
+            response = self.open({'terminal': terminal})
+            self.assertEqual(response.status_code, 400, terminal)
+            self.assertIn('terminal', response.json())
+        self.assertEqual(self.open({}, HTTP_X_TERMINAL='T' * 51).status_code, 400)
+        self.assertFalse(CashRegister.objects.exists())
+
+    def test_terminal_comes_trimmed_from_the_body_or_the_header(self):
+        self.assertEqual(self.open({'terminal': '  T1 '}).json()['terminal'], 'T1')
+        self.assertEqual(self.open({}, HTTP_X_TERMINAL=' T2 ').json()['terminal'], 'T2')
+        self.assertEqual(self.open({'terminal': 'T1'}).status_code, 400)  # ya hay una abierta en T1
@@ -2,75 +2,203 @@ from rest_framework import viewsets, status
 from rest_framework.views import APIView
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Sum, Q, F
+from django.db import transaction, IntegrityError
+from django.db.models import Count, Sum, Q, F
 from django.db.models.functions import TruncDate
 from django.utils import timezone
 from datetime import timedelta
 from decimal import Decimal
-from .models import Transaction, TransactionType, CashRegister, CategoryType
-from inventory.models import Batch, Product
+from .models import Transaction, TransactionType, CashRegister, CategoryType, InsufficientFunds
+from inventory.models import Batch, Product, SaleItem, WasteRecord
 from .serializers import UserSerializer
 from django.contrib.auth.models import User, Group
+from backend_restaurant.db_router import ReplicaReadMixin
+from backend_restaurant.fieldsets import SparseFieldsViewMixin
+from backend_restaurant.renderers import money
+from core.jobs import enqueue
 
 
 # IMPORTS CORRECTOS DE SERIALIZERS
 from .serializers import (
     CashRegisterSerializer, 
     TransactionSerializer, 
-    ExpenseSerializer
+    ExpenseSerializer,
+    ExpenseBulkSerializer
 )
 
 # 1. REPORTE
-class FinancialReportView(APIView):
+class FinancialReportView(ReplicaReadMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
         end_date = timezone.now()
         start_date = end_date - timedelta(days=30)
-        
-        transacciones = Transaction.objects.filter(timestamp__range=[start_date, end_date])
-        ingresos = transacciones.filter(type=TransactionType.INCOME).aggregate(total=Sum('amount'))['total'] or 0
-        egresos = transacciones.filter(type=TransactionType.EXPENSE).aggregate(total=Sum('amount'))['total'] or 0
+        # Una sola regla para la caja: entra por su día de apertura con todo su libro,
+        # cerrada (foto del cierre) o abierta (libro vivo); el gráfico la muestra en ese día
+        dias_caja = [timezone.localdate(start_date), timezone.localdate(end_date)]
+
+        # Cajas cerradas: leemos su foto de cierre en lugar de re-sumar su libro
+        cerradas = CashRegister.objects.filter(is_closed=True, date__range=dias_caja)
+        foto = cerradas.aggregate(income=Sum('total_income'), expense=Sum('total_expense'))
+
+        # Cajas abiertas: solo su libro vivo
+        transacciones = Transaction.objects.filter(cash_register__date__range=dias_caja, cash_register__is_closed=False)
+        vivo = transacciones.aggregate(
+            income=Sum('amount', filter=Q(type=TransactionType.INCOME)),
+            expense=Sum('amount', filter=Q(type=TransactionType.EXPENSE))
+        )
+        ingresos = money(foto['income']) + money(vivo['income'])
+        egresos = money(foto['expense']) + money(vivo['expense'])
         balance = ingresos - egresos
 
-        inventory_val = Batch.objects.aggregate(
+        # Solo lo que se puede usar: lo vencido y aún no dado de baja no cuenta
+        inventory_val = money(Batch.objects.available().aggregate(
             total_value=Sum(F('current_quantity') * F('unit_cost'))
-        )['total_value'] or 0
+        )['total_value'])
+        merma = money(WasteRecord.objects.filter(created_at__range=[start_date, end_date]).aggregate(
+            total=Sum('total_cost')
+        )['total'])
         products_with_stock = Product.objects.filter(current_stock__gt=0).count()
 
-        historial = (
+        # Las líneas sin costo conocido (anteriores al kardex) no entran al margen
+        ventas = SaleItem.objects.filter(sale__date__range=[start_date, end_date], cost_total__isnull=False).aggregate(
+            revenue=Sum('subtotal'), cost=Sum('cost_total')
+        )
+        gross_margin = money(ventas['revenue']) - money(ventas['cost'])
+
+        dias = {}
+        for row in cerradas.values('date').annotate(ingreso=Sum('total_income'), egreso=Sum('total_expense')):
+            dias[row['date']] = [money(row['ingreso']), money(row['egreso'])]
+        vivos = (
             transacciones
-            .annotate(dia=TruncDate('timestamp'))
-            .values('dia')
+            .values(dia=F('cash_register__date'))
             .annotate(
-                ingreso_dia=Sum('amount', filter=Q(type=TransactionType.INCOME)),
-                egreso_dia=Sum('amount', filter=Q(type=TransactionType.EXPENSE))
+                ingreso=Sum('amount', filter=Q(type=TransactionType.INCOME)),
+                egreso=Sum('amount', filter=Q(type=TransactionType.EXPENSE))
             )
-            .order_by('dia')
         )
+        for row in vivos:
+            dia = dias.setdefault(row['dia'], [money(0), money(0)])
+            dia[0] += money(row['ingreso'])
+            dia[1] += money(row['egreso'])
+        historial = [
+            {"dia": dia, "ingreso_dia": ingreso, "egreso_dia": egreso}
+            for dia, (ingreso, egreso) in sorted(dias.items())
+        ]
 
         return Response({
             "summary": { 
                 "income": ingresos, "expense": egresos, "balance": balance,
-                "inventory_value": inventory_val, "product_count": products_with_stock
+                "inventory_value": inventory_val, "product_count": products_with_stock,
+                "cost_of_sales": money(ventas['cost']), "gross_margin": gross_margin,
+                "waste_cost": merma
             },
-            "chart_data": list(historial)
+            "chart_data": historial
         })
 
+# 1.1 MARGEN BRUTO (Ventas - Costo FIFO de lo vendido)
+class MarginReportView(ReplicaReadMixin, APIView):
+    permission_classes = [IsAuthenticated]
+
+    GROUPS = {
+        'dish': ('dish_id', 'dish__name'),
+        'day': ('dia',),
+        'register': ('sale__cash_register_id', 'sale__cash_register__date'),
+    }
+
+    def get(self, request):
+        group_by = request.query_params.get('group_by', 'dish')
+        if group_by not in self.GROUPS:
+            return Response({"error": f"group_by debe ser uno de: {', '.join(self.GROUPS)}"}, status=400)
+
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            return Response({"error": "days debe ser un número entero."}, status=400)
+        end_date = timezone.now()
+        start_date = end_date - timedelta(days=days)
+
+        items = SaleItem.objects.filter(sale__date__range=[start_date, end_date])
+        if request.query_params.get('dish'):
+            items = items.filter(dish_id=request.query_params['dish'])
+        # Ventas anteriores al kardex: su costo no se conoce, se informan aparte y no cuentan como margen
+        without_cost = items.filter(cost_total__isnull=True).aggregate(lines=Count('id'), revenue=Sum('subtotal'))
+        items = items.filter(cost_total__isnull=False)
+        if group_by == 'day':
+            items = items.annotate(dia=TruncDate('sale__date'))
+
+        # Todo el cálculo en la BD: una sola consulta agrupada
+        rows = (
+            items.values(*self.GROUPS[group_by])
+            .annotate(
+                quantity=Sum('quantity'),
+                revenue=Sum('subtotal'),
+                cost=Sum('cost_total'),
+            )
+            .annotate(margin=F('revenue') - F('cost'))
+            .order_by(*self.GROUPS[group_by])
+        )
+
+        results = []
+        totals = {"revenue": money(0), "cost": money(0), "margin": money(0)}
+        for row in rows:
+            for key in totals:
+                row[key] = money(row[key])
+            row['margin_pct'] = round(row['margin'] * 100 / row['revenue'], 2) if row['revenue'] else None
+            for key in totals:
+                totals[key] += row[key]
+            results.append(row)
+        totals['margin_pct'] = round(totals['margin'] * 100 / totals['revenue'], 2) if totals['revenue'] else None
+        totals['without_cost'] = {"lines": without_cost['lines'], "revenue": money(without_cost['revenue'])}
+
+        return Response({"group_by": group_by, "summary": totals, "rows": results})
+
 # 2. CAJAS
-class CashRegisterViewSet(viewsets.ModelViewSet):
-    queryset = CashRegister.objects.all().order_by('-date')
+class CashRegisterViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
+    # opened_by se muestra como username: un JOIN en vez de una consulta por caja
+    queryset = CashRegister.objects.select_related('opened_by').order_by('-date')
     serializer_class = CashRegisterSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        params = self.request.query_params
+        if params.get('is_closed') in ('true', 'false'):
+            queryset = queryset.filter(is_closed=params['is_closed'] == 'true')
+        if params.get('terminal'):
+            queryset = queryset.filter(terminal=params['terminal'])
+        return queryset
+
     def create(self, request, *args, **kwargs):
-        if CashRegister.objects.filter(is_closed=False).exists():
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        # La terminal del cuerpo o, si no viene, la del header; ambas pasan por el campo del serializer
+        terminal = serializer.validated_data.get('terminal')
+        if not terminal:
+            try:
+                terminal = serializer.fields['terminal'].run_validation(request.headers.get('X-Terminal', ''))
+            except ValidationError as e:
+                raise ValidationError({'terminal': e.detail})
+        # Varias cajas pueden estar abiertas a la vez, pero solo una por terminal (o por cajero)
+        if CashRegister.objects.open_for(request.user, terminal):
+            return Response(
+                {"error": "Ya tienes una caja abierta en esta terminal. Debes cerrarla antes de abrir otra."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            with transaction.atomic():
+                serializer.save(opened_by=request.user, terminal=terminal)
+        except IntegrityError:
+            # Dos aperturas simultáneas en la misma terminal: la restricción única decide
             return Response(
-                {"error": "Ya existe una caja abierta. Debes cerrarla antes de abrir otra."},
+                {"error": "Ya existe una caja abierta en esta terminal."},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        return super().create(request, *args, **kwargs)
+        # Inicio de jornada: lo que venció hasta ayer sale del stock antes de vender
+        enqueue('inventory.write_off_expired', dedupe_key=f"waste:{timezone.localdate():%Y%m%d}")
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @action(detail=True, methods=['post'])
     def close(self, request, pk=None):
@@ -87,17 +215,20 @@ class CashRegisterViewSet(viewsets.ModelViewSet):
         except:
             return Response({"error": "Monto inválido."}, status=400)
 
-        caja.close_register(real_amount=amount_decimal)
+        try:
+            caja.close_register(real_amount=amount_decimal)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
         return Response(CashRegisterSerializer(caja).data)
 
 # 3. HISTORIAL DE MOVIMIENTOS
-class TransactionViewSet(viewsets.ReadOnlyModelViewSet):
+class TransactionViewSet(ReplicaReadMixin, SparseFieldsViewMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Transaction.objects.all().order_by('-timestamp')
     serializer_class = TransactionSerializer
     permission_classes = [IsAuthenticated]
 
 # 4. GASTOS MANUALES (NUEVO)
-class ExpenseViewSet(viewsets.ModelViewSet):
+class ExpenseViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     # Solo mostramos gastos manuales (no compras automáticas)
     queryset = Transaction.objects.filter(
         type=TransactionType.EXPENSE
@@ -108,6 +239,28 @@ class ExpenseViewSet(viewsets.ModelViewSet):
     serializer_class = ExpenseSerializer
     permission_classes = [IsAuthenticated]
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """ Varios gastos contra una caja en una sola operación: todo o nada """
+        serializer = ExpenseBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            created, balance = serializer.save()
+        except InsufficientFunds as e:
+            return Response(
+                {"error": str(e), "balance": e.balance, "required": e.required},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "cash_register": serializer.validated_data['cash_register'].id,
+            "count": len(created),
+            "total": sum(t.amount for t in created),
+            "balance": balance,
+            "expenses": ExpenseSerializer(created, many=True).data,
+        }, status=status.HTTP_201_CREATED)
+
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all().order_by('-date_joined')
     serializer_class = UserSerializer
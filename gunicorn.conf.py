@@ -0,0 +1,18 @@
+""" gunicorn lee este archivo solo al arrancar desde la raíz del proyecto
+(gunicorn backend_restaurant.wsgi). Bind, workers, etc. siguen viniendo de la línea de
+comandos o de GUNICORN_CMD_ARGS. """
+
+
+def post_worker_init(worker):
+    """ Cada worker nuevo (deploy o reciclado por max_requests) se precalienta antes de
+    aceptar su primer request: conexión, URLs/vistas y datos de referencia en memoria.
+    Corre después de cargar la app; en post_fork Django todavía no está configurado. """
+    try:
+        from core.refdata import warm_up
+        timings = warm_up()
+    except Exception:
+        # Sin precalentar el worker igual funciona: carga todo con el primer request
+        worker.log.exception("No se pudo precalentar el worker %s", worker.pid)
+        return
+    detail = ", ".join(f"{step} {seconds * 1000:.0f} ms" for step, seconds in timings.items())
+    worker.log.info("Worker %s precalentado: %s", worker.pid, detail)
@@ -1,69 +1,172 @@
 from django.contrib import admin
+from django.utils import timezone
 from django.utils.html import format_html
+from core.admin import PaginatedTabularInline
 from .models import (
     UnitOfMeasure, Product, Batch, Purchase, PurchaseItem, 
-    Recipe, Production, ProductionIngredient, Sale, SaleItem
+    Recipe, Production, ProductionIngredient, Sale, SaleItem, StockMovement, StockAlert, WasteRecord
 )
 
-admin.site.register(UnitOfMeasure)
+@admin.register(UnitOfMeasure)
+class UnitOfMeasureAdmin(admin.ModelAdmin):
+    list_display = ('name', 'base_unit', 'conversion_factor')
+    search_fields = ('name',)
+    ordering = ('name',)
 
 # --- BATCH ADMIN (Aquí verás los lotes en rojo/verde) ---
 @admin.register(Batch)
 class BatchAdmin(admin.ModelAdmin):
-    list_display = ('product', 'current_quantity', 'initial_quantity', 'entry_date', 'status_color')
-    list_filter = ('product', 'entry_date')
+    list_display = ('product', 'current_quantity', 'initial_quantity', 'entry_date', 'expiry_date', 'status_color')
+    list_filter = ('product__is_dish', 'entry_date', 'expiry_date')
+    search_fields = ('product__name',)
+    list_select_related = ('product',)
+    autocomplete_fields = ('product', 'origin_purchase')
     
     def status_color(self, obj):
         if obj.current_quantity == 0:
             return format_html('<span style="color: red; font-weight: bold;">🔴 Agotado</span>')
+        if obj.expiry_date and obj.expiry_date < timezone.localdate():
+            return format_html('<span style="color: orange; font-weight: bold;">🟠 Vencido</span>')
         return format_html('<span style="color: green; font-weight: bold;">🟢 Activo</span>')
     status_color.short_description = "Estado"
 
 # --- INLINES ---
+# Los FK usan autocompletado: el formulario ya no carga todos los productos/cajas en cada fila
 class RecipeInline(admin.TabularInline):
     model = Recipe
     fk_name = "dish"
     extra = 1
+    autocomplete_fields = ('ingredient',)
 
 class PurchaseItemInline(admin.TabularInline):
     model = PurchaseItem
     extra = 1
+    autocomplete_fields = ('product', 'unit_bought')
 
 class ProductionIngredientInline(admin.TabularInline):
     model = ProductionIngredient
     extra = 3 
     fields = ('ingredient', 'quantity_used', 'cost_calculated')
     readonly_fields = ('cost_calculated',)
+    autocomplete_fields = ('ingredient',)
 
 class SaleItemInline(admin.TabularInline):
     model = SaleItem
     extra = 1
     readonly_fields = ('subtotal',)
+    autocomplete_fields = ('dish',)
+
+# Historial de ventas de un plato (crece sin límite): de a una página
+class DishSaleItemInline(PaginatedTabularInline):
+    model = SaleItem
+    fk_name = 'dish'
+    verbose_name_plural = "Ventas del plato"
+    fields = ('sale', 'quantity', 'unit_price', 'subtotal', 'cost_total')
+    readonly_fields = fields
+    ordering = ('-sale__date', '-id')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('sale')
 
 # --- PANELES PRINCIPALES ---
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'is_dish', 'current_stock', 'base_unit', 'sales_price')
-    list_filter = ('is_dish',)
+    list_display = (
+        'name', 'is_dish', 'current_stock', 'reorder_threshold', 'shelf_life_days', 'base_unit', 'sales_price', 'costing_method'
+    )
+    list_filter = ('is_dish', 'costing_method')
     search_fields = ('name',)
+    ordering = ('name',)
     inlines = [RecipeInline]
+
+    def get_inlines(self, request, obj):
+        if obj is not None and obj.is_dish:
+            return [RecipeInline, DishSaleItemInline]
+        return self.inlines
+
+    def get_search_results(self, request, queryset, search_term):
+        # También la usa el autocompletado de los demás paneles: índice del nombre normalizado
+        if not search_term.strip():
+            return queryset, False
+        return queryset.matching(search_term), False
     # actions = ['fix_stock'] # Podrías agregar una acción para forzar recálculo si quisieras
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and 'costing_method' in form.changed_data:
+            obj.apply_costing_method()
+
 @admin.register(Purchase)
 class PurchaseAdmin(admin.ModelAdmin):
     inlines = [PurchaseItemInline]
-    list_display = ('id', 'date', 'cash_register', 'total_cost')
+    list_display = ('id', 'date', 'caja', 'total_cost')
+    search_fields = ('=id', 'description')
+    ordering = ('-date',)
+    list_select_related = ('cash_register',)
+    autocomplete_fields = ('cash_register',)
+
+    # Etiqueta liviana de la caja (el __str__ de una caja abierta suma su libro)
+    def caja(self, obj):
+        return f"Caja #{obj.cash_register_id} ({obj.cash_register.date})"
+    caja.short_description = "Caja Origen"
 
 @admin.register(Production)
 class ProductionAdmin(admin.ModelAdmin):
     inlines = [ProductionIngredientInline]
     list_display = ('__str__', 'quantity_produced', 'total_cost', 'unit_cost_real')
     readonly_fields = ('total_cost', 'unit_cost_real')
+    list_select_related = ('dish',)
+    autocomplete_fields = ('dish',)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        form.instance.update_totals(created=not change)  # Costo, lote y stock una vez cargados todos los insumos
 
 @admin.register(Sale)
 class SaleAdmin(admin.ModelAdmin):
     inlines = [SaleItemInline]
     # BORRA 'customer_name' DE AQUÍ ABAJO 👇
     list_display = ('id', 'date', 'total_amount') 
-    readonly_fields = ('total_amount',)
\ No newline at end of file
+    readonly_fields = ('total_amount', 'idempotency_key')
+    search_fields = ('idempotency_key',)
+    autocomplete_fields = ('cash_register',)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if not change:
+            form.instance.post_income()  # Ingreso en caja por el total de la venta nueva
+
+# --- KARDEX (solo lectura: el libro no se edita) ---
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ('timestamp', 'product', 'movement_type', 'quantity', 'unit_cost', 'batch')
+    list_filter = ('movement_type',)
+    date_hierarchy = 'timestamp'
+    search_fields = ('product__name',)
+    list_select_related = ('product', 'batch__product')
+    show_full_result_count = False
+
+    def has_add_permission(self, request): return False
+    def has_change_permission(self, request, obj=None): return False
+    def has_delete_permission(self, request, obj=None): return False
+
+@admin.register(WasteRecord)
+class WasteRecordAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'product', 'reason', 'quantity', 'unit_cost', 'total_cost', 'batch')
+    list_filter = ('reason',)
+    date_hierarchy = 'created_at'
+    search_fields = ('product__name',)
+    list_select_related = ('product', 'batch__product')
+
+    def has_add_permission(self, request): return False
+    def has_change_permission(self, request, obj=None): return False
+    def has_delete_permission(self, request, obj=None): return False
+
+@admin.register(StockAlert)
+class StockAlertAdmin(admin.ModelAdmin):
+    list_display = ('product', 'stock_level', 'threshold', 'created_at', 'resolved_at')
+    list_filter = (('resolved_at', admin.EmptyFieldListFilter),)
+    list_select_related = ('product',)
+    readonly_fields = ('product', 'threshold', 'stock_level', 'created_at')
+
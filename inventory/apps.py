@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class InventoryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'inventory'
+
+    def ready(self):
+        from . import jobs  # noqa: F401  (registra los trabajos en core.jobs)
+        from . import refdata  # noqa: F401  (registra los datos de referencia en core.refdata)
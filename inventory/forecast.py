@@ -0,0 +1,117 @@
+""" Pronóstico de demanda por plato y sugerencia de producción/compras.
+Todo el historial se carga en una consulta y se calcula en bloque con NumPy. """
+import math
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from core import refdata
+from .models import Product, SaleItem
+
+
+def sales_matrix(dish_ids, start, end):
+    """ Matriz platos x días con las cantidades vendidas (una sola consulta) """
+    # Rango sobre la columna cruda (usa el índice de Sale.date). El día local se calcula
+    # aquí y no en SQL: en SQLite truncar fechas es una función Python por fila.
+    since = timezone.make_aware(datetime.combine(start, time.min))
+    until = timezone.make_aware(datetime.combine(end, time.max))
+    rows = SaleItem.objects.filter(sale__date__range=[since, until]).values_list('dish_id', 'sale__date', 'quantity')
+
+    tz = timezone.get_current_timezone()
+    index = {dish_id: i for i, dish_id in enumerate(dish_ids)}
+    first_day = start.toordinal()
+    matrix = np.zeros((len(dish_ids), (end - start).days + 1))
+    data = [
+        (index[dish_id], moment.astimezone(tz).date().toordinal() - first_day, qty)
+        for dish_id, moment, qty in rows.iterator(chunk_size=5000) if dish_id in index
+    ]
+    if data:
+        r, c, q = np.array(data, dtype=float).T
+        np.add.at(matrix, (r.astype(int), c.astype(int)), q)
+    return matrix
+
+
+def forecast_demand(matrix, start, target, alpha=0.3, weeks=4):
+    """ Devuelve (promedio móvil del mismo día de semana, suavizado exponencial con estacionalidad semanal) """
+    n_dishes, n_days = matrix.shape
+    if n_days == 0:
+        zeros = np.zeros(n_dishes)
+        return zeros, zeros
+
+    weekdays = (np.arange(n_days) + start.weekday()) % 7
+    same_day = matrix[:, weekdays == target.weekday()]
+
+    # Promedio móvil de las últimas 'weeks' semanas para ese día
+    moving_average = same_day[:, -weeks:].mean(axis=1) if same_day.shape[1] else np.zeros(n_dishes)
+
+    # Suavizado exponencial simple del nivel diario: pesos alpha*(1-alpha)^k, el día más reciente pesa más
+    weights = alpha * (1 - alpha) ** np.arange(n_days - 1, -1, -1)
+    level = matrix @ (weights / weights.sum())
+
+    # Índice estacional del día de semana (ventas de ese día / promedio diario)
+    daily_mean = matrix.mean(axis=1)
+    weekday_mean = same_day.mean(axis=1) if same_day.shape[1] else daily_mean
+    seasonal = np.divide(weekday_mean, daily_mean, out=np.ones(n_dishes), where=daily_mean > 0)
+    return moving_average, level * seasonal
+
+
+def production_plan(target=None, history_days=365, alpha=0.3, weeks=4, safety=0.1):
+    today = timezone.localdate()
+    target = target or today + timedelta(days=1)
+    # Solo días completos: las ventas parciales de hoy pesarían más que ningún otro día en el suavizado
+    end = today - timedelta(days=1)
+    start = today - timedelta(days=history_days)
+
+    dishes = list(Product.objects.filter(is_dish=True).order_by('name').values_list('id', 'name', 'current_stock'))
+    dish_ids = [d[0] for d in dishes]
+    matrix = sales_matrix(dish_ids, start, end)
+    moving_average, smoothed = forecast_demand(matrix, start, target, alpha=alpha, weeks=weeks)
+
+    forecast = np.where(smoothed > 0, smoothed, moving_average)
+    dish_stock = np.array([float(d[2]) for d in dishes])
+    to_produce = np.ceil(np.maximum(forecast * (1 + safety) - dish_stock, 0))
+
+    # Necesidad de insumos = producción sugerida x matriz de recetas (platos x insumos)
+    by_dish = refdata.get('inventory.recipes')
+    recipes = [
+        (dish_id, ingredient_id, qty)
+        for dish_id in dish_ids for ingredient_id, qty in by_dish.get(dish_id, ())
+    ]
+    ingredient_ids = sorted({r[1] for r in recipes})
+    ing_index = {pk: i for i, pk in enumerate(ingredient_ids)}
+    dish_index = {pk: i for i, pk in enumerate(dish_ids)}
+    recipe_matrix = np.zeros((len(dish_ids), len(ingredient_ids)))
+    for dish_id, ingredient_id, qty in recipes:
+        recipe_matrix[dish_index[dish_id], ing_index[ingredient_id]] = float(qty)
+    needed = to_produce @ recipe_matrix
+
+    ingredients = dict(
+        (pk, (name, stock)) for pk, name, stock in
+        Product.objects.filter(pk__in=ingredient_ids).values_list('id', 'name', 'current_stock')
+    )
+    ingredient_stock = np.array([float(ingredients[pk][1]) for pk in ingredient_ids])
+    to_buy = np.maximum(needed - ingredient_stock, 0)
+
+    return {
+        "target_date": target,
+        "history_days": history_days,
+        "dishes": [
+            {
+                "dish_id": dish_id, "name": name, "stock": stock,
+                "moving_average": round(float(moving_average[i]), 2),
+                "smoothed": round(float(smoothed[i]), 2),
+                "forecast": round(float(forecast[i]), 2),
+                "suggested_production": int(to_produce[i]),
+            }
+            for i, (dish_id, name, stock) in enumerate(dishes)
+        ],
+        "ingredients": [
+            {
+                "ingredient_id": pk, "name": ingredients[pk][0], "stock": ingredients[pk][1],
+                "needed": round(float(needed[i]), 3),
+                "to_buy": round(float(math.ceil(to_buy[i] * 1000) / 1000), 3),
+            }
+            for i, pk in enumerate(ingredient_ids)
+        ],
+    }
@@ -0,0 +1,48 @@
+""" Trabajos de inventario que no necesitan correr dentro del request de venta """
+import logging
+from datetime import timedelta
+from django.db.models import Sum
+from django.utils.dateparse import parse_date, parse_datetime
+from core.jobs import job
+from finance.models import Transaction, TransactionType, CategoryType
+from .models import Product, Sale, SalesCube, WasteRecord
+
+logger = logging.getLogger(__name__)
+
+
+@job('inventory.recalculate_stock')
+def recalculate_stock(product_ids):
+    for product in Product.objects.filter(pk__in=product_ids):
+        product.recalculate_stock()
+
+
+@job('inventory.reconcile_sale')
+def reconcile_sale(sale_id):
+    """ Verifica que el total de la venta cuadre con sus líneas y con el ingreso en caja """
+    sale = Sale.objects.get(pk=sale_id)
+    items_total = sale.items.aggregate(total=Sum('subtotal'))['total'] or 0
+    income = Transaction.objects.filter(
+        cash_register_id=sale.cash_register_id, type=TransactionType.INCOME,
+        category=CategoryType.SALES, description__startswith=f"Venta #{sale.id}:"
+    ).aggregate(total=Sum('amount'))['total'] or 0
+    if not (sale.total_amount == items_total == income):
+        logger.warning(
+            "Venta #%s descuadrada: total=%s, líneas=%s, ingreso en caja=%s",
+            sale.id, sale.total_amount, items_total, income
+        )
+
+
+@job('inventory.refresh_sales_cube')
+def refresh_sales_cube(cash_register_id, period):
+    """ Pone al día la celda (hora, caja) de una venta nueva. Recalcula en vez de sumar:
+    un reintento o una venta ya incluida no se cuentan dos veces """
+    start = parse_datetime(period)
+    SalesCube.refresh(start, start + timedelta(hours=1), cash_register_id=cash_register_id)
+
+
+@job('inventory.write_off_expired')
+def write_off_expired(date=None):
+    """ Pasa a merma los lotes vencidos antes de 'date' (por defecto, hoy) """
+    records = WasteRecord.write_off_expired(parse_date(date) if date else None)
+    if records:
+        logger.info("%s lotes vencidos dados de baja (%s Bs)", len(records), sum(r.total_cost for r in records))
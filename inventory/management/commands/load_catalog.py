@@ -0,0 +1,28 @@
+import json
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from inventory.serializers import CatalogSerializer
+
+
+class Command(BaseCommand):
+    help = "Carga (o actualiza) unidades, insumos, platos y recetas desde un archivo JSON o CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Archivo .json o .csv con el catálogo")
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f"No existe el archivo {path}")
+
+        text = path.read_text(encoding='utf-8-sig')
+        data = CatalogSerializer.from_csv(text) if path.suffix.lower() == '.csv' else json.loads(text)
+
+        serializer = CatalogSerializer(data=data)
+        if not serializer.is_valid():
+            raise CommandError(json.dumps(serializer.errors, ensure_ascii=False, indent=2))
+
+        counts = serializer.save()
+        self.stdout.write(self.style.SUCCESS(
+            "Catálogo cargado: {units} unidades, {products} insumos, {dishes} platos, {recipes} líneas de receta.".format(**counts)
+        ))
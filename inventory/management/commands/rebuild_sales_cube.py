@@ -0,0 +1,25 @@
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from inventory.models import SalesCube
+
+
+class Command(BaseCommand):
+    help = ("Reconstruye el cubo de ventas (hora, plato, caja) desde las líneas de venta. "
+            "Normalmente se mantiene solo en la cola de trabajos; úsalo tras cargas o correcciones manuales.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="Solo los últimos N días (por defecto, todo el historial)")
+
+    def handle(self, *args, **options):
+        since = None
+        if options['days']:
+            start = timezone.localdate() - timedelta(days=options['days'])
+            since = timezone.make_aware(datetime.combine(start, datetime.min.time()))
+        started = time.perf_counter()
+        cells = SalesCube.refresh(since)
+        elapsed = time.perf_counter() - started
+        scope = f"desde {since:%Y-%m-%d}" if since else "todo el historial"
+        self.stdout.write(self.style.SUCCESS(f"Cubo de ventas reconstruido ({scope}): {cells} celdas en {elapsed:.2f} s."))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from inventory.models import CostingMethod, Product
+
+
+class Command(BaseCommand):
+    help = ("Cambia el método de costeo de insumos (PEPS o promedio ponderado) y rearma sus lotes: "
+            "en promedio funde los lotes vivos en la bolsa al costo promedio. Sin --method solo "
+            "vuelve a aplicar el método actual de cada insumo.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('products', nargs='*', help="Nombres de insumos (por defecto, todos)")
+        parser.add_argument('--method', choices=CostingMethod.values)
+
+    def handle(self, *args, **options):
+        products = Product.objects.filter(is_dish=False).order_by('name')
+        if options['products']:
+            products = products.filter(name__in=options['products'])
+            missing = set(options['products']) - set(products.values_list('name', flat=True))
+            if missing:
+                raise CommandError(f"Insumos no encontrados: {', '.join(sorted(missing))}")
+        elif not options['method']:
+            products = products.filter(costing_method=CostingMethod.AVERAGE)
+
+        for product in products:
+            if options['method']:
+                product.costing_method = options['method']
+                product.save(update_fields=['costing_method'])
+            product.apply_costing_method()
+            product.recalculate_stock()
+            line = f"{product.name}: {product.get_costing_method_display()}"
+            if product.average_batch_id:
+                pool = product.average_batch
+                line += f" | bolsa {pool.current_quantity} a {pool.unit_cost} Bs"
+            self.stdout.write(line)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from inventory.models import StockCheckpoint
+
+
+class Command(BaseCommand):
+    help = "Guarda un corte del kardex (stock y valor por producto) para acelerar las consultas históricas."
+
+    def handle(self, *args, **options):
+        when = StockCheckpoint.take()
+        count = StockCheckpoint.objects.filter(taken_at=when).count()
+        self.stdout.write(self.style.SUCCESS(f"Corte guardado al {when:%Y-%m-%d %H:%M} ({count} productos)."))
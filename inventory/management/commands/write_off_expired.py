@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from inventory.models import Batch, WasteRecord
+
+
+class Command(BaseCommand):
+    help = ("Da de baja los lotes vencidos: su saldo pasa a la merma con su movimiento en el kardex. "
+            "Normalmente corre en la cola al abrir la primera caja del día; úsalo desde cron o a mano.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help="Vencidos antes de esta fecha AAAA-MM-DD (por defecto, hoy)")
+        parser.add_argument('--dry-run', action='store_true', help="Solo mostrar lo que se daría de baja")
+
+    def handle(self, *args, **options):
+        on = timezone.localdate()
+        if options['date']:
+            on = parse_date(options['date'])
+            if on is None:
+                raise CommandError("Fecha inválida, usa AAAA-MM-DD.")
+
+        if options['dry_run']:
+            rows = (
+                Batch.objects.expired(on).values('product__name')
+                .annotate(quantity=Sum('current_quantity'), value=Sum(F('current_quantity') * F('unit_cost')))
+                .order_by('product__name')
+            )
+            for row in rows:
+                self.stdout.write(f"  {row['product__name']:<30} {row['quantity']:>10} {row['value']:>10.2f} Bs")
+            self.stdout.write(f"{len(rows)} productos con lotes vencidos antes del {on:%Y-%m-%d} (sin cambios).")
+            return
+
+        records = WasteRecord.write_off_expired(on)
+        total = sum((r.total_cost for r in records), 0)
+        self.stdout.write(self.style.SUCCESS(f"{len(records)} lotes vencidos dados de baja ({total} Bs)."))
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:26
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def open_ledger(apps, schema_editor):
+    """ Saldo inicial del kardex: un movimiento por cada lote que hoy tiene existencias """
+    Batch = apps.get_model('inventory', 'Batch')
+    StockMovement = apps.get_model('inventory', 'StockMovement')
+    now = django.utils.timezone.now()
+    StockMovement.objects.bulk_create([
+        StockMovement(
+            product_id=batch.product_id, batch=batch, movement_type='OPENING',
+            quantity=batch.current_quantity, unit_cost=batch.unit_cost, timestamp=now
+        )
+        for batch in Batch.objects.filter(current_quantity__gt=0)
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0003_transaction_indexes'),
+        ('inventory', '0002_alter_batch_options_alter_product_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField(db_index=True)),
+                ('quantity', models.DecimalField(decimal_places=3, max_digits=12)),
+                ('value', models.DecimalField(decimal_places=3, max_digits=14)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='inventory.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product', 'taken_at'), name='checkpoint_product_time_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('movement_type', models.CharField(choices=[('OPENING', 'Saldo Inicial'), ('PURCHASE', 'Compra'), ('PROD_IN', 'Producción (Entrada)'), ('PROD_OUT', 'Consumo en Cocina'), ('SALE', 'Venta')], max_length=10)),
+                ('quantity', models.DecimalField(decimal_places=3, max_digits=12)),
+                ('unit_cost', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('batch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movements', to='inventory.batch')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='movements', to='inventory.product')),
+                ('production', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='inventory.production')),
+                ('purchase', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='inventory.purchase')),
+                ('sale', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='inventory.sale')),
+            ],
+            options={
+                'ordering': ['timestamp', 'id'],
+                'indexes': [models.Index(fields=['product', 'timestamp'], name='movement_product_time_idx'), models.Index(fields=['timestamp'], name='movement_time_idx')],
+            },
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
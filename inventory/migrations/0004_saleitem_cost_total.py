@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_stock_movement_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='saleitem',
+            name='cost_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['date'], name='sale_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='saleitem',
+            index=models.Index(fields=['dish', 'sale'], include=('quantity', 'subtotal', 'cost_total'), name='saleitem_dish_sale_idx'),
+        ),
+    ]
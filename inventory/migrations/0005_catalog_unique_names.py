@@ -0,0 +1,49 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:28
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def dedupe_catalog(apps, schema_editor):
+    """ Deja los nombres únicos antes de crear las restricciones (renombra los repetidos) """
+    for model_name in ('UnitOfMeasure', 'Product'):
+        Model = apps.get_model('inventory', model_name)
+        repeated = Model.objects.values('name').annotate(n=Count('id')).filter(n__gt=1)
+        for row in repeated:
+            for obj in Model.objects.filter(name=row['name']).order_by('id')[1:]:
+                obj.name = f"{obj.name} (#{obj.id})"[:100 if model_name == 'Product' else 50]
+                obj.save(update_fields=['name'])
+
+    # Recetas con el mismo ingrediente repetido: se suman en una sola línea
+    Recipe = apps.get_model('inventory', 'Recipe')
+    repeated = Recipe.objects.values('dish_id', 'ingredient_id').annotate(
+        n=Count('id'), total=Sum('quantity_required')
+    ).filter(n__gt=1)
+    for row in repeated:
+        lines = list(Recipe.objects.filter(dish_id=row['dish_id'], ingredient_id=row['ingredient_id']).order_by('id'))
+        lines[0].quantity_required = row['total']
+        lines[0].save(update_fields=['quantity_required'])
+        Recipe.objects.filter(pk__in=[line.pk for line in lines[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_saleitem_cost_total'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_catalog, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(fields=('name',), name='product_name_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipe',
+            constraint=models.UniqueConstraint(fields=('dish', 'ingredient'), name='recipe_dish_ingredient_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='unitofmeasure',
+            constraint=models.UniqueConstraint(fields=('name',), name='unit_name_uniq'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_stock_alerts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='average_batch',
+            field=models.OneToOneField(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='inventory.batch'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='costing_method',
+            field=models.CharField(choices=[('FIFO', 'PEPS (primero en entrar, primero en salir)'), ('AVG', 'Promedio ponderado')], default='FIFO', max_length=4, verbose_name='Método de costeo'),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='movement_type',
+            field=models.CharField(choices=[('OPENING', 'Saldo Inicial'), ('PURCHASE', 'Compra'), ('PROD_IN', 'Producción (Entrada)'), ('PROD_OUT', 'Consumo en Cocina'), ('SALE', 'Venta'), ('ADJUST', 'Ajuste de Costeo')], max_length=10),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def link_output_batches(apps, schema_editor):
+    """ Antes cada plato tenía un solo lote de producción (sin compra de origen), reescrito
+    por cada producción: queda como el lote de la última producción de ese plato """
+    Batch = apps.get_model('inventory', 'Batch')
+    Production = apps.get_model('inventory', 'Production')
+    dishes = Production.objects.values_list('dish_id', flat=True).distinct()
+    for dish_id in dishes:
+        batches = list(Batch.objects.filter(product_id=dish_id, origin_purchase__isnull=True)[:2])
+        if len(batches) != 1:
+            continue
+        latest = Production.objects.filter(dish_id=dish_id).order_by('-date', '-id').first()
+        latest.output_batch_id = batches[0].id
+        latest.save(update_fields=['output_batch'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_costing_method'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='production',
+            name='output_batch',
+            field=models.OneToOneField(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='production', to='inventory.batch'),
+        ),
+        migrations.RunPython(link_output_batches, migrations.RunPython.noop),
+    ]
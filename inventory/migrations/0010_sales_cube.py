@@ -0,0 +1,63 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_cube(apps, schema_editor):
+    """ El cubo arranca con todo el historial de ventas (lo mismo que SalesCube.refresh()) """
+    SaleItem = apps.get_model('inventory', 'SaleItem')
+    SalesCube = apps.get_model('inventory', 'SalesCube')
+    tz = timezone.get_current_timezone()
+    grid = {}
+    rows = SaleItem.objects.values_list(
+        'sale__date', 'sale__cash_register_id', 'dish_id', 'quantity', 'subtotal', 'cost_total'
+    )
+    for moment, register_id, dish_id, quantity, subtotal, cost in rows.iterator(chunk_size=5000):
+        period = moment.astimezone(tz).replace(minute=0, second=0, microsecond=0)
+        cell = grid.setdefault((period, register_id, dish_id), [0, 0, 0, 0])
+        cell[0] += quantity
+        cell[1] += subtotal
+        cell[2] += cost
+        cell[3] += 1
+    SalesCube.objects.bulk_create([
+        SalesCube(
+            period=period, date=period.date(), hour=period.hour, weekday=period.isoweekday(),
+            cash_register_id=register_id, dish_id=dish_id,
+            quantity=quantity, revenue=revenue, cost=cost, lines=lines
+        )
+        for (period, register_id, dish_id), (quantity, revenue, cost, lines) in grid.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0005_transaction_archive'),
+        ('inventory', '0009_sale_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesCube',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateTimeField()),
+                ('date', models.DateField()),
+                ('hour', models.PositiveSmallIntegerField()),
+                ('weekday', models.PositiveSmallIntegerField()),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cost', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('lines', models.PositiveIntegerField(default=0)),
+                ('cash_register', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='finance.cashregister')),
+                ('dish', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='inventory.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'dish'], name='salescube_date_dish_idx')],
+                'constraints': [models.UniqueConstraint(fields=('period', 'cash_register', 'dish'), name='salescube_cell_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_cube, migrations.RunPython.noop),
+    ]
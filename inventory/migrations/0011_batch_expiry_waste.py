@@ -0,0 +1,73 @@
+# Generated by Django 5.2.8 on 2026-10-19 17:06
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_sales_cube'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WasteRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reason', models.CharField(choices=[('EXPIRED', 'Vencido')], default='EXPIRED', max_length=10)),
+                ('quantity', models.DecimalField(decimal_places=3, max_digits=10)),
+                ('unit_cost', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('total_cost', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='batch',
+            name='expiry_date',
+            field=models.DateField(blank=True, null=True, verbose_name='Vence'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='shelf_life_days',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Vida útil (días)'),
+        ),
+        migrations.AddField(
+            model_name='production',
+            name='expiry_date',
+            field=models.DateField(blank=True, null=True, verbose_name='Vence'),
+        ),
+        migrations.AddField(
+            model_name='purchaseitem',
+            name='expiry_date',
+            field=models.DateField(blank=True, null=True, verbose_name='Vence'),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='movement_type',
+            field=models.CharField(choices=[('OPENING', 'Saldo Inicial'), ('PURCHASE', 'Compra'), ('PROD_IN', 'Producción (Entrada)'), ('PROD_OUT', 'Consumo en Cocina'), ('SALE', 'Venta'), ('ADJUST', 'Ajuste de Costeo'), ('WASTE', 'Merma (Vencido)')], max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='batch',
+            index=models.Index(condition=models.Q(('current_quantity__gt', 0)), fields=['product', 'expiry_date', 'entry_date'], name='batch_live_fefo_idx'),
+        ),
+        migrations.AddField(
+            model_name='wasterecord',
+            name='batch',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='waste_records', to='inventory.batch'),
+        ),
+        migrations.AddField(
+            model_name='wasterecord',
+            name='movement',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.PROTECT, related_name='waste_record', to='inventory.stockmovement'),
+        ),
+        migrations.AddField(
+            model_name='wasterecord',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='waste_records', to='inventory.product'),
+        ),
+    ]
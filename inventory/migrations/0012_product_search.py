@@ -0,0 +1,59 @@
+# Generated by Django 5.2.8 on 2026-10-19 17:08
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def normalize(text):
+    """ Copia de inventory.models.normalize_search al momento de esta migración """
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    plain = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return ' '.join(plain.lower().split())
+
+
+def fill_search_names(apps, schema_editor):
+    Product = apps.get_model('inventory', 'Product')
+    products = list(Product.objects.only('id', 'name'))
+    for product in products:
+        product.search_name = normalize(product.name)
+    Product.objects.bulk_update(products, ['search_name'], batch_size=1000)
+
+
+def create_trigram_index(apps, schema_editor):
+    """ Solo PostgreSQL: índice GIN de trigramas para LIKE '%...%' y similarity().
+    Crear la extensión pg_trgm requiere permisos sobre la base (o que ya esté creada). """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS product_search_trgm_idx "
+        "ON inventory_product USING gin (search_name gin_trgm_ops)"
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS product_search_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0011_batch_expiry_waste'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_name',
+            field=models.CharField(default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(fill_search_names, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['search_name'], name='product_search_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-19 17:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0005_transaction_archive'),
+        ('inventory', '0012_product_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='purchase',
+            name='cash_register',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='finance.cashregister', verbose_name='Caja Origen'),
+        ),
+        migrations.AlterField(
+            model_name='purchaseitem',
+            name='quantity_bought',
+            field=models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Cantidad'),
+        ),
+        migrations.AlterField(
+            model_name='purchaseitem',
+            name='total_cost',
+            field=models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Costo Total'),
+        ),
+        migrations.AlterField(
+            model_name='purchaseitem',
+            name='unit_bought',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='inventory.unitofmeasure', verbose_name='Unidad'),
+        ),
+        migrations.AlterField(
+            model_name='unitofmeasure',
+            name='name',
+            field=models.CharField(max_length=50, verbose_name='Nombre (Ej: Arroba)'),
+        ),
+    ]
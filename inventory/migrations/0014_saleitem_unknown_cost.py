@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:02
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+
+def forget_unknown_costs(apps, schema_editor):
+    """ Las líneas vendidas antes del kardex no tienen movimiento SALE: su costo quedó en 0
+    sin serlo. Se marcan como desconocidas para que no inflen el margen. """
+    StockMovement = apps.get_model('inventory', 'StockMovement')
+    SaleItem = apps.get_model('inventory', 'SaleItem')
+    consumed = StockMovement.objects.filter(
+        movement_type='SALE', sale_id=OuterRef('sale_id'), product_id=OuterRef('dish_id')
+    )
+    SaleItem.objects.filter(~Exists(consumed)).update(cost_total=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0013_alter_purchase_cash_register_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='saleitem',
+            name='cost_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10, null=True),
+        ),
+        migrations.RunPython(forget_unknown_costs, migrations.RunPython.noop),
+    ]
@@ -1,49 +1,316 @@
-from django.db import models
+import unicodedata
+from datetime import timedelta
+from django.db import models, connection
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
-from django.db.models import Sum
+from django.db import transaction
+from django.db.models import Sum, Max, F, Q, Case, When, Value, DecimalField, FloatField, IntegerField, Func
+from django.utils import timezone
 from finance.models import CashRegister, Transaction, TransactionType, CategoryType
+from core.jobs import enqueue
 
 # --- ENUMS ---
 class BaseUnit(models.TextChoices):
     KILO = 'KG', _('Kg / Litros (Base)')
     UNIT = 'U', _('Unidades (Platos)')
 
+class MovementType(models.TextChoices):
+    OPENING = 'OPENING', _('Saldo Inicial')
+    PURCHASE = 'PURCHASE', _('Compra')
+    PRODUCTION_IN = 'PROD_IN', _('Producción (Entrada)')
+    PRODUCTION_OUT = 'PROD_OUT', _('Consumo en Cocina')
+    SALE = 'SALE', _('Venta')
+    COST_ADJUST = 'ADJUST', _('Ajuste de Costeo')
+    WASTE = 'WASTE', _('Merma (Vencido)')
+
+class WasteReason(models.TextChoices):
+    EXPIRED = 'EXPIRED', _('Vencido')
+
+class CostingMethod(models.TextChoices):
+    FIFO = 'FIFO', _('PEPS (primero en entrar, primero en salir)')
+    AVERAGE = 'AVG', _('Promedio ponderado')
+
 # 1. UNIDADES DE MEDIDA
 class UnitOfMeasure(models.Model):
     name = models.CharField(max_length=50, verbose_name="Nombre (Ej: Arroba)")
     base_unit = models.CharField(max_length=2, choices=BaseUnit.choices)
     conversion_factor = models.DecimalField(max_digits=10, decimal_places=3, default=1)
 
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['name'], name='unit_name_uniq')]
+
     def __str__(self):
         return f"{self.name} ({self.conversion_factor})"
 
 # 2. PRODUCTO
+def normalize_search(text):
+    """ Forma de búsqueda de un nombre: sin tildes, en minúsculas y con espacios simples """
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    plain = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return ' '.join(plain.lower().split())
+
+class ProductQuerySet(models.QuerySet):
+    # Con menos letras los trigramas no sirven: solo se busca por prefijo
+    MIN_CONTAINS = 3
+
+    def matching(self, term):
+        """ Productos cuyo nombre contiene el término (o empieza con él, si es corto),
+        sin distinguir tildes ni mayúsculas """
+        query = normalize_search(term)
+        if not query:
+            return self.none()
+        if len(query) < self.MIN_CONTAINS:
+            return self.filter(self._prefix(query))
+        # PostgreSQL: LIKE '%...%' usa el índice de trigramas (ver migración 0012)
+        return self.filter(search_name__contains=query)
+
+    def search(self, term):
+        """ matching() ordenado por relevancia: primero los que empiezan con el término,
+        luego los que tienen una palabra que empieza con él y al final el resto """
+        query = normalize_search(term)
+        queryset = self.matching(query).annotate(rank=Case(
+            When(self._prefix(query), then=Value(0)),
+            When(search_name__contains=' ' + query, then=Value(1)),
+            default=Value(2), output_field=IntegerField(),
+        ))
+        if connection.vendor == 'postgresql':
+            # Entre los del mismo grupo, el más parecido (pg_trgm) primero
+            queryset = queryset.annotate(similarity=Func(
+                F('search_name'), Value(query), function='similarity', output_field=FloatField()
+            ))
+            return queryset.order_by('rank', '-similarity', 'search_name')
+        return queryset.order_by('rank', 'search_name')
+
+    @staticmethod
+    def _prefix(query):
+        if connection.vendor == 'postgresql':
+            return Q(search_name__startswith=query)  # índice varchar_pattern_ops
+        # SQLite no usa el índice con LIKE sobre una columna binaria; con un rango sí
+        return Q(search_name__gte=query, search_name__lt=query + '\U0010ffff')
+
 class Product(models.Model):
     name = models.CharField(max_length=100)
+    # Nombre normalizado para la búsqueda (normalize_search), se llena al guardar
+    search_name = models.CharField(max_length=100, default='', editable=False)
     is_dish = models.BooleanField(default=False, verbose_name="¿Es Plato?")
     base_unit = models.CharField(max_length=2, choices=BaseUnit.choices, default=BaseUnit.KILO)
     current_stock = models.DecimalField(max_digits=10, decimal_places=3, default=0, editable=False)
     sales_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    reorder_threshold = models.DecimalField(
+        max_digits=10, decimal_places=3, null=True, blank=True, verbose_name="Stock mínimo (alerta)"
+    )
+    costing_method = models.CharField(
+        max_length=4, choices=CostingMethod.choices, default=CostingMethod.FIFO, verbose_name="Método de costeo"
+    )
+    # Vencimiento por defecto de cada lote nuevo (compra o producción); vacío = no vence
+    shelf_life_days = models.PositiveIntegerField(null=True, blank=True, verbose_name="Vida útil (días)")
+    # Promedio ponderado: un único lote "bolsa" lleva la cantidad y el costo promedio del insumo
+    average_batch = models.OneToOneField(
+        'Batch', on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='+'
+    )
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['name'], name='product_name_uniq')]
+        indexes = [
+            # Búsqueda por prefijo; en PostgreSQL con varchar_pattern_ops para que LIKE 'x%' lo use
+            # aunque la base no tenga collation C. El de trigramas se crea en la migración 0012.
+            models.Index(fields=['search_name'], name='product_search_idx', opclasses=['varchar_pattern_ops']),
+        ]
+
+    def clean(self):
+        if self.is_dish and self.costing_method == CostingMethod.AVERAGE:
+            raise ValidationError({'costing_method': "El costo promedio es solo para insumos comprados."})
+
+    def save(self, *args, **kwargs):
+        self.search_name = normalize_search(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'search_name'}
+        super().save(*args, **kwargs)
+
+    def default_expiry(self):
+        """ Vencimiento de un lote que entra hoy según la vida útil del producto """
+        if self.shelf_life_days is None:
+            return None
+        return timezone.localdate() + timedelta(days=self.shelf_life_days)
 
     def recalculate_stock(self):
-        total = self.batches.aggregate(total=Sum('current_quantity'))['total']
+        # Lo vencido no se puede vender ni cocinar: queda en sus lotes hasta la merma, fuera del stock
+        total = self.batches.available().aggregate(total=Sum('current_quantity'))['total']
         self.current_stock = total or 0
-        self.save()
+        self.save(update_fields=['current_stock'])
+        self.check_stock_alert()
+
+    def check_stock_alert(self):
+        """ Abre (una sola vez) o cierra la alerta de stock bajo de ESTE producto """
+        if self.reorder_threshold is None:
+            return
+        open_alerts = StockAlert.objects.filter(product=self, resolved_at__isnull=True)
+        if self.current_stock <= self.reorder_threshold:
+            if not open_alerts.update(stock_level=self.current_stock, threshold=self.reorder_threshold):
+                # El índice único parcial descarta la alerta si otra petición la abrió primero
+                StockAlert.objects.bulk_create([StockAlert(
+                    product=self, threshold=self.reorder_threshold, stock_level=self.current_stock
+                )], ignore_conflicts=True)
+        else:
+            open_alerts.update(resolved_at=timezone.now())
+
+    def consume(self, quantity, movement_type, **source):
+        """ Descuenta 'quantity' de los lotes (PEPS) o del lote bolsa (promedio),
+        anota el kardex y devuelve el costo consumido """
+        with transaction.atomic():
+            if self.costing_method == CostingMethod.AVERAGE:
+                # Una sola fila: la bolsa ya tiene el costo promedio vigente
+                batches = [self.average_pool()]
+            else:
+                batches = self.batches.available().select_for_update()
+            takes = take_from_batches(batches, quantity)
+            cost = 0
+            for batch, take in takes:
+                batch.save(update_fields=['current_quantity'])
+                cost += take * batch.unit_cost
+            StockMovement.objects.bulk_create([
+                StockMovement(
+                    product=self, batch=batch, movement_type=movement_type,
+                    quantity=-take, unit_cost=batch.unit_cost, **source
+                )
+                for batch, take in takes
+            ])
+        return cost
+
+    def receive(self, quantity, unit_cost, movement_type, origin_purchase=None, expiry_date=None, **source):
+        """ Entrada de stock: lote nuevo (PEPS) o se suma a la bolsa recalculando el promedio.
+        La bolsa del costo promedio no lleva vencimiento. """
+        with transaction.atomic():
+            if self.costing_method == CostingMethod.AVERAGE:
+                batch = self.average_pool()
+                total = batch.current_quantity + quantity
+                if total > 0:
+                    batch.unit_cost = (batch.current_quantity * batch.unit_cost + quantity * unit_cost) / total
+                batch.initial_quantity += quantity
+                batch.current_quantity = total
+                batch.save(update_fields=['initial_quantity', 'current_quantity', 'unit_cost'])
+            else:
+                batch = Batch.objects.create(
+                    product=self, initial_quantity=quantity, current_quantity=quantity,
+                    unit_cost=unit_cost, origin_purchase=origin_purchase,
+                    expiry_date=expiry_date or self.default_expiry()
+                )
+            StockMovement.objects.create(
+                product=self, batch=batch, movement_type=movement_type,
+                quantity=quantity, unit_cost=unit_cost, **source
+            )
+        return batch
+
+    def average_pool(self):
+        """ Lote bolsa del costo promedio, bloqueado para esta transacción """
+        if self.average_batch_id is None:
+            self.apply_costing_method()
+        return Batch.objects.select_for_update().get(pk=self.average_batch_id)
+
+    def apply_costing_method(self):
+        """ Deja los lotes como los espera el método de costeo (se llama al cambiarlo).
+        Promedio: los lotes vivos se funden en la bolsa a su costo promedio, con su ajuste en el kardex.
+        PEPS: la bolsa queda como un lote más. """
+        with transaction.atomic():
+            Product.objects.select_for_update().filter(pk=self.pk).exists()
+            if self.costing_method != CostingMethod.AVERAGE:
+                if self.average_batch_id is not None:
+                    self.average_batch = None
+                    self.save(update_fields=['average_batch'])
+                return
+
+            pool = None
+            if self.average_batch_id is not None:
+                pool = Batch.objects.select_for_update().get(pk=self.average_batch_id)
+            live = list(self.batches.available().exclude(pk=self.average_batch_id).select_for_update())
+            if pool is not None and not live:
+                return
+            if pool is None:
+                pool = Batch(product=self, initial_quantity=0, current_quantity=0, unit_cost=0)
+
+            moved = sum((b.current_quantity for b in live), 0)
+            value = sum((b.current_quantity * b.unit_cost for b in live), 0)
+            movements = [
+                StockMovement(
+                    product=self, batch=b, movement_type=MovementType.COST_ADJUST,
+                    quantity=-b.current_quantity, unit_cost=b.unit_cost
+                )
+                for b in live
+            ]
+            Batch.objects.filter(pk__in=[b.pk for b in live]).update(current_quantity=0)
+
+            total = pool.current_quantity + moved
+            if total > 0:
+                pool.unit_cost = (pool.current_quantity * pool.unit_cost + value) / total
+            pool.initial_quantity += moved
+            pool.current_quantity = total
+            pool.save()
+            if moved:
+                movements.append(StockMovement(
+                    product=self, batch=pool, movement_type=MovementType.COST_ADJUST,
+                    quantity=moved, unit_cost=value / moved
+                ))
+            StockMovement.objects.bulk_create(movements)
+            self.average_batch = pool
+            self.save(update_fields=['average_batch'])
 
     def __str__(self):
         return f"{self.name} ({self.current_stock} {self.base_unit})"
 
 # 3. LOTE (BATCH)
+# Primero vence, primero sale; sin vencimiento al final, y entre iguales el más antiguo
+FEFO_ORDER = (F('expiry_date').asc(nulls_last=True), 'entry_date', 'id')
+
+class BatchQuerySet(models.QuerySet):
+    def available(self, on=None):
+        """ Lotes con saldo y sin vencer, en el orden en que se consumen (FEFO) """
+        on = on or timezone.localdate()
+        return self.filter(
+            Q(expiry_date__isnull=True) | Q(expiry_date__gte=on), current_quantity__gt=0
+        ).order_by(*FEFO_ORDER)
+
+    def expired(self, on=None):
+        """ Lotes vencidos que todavía tienen saldo (pendientes de dar de baja) """
+        return self.filter(current_quantity__gt=0, expiry_date__lt=on or timezone.localdate())
+
+def take_from_batches(batches, quantity):
+    """ Reparte 'quantity' entre los lotes en el orden dado. Devuelve [(lote, cantidad_tomada)] """
+    pending = quantity
+    takes = []
+    for b in batches:
+        if pending <= 0: break
+        take = min(b.current_quantity, pending)
+        if take <= 0: continue
+        b.current_quantity -= take
+        pending -= take
+        takes.append((b, take))
+    return takes
+
 class Batch(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='batches')
     initial_quantity = models.DecimalField(max_digits=10, decimal_places=3)
     current_quantity = models.DecimalField(max_digits=10, decimal_places=3)
     unit_cost = models.DecimalField(max_digits=10, decimal_places=2)
     entry_date = models.DateTimeField(auto_now_add=True)
+    expiry_date = models.DateField(null=True, blank=True, verbose_name="Vence")
     origin_purchase = models.ForeignKey('Purchase', on_delete=models.SET_NULL, null=True, blank=True)
+
+    objects = BatchQuerySet.as_manager()
     
-    class Meta: ordering = ['entry_date']
+    class Meta:
+        ordering = ['entry_date']
+        indexes = [
+            # Solo lotes vivos, en el orden FEFO (ASC ya deja los NULL al final en PostgreSQL):
+            # los agotados, que son la mayoría, no pesan en el índice
+            models.Index(
+                fields=['product', 'expiry_date', 'entry_date'],
+                condition=Q(current_quantity__gt=0), name='batch_live_fefo_idx'
+            ),
+        ]
+
     def __str__(self): return f"{self.product.name}: {self.current_quantity}"
 
 # 4. COMPRAS (GASTOS)
@@ -62,6 +329,8 @@ class PurchaseItem(models.Model):
     quantity_bought = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Cantidad")
     unit_bought = models.ForeignKey(UnitOfMeasure, on_delete=models.PROTECT, verbose_name="Unidad")
     total_cost = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Costo Total")
+    # Vacío: se usa la vida útil del producto
+    expiry_date = models.DateField(null=True, blank=True, verbose_name="Vence")
 
     def clean(self):
         """ VALIDACIÓN DE FONDOS EN EL ADMIN """
@@ -87,13 +356,10 @@ class PurchaseItem(models.Model):
         
         super().save(*args, **kwargs)
         
-        # 2. Lote
-        Batch.objects.create(
-            product=self.product,
-            initial_quantity=qty_base,
-            current_quantity=qty_base,
-            unit_cost=u_cost,
-            origin_purchase=self.purchase
+        # 2. Lote (nuevo en PEPS, a la bolsa en costo promedio)
+        self.product.receive(
+            qty_base, u_cost, MovementType.PURCHASE, origin_purchase=self.purchase,
+            expiry_date=self.expiry_date, purchase=self.purchase
         )
         self.product.recalculate_stock()
         
@@ -114,34 +380,194 @@ class Recipe(models.Model):
     dish = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recipe_items', limit_choices_to={'is_dish': True})
     ingredient = models.ForeignKey(Product, on_delete=models.PROTECT, limit_choices_to={'is_dish': False})
     quantity_required = models.DecimalField(max_digits=10, decimal_places=4)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['dish', 'ingredient'], name='recipe_dish_ingredient_uniq')]
+
     def __str__(self): return f"{self.dish.name} -> {self.ingredient.name}"
 
 # 6. PRODUCCIÓN
+class InsufficientStock(ValueError):
+    """ No alcanza el stock de uno o más insumos (ver Production.run_plan) """
+    def __init__(self, shortages):
+        self.shortages = shortages
+        names = ", ".join(s['name'] for s in shortages)
+        super().__init__(f"Stock insuficiente de: {names}")
+
 class Production(models.Model):
     date = models.DateTimeField(auto_now_add=True)
     dish = models.ForeignKey(Product, on_delete=models.PROTECT, limit_choices_to={'is_dish': True})
     quantity_produced = models.PositiveIntegerField()
     total_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
     unit_cost_real = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    # Lote de platos que salió de esta producción (y de ninguna otra)
+    output_batch = models.OneToOneField(
+        Batch, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='production'
+    )
+    # Vacío: se usa la vida útil del plato
+    expiry_date = models.DateField(null=True, blank=True, verbose_name="Vence")
+
+    def update_totals(self, created=False):
+        """ Cierra la producción en una sola pasada, después de cargar todos los insumos:
+        costo total, lote de salida propio, kardex y stock de cada producto tocado.
+        El lote de salida se crea solo con la producción nueva (created=True). """
+        with transaction.atomic():
+            items = list(self.ingredients_used.all())
+            total = sum((item.cost_calculated for item in items), 0)
+            self.total_cost = total
+            if self.quantity_produced > 0: self.unit_cost_real = total / self.quantity_produced
 
-    def update_totals(self):
-        total = sum(item.cost_calculated for item in self.ingredients_used.all())
-        self.total_cost = total
-        if self.quantity_produced > 0: self.unit_cost_real = total / self.quantity_produced
-        self.save()
-
-        batch, created = Batch.objects.get_or_create(
-            product=self.dish, origin_purchase=None, defaults={
-                'initial_quantity': self.quantity_produced, 'current_quantity': self.quantity_produced,
-                'unit_cost': self.unit_cost_real, 'entry_date': self.date
-            }
+            if self.output_batch_id is None and not created:
+                # Producción anterior al lote propio (0008 solo enlazó la última de cada plato):
+                # su lote no se puede identificar, así que solo se corrigen los costos
+                self.save(update_fields=['total_cost', 'unit_cost_real'])
+            else:
+                if self.output_batch_id is None:
+                    batch = Batch.objects.create(
+                        product=self.dish, initial_quantity=self.quantity_produced,
+                        current_quantity=self.quantity_produced, unit_cost=self.unit_cost_real,
+                        expiry_date=self.expiry_date or self.dish.default_expiry()
+                    )
+                else:
+                    # Edición desde el admin: lo que ya se vendió de este lote se respeta
+                    batch = Batch.objects.select_for_update().get(pk=self.output_batch_id)
+                    batch.current_quantity += self.quantity_produced - batch.initial_quantity
+                    batch.initial_quantity = self.quantity_produced
+                    batch.unit_cost = self.unit_cost_real
+                    if self.expiry_date:
+                        batch.expiry_date = self.expiry_date
+                    batch.save(update_fields=['initial_quantity', 'current_quantity', 'unit_cost', 'expiry_date'])
+                self.output_batch = batch
+                self.save(update_fields=['total_cost', 'unit_cost_real', 'output_batch'])
+                self.post_output_movement(batch)
+
+        product_ids = {self.dish_id, *(item.ingredient_id for item in items)}
+        for product in Product.objects.filter(pk__in=product_ids):
+            product.recalculate_stock()
+
+    @classmethod
+    def run_plan(cls, plan):
+        """ Producción de varios platos a la vez según sus recetas: {plato_id: cantidad}.
+        Suma la demanda de cada insumo en todo el plan, la reparte de los lotes en una sola
+        pasada y, si falta algo, rechaza el plan completo antes de tocar nada. """
+        # Platos y recetas de la base, no de la memoria del worker: con esto se escribe
+        dishes = Product.objects.filter(is_dish=True).in_bulk(plan)
+        not_dishes = set(plan) - set(dishes)
+        if not_dishes:
+            raise ValueError(f"No son platos válidos: {sorted(not_dishes)}")
+        recipes = list(
+            Recipe.objects.filter(dish_id__in=plan).order_by('pk')
+            .values_list('dish_id', 'ingredient_id', 'quantity_required')
         )
-        if not created:
-            batch.initial_quantity = self.quantity_produced
-            batch.current_quantity = self.quantity_produced
-            batch.unit_cost = self.unit_cost_real
-            batch.save()
-        self.dish.recalculate_stock()
+        without_recipe = set(plan) - {dish_id for dish_id, _, _ in recipes}
+        if without_recipe:
+            raise ValueError(f"Platos sin receta: {sorted(without_recipe)}")
+
+        order = {dish_id: i for i, dish_id in enumerate(plan)}
+        needs = {}  # insumo -> [(plato, cantidad)] en el orden del plan
+        for dish_id, ingredient_id, per_unit in sorted(recipes, key=lambda r: order[r[0]]):
+            needs.setdefault(ingredient_id, []).append((dish_id, per_unit * plan[dish_id]))
+
+        ingredients = {p.pk: p for p in Product.objects.filter(pk__in=needs)}
+        for product in ingredients.values():
+            if product.costing_method == CostingMethod.AVERAGE and product.average_batch_id is None:
+                product.apply_costing_method()
+
+        with transaction.atomic():
+            fifo = [pk for pk, p in ingredients.items() if p.costing_method != CostingMethod.AVERAGE]
+            pools = [p.average_batch_id for p in ingredients.values() if p.costing_method == CostingMethod.AVERAGE]
+            batches = {}
+            live = Batch.objects.available().filter(product_id__in=fifo)
+            for batch in (
+                Batch.objects.filter(Q(pk__in=live.values('pk')) | Q(pk__in=pools))
+                .order_by(*FEFO_ORDER).select_for_update()
+            ):
+                batches.setdefault(batch.product_id, []).append(batch)
+
+            shortages = []
+            for ingredient_id, lines in needs.items():
+                required = sum(qty for _, qty in lines)
+                available = sum(b.current_quantity for b in batches.get(ingredient_id, []))
+                if available < required:
+                    shortages.append({
+                        'ingredient_id': ingredient_id, 'name': ingredients[ingredient_id].name,
+                        'required': required, 'available': available,
+                    })
+            if shortages:
+                raise InsufficientStock(shortages)
+
+            # Reparto en memoria: cada plato toma sus insumos de los lotes en orden
+            costs = {(dish_id, ingredient_id): 0 for ingredient_id, lines in needs.items() for dish_id, _ in lines}
+            takes = []  # (plato, lote, cantidad)
+            for ingredient_id, lines in needs.items():
+                for dish_id, qty in lines:
+                    for batch, take in take_from_batches(batches[ingredient_id], qty):
+                        costs[(dish_id, ingredient_id)] += take * batch.unit_cost
+                        takes.append((dish_id, batch, take))
+            # A centavos antes de guardar: lo devuelto es lo mismo que queda en la base
+            costs = {key: round(cost, 2) for key, cost in costs.items()}
+
+            totals = {dish_id: 0 for dish_id in plan}
+            for (dish_id, _), cost in costs.items():
+                totals[dish_id] += cost
+            unit_costs = {dish_id: round(totals[dish_id] / qty, 2) for dish_id, qty in plan.items()}
+
+            outputs = Batch.objects.bulk_create([
+                Batch(
+                    product_id=dish_id, initial_quantity=qty, current_quantity=qty, unit_cost=unit_costs[dish_id],
+                    expiry_date=dishes[dish_id].default_expiry()
+                )
+                for dish_id, qty in plan.items()
+            ])
+            productions = cls.objects.bulk_create([
+                cls(dish_id=dish_id, quantity_produced=qty, total_cost=totals[dish_id],
+                    unit_cost_real=unit_costs[dish_id], output_batch=batch)
+                for (dish_id, qty), batch in zip(plan.items(), outputs)
+            ])
+            production_of = {p.dish_id: p for p in productions}
+            ProductionIngredient.objects.bulk_create([
+                ProductionIngredient(
+                    production=production_of[dish_id], ingredient_id=ingredient_id, quantity_used=qty,
+                    cost_calculated=costs[(dish_id, ingredient_id)]
+                )
+                for ingredient_id, lines in needs.items() for dish_id, qty in lines
+            ])
+            touched = {batch.pk: batch for _, batch, _ in takes}
+            Batch.objects.bulk_update(touched.values(), ['current_quantity'])
+            StockMovement.objects.bulk_create([
+                StockMovement(
+                    product_id=batch.product_id, batch=batch, movement_type=MovementType.PRODUCTION_OUT,
+                    quantity=-take, unit_cost=batch.unit_cost, production=production_of[dish_id]
+                )
+                for dish_id, batch, take in takes
+            ] + [
+                StockMovement(
+                    product_id=p.dish_id, batch=p.output_batch, movement_type=MovementType.PRODUCTION_IN,
+                    quantity=p.quantity_produced, unit_cost=p.unit_cost_real, production=p
+                )
+                for p in productions
+            ])
+            # El stock mostrado de platos e insumos se recalcula fuera del request
+            enqueue('inventory.recalculate_stock', {'product_ids': sorted({*plan, *needs})})
+        return productions
+
+    def post_output_movement(self, batch):
+        """ Kardex de la entrada de platos. Como el kardex no se edita, un cambio de
+        costo se anota como reverso del asiento anterior más el asiento nuevo. """
+        last = self.stock_movements.filter(movement_type=MovementType.PRODUCTION_IN).last()
+        if last and last.quantity == self.quantity_produced and last.unit_cost == round(self.unit_cost_real, 2):
+            return
+        movements = []
+        if last and last.quantity > 0:
+            movements.append(StockMovement(
+                product=self.dish, batch=batch, movement_type=MovementType.PRODUCTION_IN,
+                quantity=-last.quantity, unit_cost=last.unit_cost, production=self
+            ))
+        movements.append(StockMovement(
+            product=self.dish, batch=batch, movement_type=MovementType.PRODUCTION_IN,
+            quantity=self.quantity_produced, unit_cost=self.unit_cost_real, production=self
+        ))
+        StockMovement.objects.bulk_create(movements)
 
     def __str__(self): return f"Cocina: +{self.quantity_produced} {self.dish.name}"
 
@@ -152,62 +578,315 @@ class ProductionIngredient(models.Model):
     cost_calculated = models.DecimalField(max_digits=10, decimal_places=2, editable=False, default=0)
 
     def save(self, *args, **kwargs):
+        # Totales, lote y stock se escriben una sola vez en Production.update_totals
         if not self.pk:
-            pending = self.quantity_used
-            cost = 0
-            batches = Batch.objects.filter(product=self.ingredient, current_quantity__gt=0).order_by('entry_date')
-            for b in batches:
-                if pending <= 0: break
-                take = min(b.current_quantity, pending)
-                b.current_quantity -= take
-                pending -= take
-                cost += (take * b.unit_cost)
-                b.save()
-            self.cost_calculated = cost
+            self.cost_calculated = self.ingredient.consume(
+                self.quantity_used, MovementType.PRODUCTION_OUT, production=self.production
+            )
         super().save(*args, **kwargs)
-        self.ingredient.recalculate_stock()
-        self.production.update_totals()
 
 # 7. VENTAS
 class Sale(models.Model):
     date = models.DateTimeField(auto_now_add=True)
     cash_register = models.ForeignKey(CashRegister, on_delete=models.PROTECT)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    # Clave generada por el POS: reintentos y ventas sin conexión no se duplican
+    idempotency_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [models.Index(fields=['date'], name='sale_date_idx')]
+
     def __str__(self): return f"Venta #{self.id}"
 
+    @classmethod
+    def record(cls, cash_register, items, idempotency_key=None, date=None):
+        """ Venta completa en una transacción: líneas (consumen lotes) e ingreso en caja.
+        items: [{'dish': Product, 'quantity': n, 'unit_price': Decimal}]. Con 'date' se
+        respeta la hora en que el POS vendió sin conexión. Una clave repetida lanza IntegrityError. """
+        with transaction.atomic():
+            sale = cls.objects.create(cash_register=cash_register, idempotency_key=idempotency_key)
+            if date is not None:
+                # auto_now_add pisa la fecha al crear
+                cls.objects.filter(pk=sale.pk).update(date=date)
+                sale.date = date
+            for item in items:
+                SaleItem.objects.create(sale=sale, **item)
+            sale.post_income()
+        return sale
+
+    def post_income(self):
+        """ Un solo ingreso en caja por venta, por el total de todas sus líneas """
+        detail = ", ".join(f"{item.quantity} x {item.dish.name}" for item in self.items.select_related('dish'))
+        Transaction.objects.create(
+            cash_register=self.cash_register, type=TransactionType.INCOME,
+            category=CategoryType.SALES, description=f"Venta #{self.id}: {detail}"[:255],
+            amount=self.total_amount
+        )
+        enqueue('inventory.reconcile_sale', {'sale_id': self.id})
+        # El cubo de ventas se pone al día fuera del request, una celda (hora, caja) a la vez
+        period = timezone.localtime(self.date).replace(minute=0, second=0, microsecond=0)
+        enqueue(
+            'inventory.refresh_sales_cube',
+            {'cash_register_id': self.cash_register_id, 'period': period.isoformat()},
+            dedupe_key=f"cube:{self.cash_register_id}:{period:%Y%m%d%H}"
+        )
+
 class SaleItem(models.Model):
     sale = models.ForeignKey(Sale, on_delete=models.CASCADE, related_name='items')
     dish = models.ForeignKey(Product, on_delete=models.PROTECT, limit_choices_to={'is_dish': True})
     quantity = models.PositiveIntegerField()
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
     subtotal = models.DecimalField(max_digits=10, decimal_places=2, editable=False)
+    # Costo FIFO de los lotes que consumió esta línea (para margen bruto).
+    # Vacío: venta anterior al kardex, su costo no se conoce y queda fuera de los márgenes
+    cost_total = models.DecimalField(max_digits=10, decimal_places=2, null=True, default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # En PostgreSQL el reporte de margen por plato se resuelve solo con el índice
+            models.Index(
+                fields=['dish', 'sale'], include=['quantity', 'subtotal', 'cost_total'],
+                name='saleitem_dish_sale_idx'
+            ),
+        ]
 
     def clean(self):
         if self.dish_id:
-            self.dish.recalculate_stock()
-            if self.dish.current_stock < self.quantity:
-                raise ValidationError(f"Stock insuficiente. Quedan {self.dish.current_stock}")
+            # Validamos contra los lotes vivos y sin vencer, sin reescribir el producto
+            available = self.dish.batches.available().aggregate(total=Sum('current_quantity'))['total'] or 0
+            if available < self.quantity:
+                raise ValidationError(f"Stock insuficiente. Quedan {available}")
 
     def save(self, *args, **kwargs):
         self.clean()
         self.subtotal = self.quantity * self.unit_price
         if not self.pk:
-            pending = self.quantity
-            batches = Batch.objects.filter(product=self.dish, current_quantity__gt=0).order_by('entry_date')
-            for b in batches:
-                if pending <= 0: break
-                take = min(b.current_quantity, pending)
-                b.current_quantity -= take
-                pending -= take
-                b.save()
+            self.cost_total = self.dish.consume(self.quantity, MovementType.SALE, sale=self.sale)
         super().save(*args, **kwargs)
-        self.dish.recalculate_stock()
+        # El stock mostrado del plato se recalcula fuera del request
+        enqueue('inventory.recalculate_stock', {'product_ids': [self.dish_id]}, dedupe_key=f"stock:{self.dish_id}")
         self.sale.total_amount += self.subtotal
         self.sale.save()
-        
-        if not Transaction.objects.filter(description__contains=f"Venta #{self.sale.id}", type=TransactionType.INCOME).exists():
-             Transaction.objects.create(
-                cash_register=self.sale.cash_register, type=TransactionType.INCOME,
-                category=CategoryType.SALES, description=f"Venta #{self.sale.id}: {self.quantity} x {self.dish.name}",
-                amount=self.subtotal
-            )   
\ No newline at end of file
+
+# 7.1 CUBO DE VENTAS (PREAGREGADO PARA ANALÍTICA)
+class SalesCubeQuerySet(models.QuerySet):
+    def rollup(self, group_by):
+        """ Totales por la dimensión pedida (ver SalesCube.GROUPS), en una sola consulta agrupada """
+        columns = self.model.GROUPS[group_by]
+        return (
+            self.values(*columns)
+            .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'), cost=Sum('cost'), lines=Sum('lines'))
+            .order_by(*columns)
+        )
+
+class SalesCube(models.Model):
+    """ Ventas por hora local, plato y caja. Lo mantiene la cola de trabajos (una celda por
+    venta nueva) y se reconstruye con el comando rebuild_sales_cube """
+    period = models.DateTimeField()  # inicio de la hora local
+    date = models.DateField()
+    hour = models.PositiveSmallIntegerField()
+    weekday = models.PositiveSmallIntegerField()  # 1 = lunes ... 7 = domingo
+    dish = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    cash_register = models.ForeignKey(CashRegister, on_delete=models.CASCADE, related_name='+')
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cost = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    lines = models.PositiveIntegerField(default=0)
+
+    objects = SalesCubeQuerySet.as_manager()
+
+    GROUPS = {
+        'dish': ('dish_id', 'dish__name'),
+        'hour': ('hour',),
+        'day': ('date',),
+        'weekday': ('weekday',),
+        'heatmap': ('weekday', 'hour'),
+        'register': ('cash_register_id', 'cash_register__terminal', 'cash_register__date'),
+        'cashier': ('cash_register__opened_by__username',),
+    }
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'cash_register', 'dish'], name='salescube_cell_uniq'),
+        ]
+        indexes = [models.Index(fields=['date', 'dish'], name='salescube_date_dish_idx')]
+
+    @classmethod
+    def refresh(cls, since=None, until=None, cash_register_id=None):
+        """ Recalcula desde las líneas de venta las celdas de [since, until) (horas completas),
+        opcionalmente de una sola caja. Sin rango, todo el cubo. Devuelve cuántas celdas quedaron. """
+        items = SaleItem.objects.all()
+        cells = cls.objects.all()
+        if since is not None:
+            items = items.filter(sale__date__gte=since)
+            cells = cells.filter(period__gte=since)
+        if until is not None:
+            items = items.filter(sale__date__lt=until)
+            cells = cells.filter(period__lt=until)
+        if cash_register_id is not None:
+            items = items.filter(sale__cash_register_id=cash_register_id)
+            cells = cells.filter(cash_register_id=cash_register_id)
+
+        # La hora local se calcula aquí y no en SQL (en SQLite sería una función Python por fila)
+        tz = timezone.get_current_timezone()
+        grid = {}
+        with transaction.atomic():
+            rows = items.values_list(
+                'sale__date', 'sale__cash_register_id', 'dish_id', 'quantity', 'subtotal', 'cost_total'
+            )
+            for moment, register_id, dish_id, quantity, subtotal, cost in rows.iterator(chunk_size=5000):
+                period = moment.astimezone(tz).replace(minute=0, second=0, microsecond=0)
+                cell = grid.setdefault((period, register_id, dish_id), [0, 0, 0, 0])
+                cell[0] += quantity
+                cell[1] += subtotal
+                cell[2] += cost or 0
+                cell[3] += 1
+            cells.delete()
+            cls.objects.bulk_create([
+                cls(
+                    period=period, date=period.date(), hour=period.hour, weekday=period.isoweekday(),
+                    cash_register_id=register_id, dish_id=dish_id,
+                    quantity=quantity, revenue=revenue, cost=cost, lines=lines
+                )
+                for (period, register_id, dish_id), (quantity, revenue, cost, lines) in grid.items()
+            ], batch_size=1000)
+        return len(grid)
+
+# 8. ALERTAS DE STOCK BAJO
+class StockAlert(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_alerts')
+    threshold = models.DecimalField(max_digits=10, decimal_places=3)
+    stock_level = models.DecimalField(max_digits=10, decimal_places=3)
+    created_at = models.DateTimeField(auto_now_add=True)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            # Una sola alerta abierta por producto
+            models.UniqueConstraint(
+                fields=['product'], condition=models.Q(resolved_at__isnull=True), name='stockalert_open_uniq'
+            ),
+        ]
+
+    def __str__(self): return f"Stock bajo: {self.product.name} ({self.stock_level} <= {self.threshold})"
+
+# 9. KARDEX (MOVIMIENTOS DE STOCK, SOLO SE AGREGA)
+class StockMovementQuerySet(models.QuerySet):
+    def position_at(self, when):
+        """ Stock y valor por producto en un instante: último corte + cola de movimientos.
+        Devuelve {product_id: (cantidad, valor)} """
+        position = {}
+        last = StockCheckpoint.objects.filter(taken_at__lte=when).aggregate(last=Max('taken_at'))['last']
+        tail = self.filter(timestamp__lte=when)
+        if last:
+            for product_id, qty, value in StockCheckpoint.objects.filter(taken_at=last).values_list(
+                'product_id', 'quantity', 'value'
+            ):
+                position[product_id] = (qty, value)
+            tail = tail.filter(timestamp__gt=last)
+
+        rows = tail.values('product_id').annotate(
+            qty=Sum('quantity'),
+            value=Sum(F('quantity') * F('unit_cost'), output_field=DecimalField(max_digits=14, decimal_places=3)),
+        ).order_by()
+        for row in rows:
+            qty, value = position.get(row['product_id'], (0, 0))
+            position[row['product_id']] = (qty + row['qty'], value + row['value'])
+        return position
+
+class StockMovement(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='movements')
+    batch = models.ForeignKey(Batch, on_delete=models.SET_NULL, null=True, blank=True, related_name='movements')
+    movement_type = models.CharField(max_length=10, choices=MovementType.choices)
+    quantity = models.DecimalField(max_digits=12, decimal_places=3)  # + entra / - sale
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2)
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    # Origen del movimiento (solo uno va lleno)
+    purchase = models.ForeignKey(Purchase, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements')
+    production = models.ForeignKey(Production, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements')
+    sale = models.ForeignKey(Sale, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements')
+
+    objects = StockMovementQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['timestamp', 'id']
+        indexes = [
+            models.Index(fields=['product', 'timestamp'], name='movement_product_time_idx'),
+            models.Index(fields=['timestamp'], name='movement_time_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ValueError("El kardex no se edita: registra un movimiento nuevo.")
+        super().save(*args, **kwargs)
+
+    def __str__(self): return f"{self.get_movement_type_display()}: {self.quantity} (Producto #{self.product_id})"
+
+class StockCheckpoint(models.Model):
+    """ Corte periódico del kardex para no sumar toda la historia en cada consulta """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='checkpoints')
+    taken_at = models.DateTimeField(db_index=True)
+    quantity = models.DecimalField(max_digits=12, decimal_places=3)
+    value = models.DecimalField(max_digits=14, decimal_places=3)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'taken_at'], name='checkpoint_product_time_uniq'),
+        ]
+
+    @classmethod
+    def take(cls, when=None):
+        """ Congela la posición de todos los productos en 'when' (por defecto, ahora) """
+        when = when or timezone.now()
+        position = StockMovement.objects.position_at(when)
+        cls.objects.bulk_create([
+            cls(product_id=product_id, taken_at=when, quantity=qty, value=value)
+            for product_id, (qty, value) in position.items()
+        ])
+        return when
+
+# 10. MERMAS (LOTES DADOS DE BAJA)
+class WasteRecord(models.Model):
+    batch = models.ForeignKey(Batch, on_delete=models.PROTECT, related_name='waste_records')
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='waste_records')
+    movement = models.OneToOneField(StockMovement, on_delete=models.PROTECT, related_name='waste_record')
+    reason = models.CharField(max_length=10, choices=WasteReason.choices, default=WasteReason.EXPIRED)
+    quantity = models.DecimalField(max_digits=10, decimal_places=3)
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2)
+    total_cost = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self): return f"Merma: {self.quantity} {self.product.name} ({self.get_reason_display()})"
+
+    @classmethod
+    def write_off_expired(cls, on=None):
+        """ Da de baja en bloque los lotes vencidos a la fecha 'on' (por defecto, hoy):
+        su saldo pasa a la merma con un movimiento WASTE en el kardex. Devuelve las mermas. """
+        now = timezone.now()
+        with transaction.atomic():
+            batches = list(Batch.objects.expired(on).select_for_update())
+            if not batches:
+                return []
+            movements = StockMovement.objects.bulk_create([
+                StockMovement(
+                    product_id=b.product_id, batch=b, movement_type=MovementType.WASTE,
+                    quantity=-b.current_quantity, unit_cost=b.unit_cost, timestamp=now
+                )
+                for b in batches
+            ])
+            records = cls.objects.bulk_create([
+                cls(
+                    batch=b, product_id=b.product_id, movement=movement, reason=WasteReason.EXPIRED,
+                    quantity=b.current_quantity, unit_cost=b.unit_cost,
+                    total_cost=round(b.current_quantity * b.unit_cost, 2), created_at=now
+                )
+                for b, movement in zip(batches, movements)
+            ])
+            Batch.objects.filter(pk__in=[b.pk for b in batches]).update(current_quantity=0)
+            enqueue('inventory.recalculate_stock', {'product_ids': sorted({b.product_id for b in batches})})
+        return records
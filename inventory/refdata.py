@@ -0,0 +1,26 @@
+""" Conjuntos de referencia del inventario que cada worker mantiene en memoria (core.refdata) """
+from core.refdata import reference
+from .models import Product, Recipe, UnitOfMeasure
+
+# Escrituras frecuentes que no cambian lo que se guarda en memoria
+STOCK_FIELDS = ('current_stock', 'average_batch')
+
+
+@reference('inventory.units', models=[UnitOfMeasure])
+def units():
+    return {unit.pk: unit for unit in UnitOfMeasure.objects.all()}
+
+
+@reference('inventory.dishes', models=[Product], ignore_fields=STOCK_FIELDS)
+def dishes():
+    """ La carta: {pk: Product} de los platos """
+    return {dish.pk: dish for dish in Product.objects.filter(is_dish=True)}
+
+
+@reference('inventory.recipes', models=[Recipe])
+def recipes():
+    """ {plato_id: [(insumo_id, cantidad por plato), ...]} """
+    by_dish = {}
+    for dish_id, ingredient_id, quantity in Recipe.objects.values_list('dish_id', 'ingredient_id', 'quantity_required'):
+        by_dish.setdefault(dish_id, []).append((ingredient_id, quantity))
+    return by_dish
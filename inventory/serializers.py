@@ -1,50 +1,179 @@
+import copy
+import csv
+import io
 from rest_framework import serializers
-from django.db import transaction
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction, IntegrityError
 from .models import (
     Product, Sale, SaleItem, Purchase, UnitOfMeasure, 
-    Production, ProductionIngredient, PurchaseItem
+    Production, ProductionIngredient, PurchaseItem, StockMovement, Recipe, BaseUnit, StockAlert,
+    CostingMethod, normalize_search
 )
+from django.utils import timezone
 from finance.models import CashRegister
+from finance.serializers import CashRegisterBriefSerializer
+from backend_restaurant.fieldsets import SparseFieldsMixin
+from core import refdata
+
+# 0. IDS RESUELTOS CONTRA LOS DATOS EN MEMORIA DEL WORKER (core.refdata)
+class CachedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """ Resuelve el id contra un conjunto en memoria ({pk: instancia}) en vez de hacer una
+    consulta por valor. El queryset solo se usa para los formularios del API navegable y
+    debe describir el mismo conjunto. La instancia sirve para validar: antes de escribir
+    se relee de la base con fresh_instances(). """
+
+    def __init__(self, reference_name, **kwargs):
+        self.reference_name = reference_name
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        instance = refdata.get(self.reference_name).get(pk)
+        if instance is None:
+            self.fail('does_not_exist', pk_value=data)
+        # Copia: la instancia compartida no debe recibir cambios de este request
+        return copy.copy(instance)
+
+
+def fresh_instances(queryset, pks):
+    """ {pk: instancia} leídos de la base en una consulta; los que ya no están en el
+    queryset (borrados desde que se cargó la memoria) se rechazan """
+    found = queryset.in_bulk(set(pks))
+    missing = sorted(set(pks) - set(found))
+    if missing:
+        raise serializers.ValidationError({'detail': f"Ya no existen: {missing}"})
+    return found
 
 # 1. SERIALIZERS BÁSICOS
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
-        fields = '__all__'
+        exclude = ['search_name']
+
+    def validate(self, attrs):
+        is_dish = attrs.get('is_dish', getattr(self.instance, 'is_dish', False))
+        method = attrs.get('costing_method', getattr(self.instance, 'costing_method', CostingMethod.FIFO))
+        if is_dish and method == CostingMethod.AVERAGE:
+            raise serializers.ValidationError({'costing_method': "El costo promedio es solo para insumos comprados."})
+        return attrs
 
-class UnitSerializer(serializers.ModelSerializer):
+    def update(self, instance, validated_data):
+        previous_method = instance.costing_method
+        product = super().update(instance, validated_data)
+        if product.costing_method != previous_method:
+            product.apply_costing_method()
+        if 'reorder_threshold' in validated_data:
+            if product.reorder_threshold is None:
+                product.stock_alerts.filter(resolved_at__isnull=True).update(resolved_at=timezone.now())
+            else:
+                product.check_stock_alert()
+        return product
+
+class UnitSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = UnitOfMeasure
         fields = '__all__'
 
 # 2. SERIALIZERS DE VENTAS (POS)
 class SaleItemSerializer(serializers.ModelSerializer):
-    dish_id = serializers.PrimaryKeyRelatedField(queryset=Product.objects.filter(is_dish=True), source='dish')
+    # La carta está en memoria del worker: sin consulta por línea de venta
+    dish_id = CachedPrimaryKeyRelatedField(
+        'inventory.dishes', queryset=Product.objects.filter(is_dish=True), source='dish'
+    )
     class Meta:
         model = SaleItem
         fields = ['dish_id', 'quantity', 'unit_price']
 
-class SaleSerializer(serializers.ModelSerializer):
+class SaleSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     items = SaleItemSerializer(many=True)
     cash_register = serializers.PrimaryKeyRelatedField(read_only=True) 
+    idempotency_key = serializers.CharField(max_length=64, required=False, allow_null=True)
+    expandable_fields = {'cash_register': (CashRegisterBriefSerializer, {})}
 
     class Meta:
         model = Sale
-        fields = ['id', 'cash_register', 'total_amount', 'items']
+        fields = ['id', 'cash_register', 'total_amount', 'idempotency_key', 'items']
 
     def create(self, validated_data):
-        caja_abierta = CashRegister.objects.filter(is_closed=False).last()
+        # Cada cajero/terminal vende sobre su propia caja abierta
+        caja_abierta = CashRegister.objects.for_request(self.context['request'])
         if not caja_abierta:
-            raise serializers.ValidationError({"error": "¡No hay ninguna CAJA ABIERTA!"})
+            raise serializers.ValidationError({"error": "¡No hay ninguna CAJA ABIERTA en esta terminal!"})
 
-        validated_data['cash_register'] = caja_abierta
-        items_data = validated_data.pop('items')
-        
+        items = validated_data['items']
+        dishes = fresh_instances(Product.objects.filter(is_dish=True), [item['dish'].pk for item in items])
+        items = [{**item, 'dish': dishes[item['dish'].pk]} for item in items]
+        return Sale.record(caja_abierta, items, idempotency_key=validated_data.get('idempotency_key'))
+
+# 2.1 SINCRONIZACIÓN DE VENTAS HECHAS SIN CONEXIÓN
+class SaleSyncItemSerializer(serializers.Serializer):
+    dish_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+    unit_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+class SaleSyncEntrySerializer(serializers.Serializer):
+    idempotency_key = serializers.CharField(max_length=64)
+    date = serializers.DateTimeField(required=False, help_text="Hora en que el POS hizo la venta")
+    items = SaleSyncItemSerializer(many=True, allow_empty=False)
+
+    def validate_date(self, value):
+        if value > timezone.now():
+            raise serializers.ValidationError("La fecha de la venta no puede estar en el futuro.")
+        return value
+
+class SaleSyncSerializer(serializers.Serializer):
+    """ Cola de ventas de un POS que estuvo sin conexión, en el orden en que se hicieron """
+    sales = SaleSyncEntrySerializer(many=True, allow_empty=False, max_length=500)
+
+    def create(self, validated_data):
+        caja = validated_data['cash_register']
+        entries = validated_data['sales']
+        # Claves ya registradas y platos de toda la cola, una consulta cada uno
+        known = dict(
+            Sale.objects.filter(idempotency_key__in=[e['idempotency_key'] for e in entries])
+            .values_list('idempotency_key', 'id')
+        )
+        dishes = Product.objects.filter(is_dish=True).in_bulk(
+            {item['dish_id'] for entry in entries for item in entry['items']}
+        )
+
+        results = []
         with transaction.atomic():
-            sale = Sale.objects.create(**validated_data)
-            for item_data in items_data:
-                SaleItem.objects.create(sale=sale, **item_data)
-        return sale
+            for entry in entries:
+                key = entry['idempotency_key']
+                result = {'idempotency_key': key}
+                results.append(result)
+                if key in known:
+                    result.update(status='duplicate', sale_id=known[key])
+                    continue
+                missing = sorted({item['dish_id'] for item in entry['items']} - set(dishes))
+                if missing:
+                    result.update(status='rejected', error=f"No son platos válidos: {missing}")
+                    continue
+                items = [
+                    {'dish': dishes[item['dish_id']], 'quantity': item['quantity'], 'unit_price': item['unit_price']}
+                    for item in entry['items']
+                ]
+                # Cada venta en su propio savepoint: una rechazada no tumba a las demás
+                try:
+                    sale = Sale.record(caja, items, idempotency_key=key, date=entry.get('date'))
+                except IntegrityError:
+                    # Otra sincronización de la misma cola la registró primero
+                    sale_id = Sale.objects.filter(idempotency_key=key).values_list('id', flat=True).first()
+                    result.update(status='duplicate', sale_id=sale_id)
+                except DjangoValidationError as e:
+                    result.update(status='rejected', error="; ".join(e.messages))
+                except ValueError as e:
+                    result.update(status='rejected', error=str(e))
+                else:
+                    known[key] = sale.id
+                    result.update(status='created', sale_id=sale.id, total_amount=sale.total_amount)
+        return results
 
 # 3. SERIALIZERS DE COMPRAS (EL ARREGLO IMPORTANTE) 🛒
 class PurchaseItemSerializer(serializers.ModelSerializer):
@@ -52,19 +181,20 @@ class PurchaseItemSerializer(serializers.ModelSerializer):
     product_id = serializers.PrimaryKeyRelatedField(
         queryset=Product.objects.filter(is_dish=False), source='product'
     )
-    unit_id = serializers.PrimaryKeyRelatedField(
-        queryset=UnitOfMeasure.objects.all(), source='unit_bought'
+    unit_id = CachedPrimaryKeyRelatedField(
+        'inventory.units', queryset=UnitOfMeasure.objects.all(), source='unit_bought'
     )
 
     class Meta:
         model = PurchaseItem
-        fields = ['product_id', 'unit_id', 'quantity_bought', 'total_cost']
+        fields = ['product_id', 'unit_id', 'quantity_bought', 'total_cost', 'expiry_date']
 
-class PurchaseSerializer(serializers.ModelSerializer):
+class PurchaseSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     items = PurchaseItemSerializer(many=True) # Nested write
     cash_register = serializers.PrimaryKeyRelatedField(
         queryset=CashRegister.objects.filter(is_closed=False)
     )
+    expandable_fields = {'cash_register': (CashRegisterBriefSerializer, {})}
     
     class Meta:
         model = Purchase
@@ -84,6 +214,11 @@ class PurchaseSerializer(serializers.ModelSerializer):
                 "detail": f"¡Fondos Insuficientes! La caja tiene {saldo_actual} Bs, intentas gastar {total_gasto} Bs."
             })
 
+        # El factor de conversión se toma de la base, no de las unidades en memoria
+        units = fresh_instances(UnitOfMeasure.objects.all(), [item['unit_bought'].pk for item in items_data])
+        for item_data in items_data:
+            item_data['unit_bought'] = units[item_data['unit_bought'].pk]
+
         # 2. GUARDADO ATÓMICO (Todo o Nada)
         with transaction.atomic():
             purchase = Purchase.objects.create(**validated_data)
@@ -107,15 +242,16 @@ class ProductionIngredientSerializer(serializers.ModelSerializer):
         model = ProductionIngredient
         fields = ['ingredient_id', 'quantity_used']
 
-class ProductionSerializer(serializers.ModelSerializer):
+class ProductionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     dish_id = serializers.PrimaryKeyRelatedField(
         queryset=Product.objects.filter(is_dish=True), source='dish'
     )
     ingredients_used = ProductionIngredientSerializer(many=True)
+    expandable_fields = {'dish': (ProductSerializer, {})}
 
     class Meta:
         model = Production
-        fields = ['id', 'date', 'dish_id', 'quantity_produced', 'ingredients_used']
+        fields = ['id', 'date', 'dish_id', 'quantity_produced', 'expiry_date', 'ingredients_used']
 
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredients_used')
@@ -123,5 +259,191 @@ class ProductionSerializer(serializers.ModelSerializer):
             production = Production.objects.create(**validated_data)
             for item_data in ingredients_data:
                 ProductionIngredient.objects.create(production=production, **item_data)
-            production.update_totals()
-        return production
\ No newline at end of file
+            production.update_totals(created=True)
+        return production
+
+class ProductionPlanItemSerializer(serializers.Serializer):
+    dish_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+class ProductionPlanSerializer(serializers.Serializer):
+    """ Plan de cocina del día: varios platos a la vez, insumos según sus recetas """
+    items = ProductionPlanItemSerializer(many=True, allow_empty=False)
+
+    def validate_items(self, items):
+        plan = {}
+        for item in items:
+            # El mismo plato dos veces en el plan se suma
+            plan[item['dish_id']] = plan.get(item['dish_id'], 0) + item['quantity']
+        # Contra la carta en memoria, no una consulta por línea
+        missing = sorted(set(plan) - set(refdata.get('inventory.dishes')))
+        if missing:
+            raise serializers.ValidationError(f"No son platos válidos: {missing}")
+        return plan
+
+    def create(self, validated_data):
+        return Production.run_plan(validated_data['items'])
+
+# 5. KARDEX
+class StockMovementSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {'product': (ProductSerializer, {})}
+
+    class Meta:
+        model = StockMovement
+        fields = [
+            'id', 'timestamp', 'product', 'batch', 'movement_type', 'quantity',
+            'unit_cost', 'purchase', 'production', 'sale'
+        ]
+
+class StockAlertSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.name', read_only=True)
+    expandable_fields = {'product': (ProductSerializer, {})}
+
+    class Meta:
+        model = StockAlert
+        fields = ['id', 'product', 'product_name', 'threshold', 'stock_level', 'created_at', 'resolved_at']
+
+# 6. CARGA MASIVA DEL CATÁLOGO (unidades, insumos, platos y recetas)
+class CatalogUnitSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=50)
+    base_unit = serializers.ChoiceField(choices=BaseUnit.choices)
+    conversion_factor = serializers.DecimalField(max_digits=10, decimal_places=3, default=1)
+
+# Sin base_unit / sales_price se conserva lo que ya tiene el producto (o el valor por defecto si es nuevo)
+class CatalogProductSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=100)
+    base_unit = serializers.ChoiceField(choices=BaseUnit.choices, required=False)
+
+class CatalogDishSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=100)
+    sales_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+
+class CatalogRecipeSerializer(serializers.Serializer):
+    dish = serializers.CharField(max_length=100)
+    ingredient = serializers.CharField(max_length=100)
+    quantity_required = serializers.DecimalField(max_digits=10, decimal_places=4)
+
+class CatalogSerializer(serializers.Serializer):
+    """ Upsert del catálogo completo en una transacción. Se puede repetir sin duplicar nada:
+    las recetas de cada plato enviado quedan exactamente como vienen en el catálogo. """
+    units = CatalogUnitSerializer(many=True, required=False, default=list)
+    products = CatalogProductSerializer(many=True, required=False, default=list)
+    dishes = CatalogDishSerializer(many=True, required=False, default=list)
+    recipes = CatalogRecipeSerializer(many=True, required=False, default=list)
+
+    CSV_RECORDS = {'unit': 'units', 'product': 'products', 'dish': 'dishes', 'recipe': 'recipes'}
+
+    @classmethod
+    def from_csv(cls, text):
+        """ Convierte un CSV con columna 'record' (unit/product/dish/recipe) al formato JSON """
+        data = {key: [] for key in cls.CSV_RECORDS.values()}
+        for row in csv.DictReader(io.StringIO(text)):
+            key = cls.CSV_RECORDS.get((row.pop('record', '') or '').strip().lower())
+            if key is None:
+                raise serializers.ValidationError({"record": "Cada fila debe ser unit, product, dish o recipe."})
+            data[key].append({k: v for k, v in row.items() if k and v not in (None, '')})
+        return data
+
+    def validate(self, attrs):
+        product_names = [p['name'] for p in attrs['products']]
+        dish_names = [d['name'] for d in attrs['dishes']]
+        repeated = set(product_names) & set(dish_names)
+        if repeated:
+            raise serializers.ValidationError(
+                {"dishes": f"Estos nombres vienen como insumo y como plato: {', '.join(sorted(repeated))}"}
+            )
+
+        # Tipo (plato o insumo) de todo lo que ya existe en la BD, en una consulta
+        wanted = {r['dish'] for r in attrs['recipes']} | {r['ingredient'] for r in attrs['recipes']}
+        existing = dict(
+            Product.objects.filter(name__in=wanted | set(product_names) | set(dish_names)).values_list('name', 'is_dish')
+        )
+        # Un plato con recetas, ventas y lotes no se convierte en insumo (ni al revés) desde un archivo
+        errors = {}
+        as_dish = sorted(name for name in set(product_names) if existing.get(name) is True)
+        if as_dish:
+            errors['products'] = [f"Ya existen como platos: {', '.join(as_dish)}"]
+        as_ingredient = sorted(name for name in set(dish_names) if existing.get(name) is False)
+        if as_ingredient:
+            errors['dishes'] = [f"Ya existen como insumos: {', '.join(as_ingredient)}"]
+        unpriced = sorted({d['name'] for d in attrs['dishes'] if 'sales_price' not in d and d['name'] not in existing})
+        if unpriced:
+            errors.setdefault('dishes', []).append(f"Platos nuevos sin precio de venta: {', '.join(unpriced)}")
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        # Los nombres de las recetas deben existir en el catálogo o ya en la BD
+        known = {name: is_dish for name, is_dish in existing.items() if name in wanted}
+        known.update({name: False for name in product_names})
+        known.update({name: True for name in dish_names})
+        problems = []
+        for r in attrs['recipes']:
+            if known.get(r['dish']) is not True:
+                problems.append(f"'{r['dish']}' no es un plato del catálogo.")
+            if known.get(r['ingredient']) is not False:
+                problems.append(f"'{r['ingredient']}' no es un insumo del catálogo.")
+        if problems:
+            raise serializers.ValidationError({"recipes": sorted(set(problems))})
+        return attrs
+
+    def create(self, validated_data):
+        # Un nombre repetido en el archivo cuenta una sola vez (gana la última fila),
+        # PostgreSQL no permite que un mismo upsert toque dos veces la misma fila
+        units = list({u['name']: u for u in validated_data['units']}.values())
+        products = list({p['name']: p for p in validated_data['products']}.values())
+        dishes = list({d['name']: d for d in validated_data['dishes']}.values())
+        recipes = validated_data['recipes']
+
+        with transaction.atomic():
+            UnitOfMeasure.objects.bulk_create(
+                [UnitOfMeasure(**u) for u in units],
+                update_conflicts=True, unique_fields=['name'],
+                update_fields=['base_unit', 'conversion_factor'],
+            )
+            # bulk_create no pasa por Product.save: el nombre de búsqueda se arma aquí.
+            # Cada grupo actualiza solo los campos que trae; is_dish nunca cambia (ver validate)
+            rows = [
+                (Product(name=p['name'], base_unit=p.get('base_unit', BaseUnit.KILO), is_dish=False),
+                 ['base_unit'] if 'base_unit' in p else [])
+                for p in products
+            ] + [
+                (Product(name=d['name'], base_unit=BaseUnit.UNIT, is_dish=True, sales_price=d.get('sales_price')),
+                 ['sales_price'] if 'sales_price' in d else [])
+                for d in dishes
+            ]
+            groups = {}
+            for product, fields in rows:
+                product.search_name = normalize_search(product.name)
+                groups.setdefault(tuple(fields), []).append(product)
+            for fields, group in groups.items():
+                Product.objects.bulk_create(
+                    group, update_conflicts=True, unique_fields=['name'], update_fields=[*fields, 'search_name']
+                )
+
+            if recipes:
+                names = {r['dish'] for r in recipes} | {r['ingredient'] for r in recipes}
+                ids = dict(Product.objects.filter(name__in=names).values_list('name', 'id'))
+                lines = {
+                    (ids[r['dish']], ids[r['ingredient']]): r['quantity_required'] for r in recipes
+                }
+                # La receta enviada reemplaza a la anterior del plato
+                existing = Recipe.objects.filter(dish_id__in={d for d, _ in lines}).values_list('id', 'dish_id', 'ingredient_id')
+                stale = [pk for pk, d, i in existing if (d, i) not in lines]
+                if stale:
+                    Recipe.objects.filter(pk__in=stale).delete()
+                Recipe.objects.bulk_create(
+                    [Recipe(dish_id=d, ingredient_id=i, quantity_required=q) for (d, i), q in lines.items()],
+                    update_conflicts=True, unique_fields=['dish', 'ingredient'],
+                    update_fields=['quantity_required'],
+                )
+            # Las escrituras masivas no disparan señales: los workers recargan la carta aquí
+            refdata.bump('inventory.units', 'inventory.dishes', 'inventory.recipes')
+
+        return {
+            "units": len(units), "products": len(products),
+            "dishes": len(dishes), "recipes": len(recipes),
+        }
+
+    def to_representation(self, instance):
+        return instance
+
@@ -1,3 +1,662 @@
-from django.test import TestCase
+from datetime import datetime, time, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core import refdata
+from core.jobs import claim, run_job, run_pending
+from finance.models import CashRegister, CategoryType, Transaction, TransactionType
+from .forecast import production_plan
+from .models import (
+    Batch, BaseUnit, CostingMethod, MovementType, Product, Production, Recipe, Sale, SaleItem, SalesCube, StockAlert,
+    StockCheckpoint, StockMovement, UnitOfMeasure, WasteRecord, normalize_search
+)
+
+
+def sales_fixture(stock=100):
+    """ Cajero con su caja abierta en la terminal POS, un insumo y un plato (con receta)
+    con un lote de apertura cada uno """
+    user = User.objects.create_superuser('cajero', password='x')
+    ingredient = Product.objects.create(name='Arroz', base_unit=BaseUnit.KILO)
+    dish = Product.objects.create(name='Majadito', is_dish=True, base_unit=BaseUnit.UNIT, sales_price=Decimal('10'))
+    Recipe.objects.create(dish=dish, ingredient=ingredient, quantity_required=Decimal('0.1'))
+    register = CashRegister.objects.create(start_amount=Decimal('1000'), opened_by=user, terminal='POS')
+    for product, cost in ((ingredient, Decimal('1')), (dish, Decimal('3'))):
+        product.receive(Decimal(stock), cost, MovementType.OPENING)
+        product.recalculate_stock()
+    return {'user': user, 'ingredient': ingredient, 'dish': dish, 'register': register}
+
+
+class LedgerAssertions:
+    def assertStockMatchesLedger(self, product):
+        """ Stock = lotes vigentes, y el kardex suma lo mismo que los lotes """
+        product.refresh_from_db()
+        batches = Batch.objects.filter(product=product)
+        self.assertEqual(product.current_stock, batches.available().aggregate(t=Sum('current_quantity'))['t'] or 0)
+        self.assertEqual(
+            StockMovement.objects.filter(product=product).aggregate(t=Sum('quantity'))['t'] or 0,
+            batches.aggregate(t=Sum('current_quantity'))['t'] or 0
+        )
+        self.assertFalse(batches.filter(current_quantity__lt=0).exists())
+
+    def assertRegisterMatchesSales(self, register):
+        """ Cada venta entra una vez a la caja, por el total de sus líneas """
+        for sale in Sale.objects.filter(cash_register=register):
+            self.assertEqual(sale.total_amount, sale.items.aggregate(t=Sum('subtotal'))['t'])
+        income = Transaction.objects.filter(
+            cash_register=register, type=TransactionType.INCOME, category=CategoryType.SALES
+        ).aggregate(t=Sum('amount'))['t'] or 0
+        self.assertEqual(income, Sale.objects.filter(cash_register=register).aggregate(t=Sum('total_amount'))['t'] or 0)
+
+@override_settings(JOBS_MODE='worker')
+class SalesCubeTests(LedgerAssertions, TestCase):
+    def setUp(self):
+        self.fixture = sales_fixture(stock=100)
+        self.line = {'dish': self.fixture['dish'], 'quantity': 2, 'unit_price': Decimal('10')}
+
+    def assertCubeMatchesSales(self):
+        lines = SaleItem.objects.aggregate(quantity=Sum('quantity'), revenue=Sum('subtotal'))
+        cube = SalesCube.objects.aggregate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+        self.assertEqual(cube, lines)
+        self.assertRegisterMatchesSales(self.fixture['register'])
+        self.assertStockMatchesLedger(self.fixture['dish'])
+
+    def test_cube_matches_sale_items_once_the_queue_drains(self):
+        for _ in range(3):
+            Sale.record(self.fixture['register'], [self.line])
+        run_pending()
+        self.assertCubeMatchesSales()
+        self.assertEqual(SalesCube.objects.count(), 1)
+
+    def test_sale_on_a_register_closed_meanwhile_is_rolled_back(self):
+        register = self.fixture['register']
+        CashRegister.objects.get(pk=register.pk).close_register(Decimal('0'))
+        with self.assertRaises(ValueError):
+            Sale.record(register, [self.line])
+        self.assertFalse(Sale.objects.exists())
+        self.fixture['dish'].refresh_from_db()
+        self.assertEqual(self.fixture['dish'].current_stock, 100)
+
+    def test_sale_committed_after_the_cell_job_was_claimed_is_counted(self):
+        Sale.record(self.fixture['register'], [self.line])
+        taken = list(claim())
+        # Otra venta de la misma caja y hora llega mientras el trabajo de la primera está tomado
+        Sale.record(self.fixture['register'], [self.line])
+        for current in taken:
+            run_job(current)
+        run_pending()
+        self.assertCubeMatchesSales()
+        self.assertEqual(SalesCube.objects.get().quantity, 4)
+
+
+
+@override_settings(JOBS_MODE='worker')
+class StockLedgerTests(TestCase):
+    def setUp(self):
+        self.rice = Product.objects.create(name='Arroz', base_unit=BaseUnit.KILO)
+        self.start = timezone.now() - timedelta(days=3)
+        # Día 0: entran 10 a 3; día 1: entran 5 a 4; día 2: salen 12
+        for days, quantity, cost in ((0, '10', '3'), (1, '5', '4')):
+            self.rice.receive(Decimal(quantity), Decimal(cost), MovementType.OPENING)
+            self.move_last_movements(days)
+        self.rice.consume(Decimal('12'), MovementType.PRODUCTION_OUT)
+        self.move_last_movements(2)
+
+    def move_last_movements(self, days):
+        StockMovement.objects.filter(timestamp__gt=self.start + timedelta(days=2, hours=1)).update(
+            timestamp=self.start + timedelta(days=days)
+        )
+
+    def at(self, days, hours=1):
+        return StockMovement.objects.position_at(self.start + timedelta(days=days, hours=hours))
+
+    def test_position_at_each_point_in_time(self):
+        self.assertEqual(StockMovement.objects.position_at(self.start - timedelta(hours=1)), {})
+        self.assertEqual(self.at(0)[self.rice.pk], (10, 30))
+        self.assertEqual(self.at(1)[self.rice.pk], (15, 50))
+        # PEPS: salen los 10 a 3 y 2 de los de 4
+        self.assertEqual(self.at(2)[self.rice.pk], (3, 12))
+
+    def test_checkpoint_gives_the_same_position(self):
+        before = [self.at(day) for day in range(3)]
+        StockCheckpoint.take(self.start + timedelta(days=1, hours=2))
+        self.assertEqual([self.at(day) for day in range(3)], before)
+
+    def test_kardex_matches_the_batches_and_is_append_only(self):
+        kardex = StockMovement.objects.filter(product=self.rice).aggregate(total=Sum('quantity'))['total']
+        batches = Batch.objects.filter(product=self.rice).aggregate(total=Sum('current_quantity'))['total']
+        self.assertEqual(kardex, batches)
+        with self.assertRaises(ValueError):
+            StockMovement.objects.first().save()
+
+
+@override_settings(JOBS_MODE='worker')
+class StockAlertTests(TestCase):
+    def setUp(self):
+        self.rice = Product.objects.create(name='Arroz', base_unit=BaseUnit.KILO, reorder_threshold=Decimal('5'))
+        self.rice.receive(Decimal('10'), Decimal('3'), MovementType.OPENING)
+        self.rice.recalculate_stock()
+
+    def use(self, quantity):
+        self.rice.consume(Decimal(quantity), MovementType.PRODUCTION_OUT)
+        self.rice.recalculate_stock()
+
+    def test_one_open_alert_per_product_that_follows_the_stock(self):
+        self.assertFalse(StockAlert.objects.exists())
+        self.use('6')
+        self.use('1')
+        alert = StockAlert.objects.get()
+        self.assertEqual((alert.stock_level, alert.threshold, alert.resolved_at), (3, 5, None))
+
+    def test_restock_resolves_and_a_new_drop_opens_another(self):
+        self.use('6')
+        self.rice.receive(Decimal('10'), Decimal('3'), MovementType.OPENING)
+        self.rice.recalculate_stock()
+        self.assertFalse(StockAlert.objects.filter(resolved_at__isnull=True).exists())
+        self.use('10')
+        self.assertEqual(StockAlert.objects.count(), 2)
+        self.assertEqual(StockAlert.objects.filter(resolved_at__isnull=True).count(), 1)
+
+    def test_concurrent_open_is_dropped_by_the_unique_index(self):
+        self.use('6')
+        StockAlert.objects.bulk_create(
+            [StockAlert(product=self.rice, threshold=5, stock_level=4)], ignore_conflicts=True
+        )
+        self.assertEqual(StockAlert.objects.count(), 1)
+
+    def test_clearing_the_threshold_resolves_the_open_alert(self):
+        self.use('6')
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+        response = client.patch(f'/api/inventory/products/{self.rice.pk}/', {'reorder_threshold': None}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(StockAlert.objects.get().resolved_at)
+
+@override_settings(JOBS_MODE='worker')
+class ForecastTests(TestCase):
+    def test_todays_partial_sales_do_not_drag_the_forecast(self):
+        fixture = sales_fixture(stock=1000)
+        dish = fixture['dish']
+        today = timezone.localdate()
+        for offset in range(14, -1, -1):
+            day = today - timedelta(days=offset)
+            moment = timezone.make_aware(datetime.combine(day, time(9 if offset == 0 else 13)))
+            # Todos los días completos venden 10; hoy, a media mañana, recién 1
+            quantity = 1 if offset == 0 else 10
+            Sale.record(
+                fixture['register'], [{'dish': dish, 'quantity': quantity, 'unit_price': Decimal('10')}], date=moment
+            )
+        plan = production_plan(history_days=14)
+        row = next(d for d in plan['dishes'] if d['dish_id'] == dish.id)
+        self.assertEqual(row['smoothed'], 10)
+        self.assertEqual(row['moving_average'], 10)
+
+
+@override_settings(JOBS_MODE='worker')
+class ProductionOutputBatchTests(TestCase):
+    def setUp(self):
+        self.dish = sales_fixture(stock=10)['dish']
+
+    def test_new_production_gets_its_own_batch(self):
+        production = Production.objects.create(dish=self.dish, quantity_produced=5)
+        production.update_totals(created=True)
+        self.assertEqual(production.output_batch.current_quantity, 5)
+        self.assertEqual(Batch.objects.filter(product=self.dish).count(), 2)
+
+    def test_editing_an_old_production_without_batch_does_not_add_stock(self):
+        production = Production.objects.create(dish=self.dish, quantity_produced=5)
+        production.update_totals()
+        production.refresh_from_db()
+        self.dish.refresh_from_db()
+        self.assertIsNone(production.output_batch)
+        self.assertEqual(Batch.objects.filter(product=self.dish).count(), 1)
+        self.assertEqual(self.dish.current_stock, 10)
+
+
+
+@override_settings(JOBS_MODE='worker')
+class ProductionPlanTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+        self.rice = Product.objects.create(name='Arroz', base_unit=BaseUnit.KILO)
+        self.rice.receive(Decimal('1'), Decimal('3.33'), MovementType.OPENING)
+        self.dish = Product.objects.create(name='Majadito', is_dish=True, sales_price=Decimal('25'))
+        Recipe.objects.create(dish=self.dish, ingredient=self.rice, quantity_required=Decimal('0.125'))
+
+    def plan(self, *items):
+        return self.client.post('/api/inventory/production/plan/', {
+            'items': [{'dish_id': dish_id, 'quantity': qty} for dish_id, qty in items]
+        }, format='json')
+
+    def test_same_dish_twice_is_one_production(self):
+        response = self.plan((self.dish.pk, 1), (self.dish.pk, 2))
+        self.assertEqual(response.status_code, 201, response.content)
+        production = Production.objects.get()
+        self.assertEqual(production.quantity_produced, 3)
+        self.assertEqual(production.ingredients_used.get().quantity_used, Decimal('0.375'))
+
+    def test_costs_are_saved_and_returned_in_cents(self):
+        # 3 x 0.125 kg x 3.33 = 1.24875
+        row = self.plan((self.dish.pk, 3)).json()['productions'][0]
+        production = Production.objects.get()
+        self.assertEqual((row['total_cost'], row['unit_cost_real']), ('1.25', '0.42'))
+        self.assertEqual((production.total_cost, production.unit_cost_real), (Decimal('1.25'), Decimal('0.42')))
+        self.assertEqual(production.output_batch.unit_cost, Decimal('0.42'))
+
+    def test_shortage_rejects_the_whole_plan(self):
+        response = self.plan((self.dish.pk, 9))
+        self.assertEqual(response.status_code, 400)
+        shortage = response.json()['shortages'][0]
+        self.assertEqual((shortage['ingredient_id'], shortage['name']), (self.rice.pk, 'Arroz'))
+        self.assertEqual((Decimal(shortage['required']), Decimal(shortage['available'])), (Decimal('1.125'), 1))
+        self.assertFalse(Production.objects.exists())
+        self.assertEqual(Batch.objects.get(product=self.rice).current_quantity, 1)
+
+    def test_non_dishes_are_rejected(self):
+        response = self.plan((self.rice.pk, 1))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('No son platos', str(response.json()))
+        with self.assertRaises(ValueError):
+            Production.run_plan({self.rice.pk: 1})
+        self.assertFalse(Production.objects.exists())
+
+@override_settings(JOBS_MODE='worker')
+class AverageCostTests(LedgerAssertions, TestCase):
+    def setUp(self):
+        self.oil = Product.objects.create(name='Aceite', base_unit=BaseUnit.UNIT)
+
+    def receive(self, quantity, cost):
+        return self.oil.receive(Decimal(quantity), Decimal(cost), MovementType.PURCHASE)
+
+    def use_average(self):
+        self.oil.costing_method = CostingMethod.AVERAGE
+        self.oil.save(update_fields=['costing_method'])
+        self.oil.apply_costing_method()
+
+    def test_purchases_pool_into_one_batch_at_the_weighted_average(self):
+        self.use_average()
+        first, second = self.receive(10, '3'), self.receive(10, '5')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Batch.objects.filter(product=self.oil).count(), 1)
+        self.assertEqual(self.oil.consume(Decimal(5), MovementType.PRODUCTION_OUT), 20)
+        pool = self.receive(5, '7')
+        self.assertEqual((pool.current_quantity, pool.unit_cost), (20, Decimal('4.75')))
+        self.oil.recalculate_stock()
+        self.assertStockMatchesLedger(self.oil)
+
+    def test_switch_to_average_folds_live_batches_keeping_quantity_and_value(self):
+        self.receive(10, '3')
+        self.receive(10, '5')
+        self.use_average()
+        pool = self.oil.average_batch
+        self.assertEqual((pool.current_quantity, pool.unit_cost), (20, 4))
+        self.assertEqual(
+            list(Batch.objects.filter(product=self.oil).exclude(pk=pool.pk).values_list('current_quantity', flat=True)),
+            [0, 0]
+        )
+        self.assertEqual(StockMovement.objects.filter(movement_type=MovementType.COST_ADJUST).count(), 3)
+        # Volver a aplicar el método no mueve nada
+        self.oil.apply_costing_method()
+        self.assertEqual(StockMovement.objects.filter(movement_type=MovementType.COST_ADJUST).count(), 3)
+        self.oil.recalculate_stock()
+        self.assertEqual(self.oil.current_stock, 20)
+        self.assertStockMatchesLedger(self.oil)
+
+    def test_switch_back_to_fifo_releases_the_pool_as_a_batch(self):
+        self.use_average()
+        pool = self.receive(10, '4')
+        self.oil.costing_method = CostingMethod.FIFO
+        self.oil.save(update_fields=['costing_method'])
+        self.oil.apply_costing_method()
+        self.assertIsNone(Product.objects.get(pk=self.oil.pk).average_batch_id)
+        self.assertNotEqual(self.receive(5, '6').pk, pool.pk)
+        self.assertEqual(self.oil.consume(Decimal(12), MovementType.PRODUCTION_OUT), 10 * 4 + 2 * 6)
+        self.oil.recalculate_stock()
+        self.assertStockMatchesLedger(self.oil)
+
+    def test_method_change_through_the_api(self):
+        user = User.objects.create_superuser('admin', password='x')
+        client = APIClient()
+        client.force_authenticate(user)
+        self.receive(10, '3')
+        self.receive(10, '5')
+        response = client.patch(f'/api/inventory/products/{self.oil.pk}/', {'costing_method': 'AVG'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.oil.refresh_from_db()
+        self.assertEqual(self.oil.average_batch.unit_cost, 4)
+
+        dish = Product.objects.create(name='Majadito', is_dish=True, base_unit=BaseUnit.UNIT)
+        response = client.patch(f'/api/inventory/products/{dish.pk}/', {'costing_method': 'AVG'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('costing_method', response.json())
+        dish.refresh_from_db()
+        self.assertEqual(dish.costing_method, CostingMethod.FIFO)
+        dish.costing_method = CostingMethod.AVERAGE
+        with self.assertRaises(ValidationError):
+            dish.full_clean()
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        for name, is_dish in (
+            ('Pollo a la Brasa', True), ('Sopa de Pollo', True), ('Ají de pollo', True),
+            ('Repollo', False), ('Piña', False), ('Plátano', False),
+        ):
+            Product.objects.create(name=name, is_dish=is_dish)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+
+    def names(self, queryset):
+        return sorted(queryset.values_list('name', flat=True))
+
+    def test_name_is_normalized_on_save(self):
+        self.assertEqual(normalize_search('  Ají   DE Pollo '), 'aji de pollo')
+        product = Product.objects.get(name='Piña')
+        product.name = 'Piña Colada'
+        product.save(update_fields=['name'])
+        self.assertEqual(Product.objects.get(pk=product.pk).search_name, 'pina colada')
+
+    def test_matching_ignores_accents_and_case(self):
+        self.assertEqual(self.names(Product.objects.matching('AJI')), ['Ají de pollo'])
+        self.assertEqual(self.names(Product.objects.matching('piña')), ['Piña'])
+        self.assertEqual(self.names(Product.objects.matching('platano')), ['Plátano'])
+        self.assertFalse(Product.objects.matching('   ').exists())
+
+    def test_short_terms_only_match_the_start_of_the_name(self):
+        self.assertEqual(self.names(Product.objects.matching('po')), ['Pollo a la Brasa'])
+        self.assertEqual(self.names(Product.objects.matching('pol')), [
+            'Ají de pollo', 'Pollo a la Brasa', 'Repollo', 'Sopa de Pollo'
+        ])
+
+    def test_prefix_search_uses_the_name_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("Con pocas filas PostgreSQL puede preferir recorrer la tabla")
+        queryset = Product.objects.matching('po')
+        with connection.cursor() as cursor:
+            sql, params = queryset.query.sql_with_params()
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('product_search_idx', plan)
+
+    def test_results_ranked_by_prefix_then_word_then_the_rest(self):
+        self.assertEqual(list(Product.objects.search('Pollo').values_list('name', flat=True)), [
+            'Pollo a la Brasa', 'Ají de pollo', 'Sopa de Pollo', 'Repollo'
+        ])
+
+    def test_search_endpoint(self):
+        response = self.client.get('/api/inventory/products/search/', {'q': 'POLLO', 'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([p['name'] for p in body], ['Pollo a la Brasa', 'Ají de pollo'])
+        self.assertEqual(set(body[0]), {'id', 'name', 'is_dish', 'base_unit', 'sales_price', 'current_stock'})
+        response = self.client.get('/api/inventory/products/search/', {'q': 'pollo', 'is_dish': 'false'})
+        self.assertEqual([p['name'] for p in response.json()], ['Repollo'])
+        self.assertEqual(self.client.get('/api/inventory/products/search/', {'q': ''}).json(), [])
+        self.assertEqual(self.client.get('/api/inventory/products/search/', {'limit': 'x'}).status_code, 400)
+
+
+@override_settings(JOBS_MODE='worker')
+class ExpiryTests(LedgerAssertions, TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.product = Product.objects.create(name='Leche', is_dish=False)
+        self.expired = self.receive(4, '1', self.today - timedelta(days=1))
+        self.late = self.receive(5, '2', self.today + timedelta(days=10))
+        self.undated = self.receive(6, '3', None)
+        self.soon = self.receive(3, '4', self.today + timedelta(days=2))
+        self.product.recalculate_stock()
+
+    def receive(self, quantity, cost, expiry):
+        return self.product.receive(Decimal(quantity), Decimal(cost), MovementType.PURCHASE, expiry_date=expiry)
+
+    def quantities(self):
+        return [
+            b.current_quantity for b in Batch.objects.filter(pk__in=[
+                self.expired.pk, self.late.pk, self.undated.pk, self.soon.pk
+            ]).order_by('id')
+        ]
+
+    def test_stock_leaves_out_expired_batches(self):
+        self.assertEqual(self.product.current_stock, 14)
+
+    def test_consumption_takes_the_first_to_expire_and_skips_expired(self):
+        cost = self.product.consume(Decimal(5), MovementType.PRODUCTION_OUT)
+        self.assertEqual(self.quantities(), [4, 3, 6, 0])
+        self.assertEqual(cost, 3 * 4 + 2 * 2)
+
+    def test_write_off_moves_expired_stock_to_waste(self):
+        records = WasteRecord.write_off_expired()
+        run_pending()
+        self.assertEqual([(r.batch_id, r.quantity, r.total_cost) for r in records], [(self.expired.pk, 4, 4)])
+        self.assertEqual(self.quantities(), [0, 5, 6, 3])
+        self.assertEqual(self.expired.movements.get(movement_type=MovementType.WASTE).quantity, -4)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.current_stock, 14)
+        self.assertEqual(WasteRecord.write_off_expired(), [])
+        self.assertStockMatchesLedger(self.product)
+
+
+@override_settings(JOBS_MODE='worker')
+class IdempotentSaleTests(LedgerAssertions, TestCase):
+    def setUp(self):
+        self.fixture = sales_fixture(stock=100)
+        self.client = APIClient()
+        self.client.force_authenticate(self.fixture['user'])
+        self.items = [{'dish_id': self.fixture['dish'].id, 'quantity': 1, 'unit_price': '10'}]
+
+    def post(self, url, body, **headers):
+        return self.client.post(url, body, format='json', HTTP_X_TERMINAL='POS', **headers)
+
+    def test_retry_with_the_same_key_returns_the_first_sale(self):
+        first = self.post('/api/inventory/sales/', {'items': self.items}, HTTP_IDEMPOTENCY_KEY='pos-1')
+        retry = self.post('/api/inventory/sales/', {'items': self.items}, HTTP_IDEMPOTENCY_KEY='pos-1')
+        self.assertEqual((first.status_code, retry.status_code), (201, 200))
+        self.assertEqual(first.json()['id'], retry.json()['id'])
+        self.assertEqual(Sale.objects.count(), 1)
+
+    def test_overlong_key_is_rejected(self):
+        for headers, body in (
+            ({'HTTP_IDEMPOTENCY_KEY': 'k' * 65}, {'items': self.items}),
+            ({}, {'items': self.items, 'idempotency_key': 'k' * 65}),
+        ):
+            response = self.post('/api/inventory/sales/', body, **headers)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('idempotency_key', response.json())
+        self.assertFalse(Sale.objects.exists())
+
+    def test_sync_records_each_key_once(self):
+        Sale.record(self.fixture['register'], [
+            {'dish': self.fixture['dish'], 'quantity': 1, 'unit_price': Decimal('10')}
+        ], idempotency_key='online')
+        sold_at = timezone.now() - timedelta(hours=2)
+        queue = [
+            {'idempotency_key': 'off-1', 'date': sold_at.isoformat(), 'items': self.items},
+            {'idempotency_key': 'online', 'items': self.items},
+            {'idempotency_key': 'off-1', 'items': self.items},
+            {'idempotency_key': 'off-2', 'items': [dict(self.items[0], dish_id=self.fixture['ingredient'].id)]},
+        ]
+        response = self.post('/api/inventory/sales/sync/', {'sales': queue})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([r['status'] for r in body['results']], ['created', 'duplicate', 'duplicate', 'rejected'])
+        self.assertEqual(Sale.objects.get(idempotency_key='off-1').date, sold_at)
+
+        again = self.post('/api/inventory/sales/sync/', {'sales': queue}).json()
+        self.assertEqual((again['created'], again['duplicate'], again['rejected']), (0, 3, 1))
+        self.assertEqual(Sale.objects.count(), 2)
+        run_pending()
+        self.assertRegisterMatchesSales(self.fixture['register'])
+        self.assertStockMatchesLedger(self.fixture['dish'])
+
+
+class CatalogImportTests(TestCase):
+    CATALOG = {
+        'units': [{'name': 'Arroba', 'base_unit': 'KG', 'conversion_factor': '11.5'}],
+        'products': [{'name': 'Arroz', 'base_unit': 'KG'}, {'name': 'Huevo', 'base_unit': 'U'}],
+        'dishes': [{'name': 'Majadito', 'sales_price': '25'}],
+        'recipes': [
+            {'dish': 'Majadito', 'ingredient': 'Arroz', 'quantity_required': '0.2'},
+            {'dish': 'Majadito', 'ingredient': 'Huevo', 'quantity_required': '1'},
+        ],
+    }
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+
+    def load(self, data):
+        return self.client.post('/api/inventory/catalog/', data, format='json')
+
+    def recipe(self, dish):
+        return dict(Recipe.objects.filter(dish__name=dish).values_list('ingredient__name', 'quantity_required'))
+
+    def test_import_can_be_repeated_without_duplicates(self):
+        for _ in range(2):
+            response = self.load(self.CATALOG)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), {'units': 1, 'products': 2, 'dishes': 1, 'recipes': 2})
+        self.assertEqual(Product.objects.count(), 3)
+        self.assertEqual(UnitOfMeasure.objects.get().conversion_factor, Decimal('11.5'))
+        self.assertEqual(self.recipe('Majadito'), {'Arroz': Decimal('0.2'), 'Huevo': Decimal('1')})
+        self.assertEqual(Product.objects.get(name='Majadito').search_name, 'majadito')
+
+    def test_sent_recipe_replaces_the_previous_one(self):
+        self.load(self.CATALOG)
+        self.load({'recipes': [{'dish': 'Majadito', 'ingredient': 'Arroz', 'quantity_required': '0.3'}]})
+        self.assertEqual(self.recipe('Majadito'), {'Arroz': Decimal('0.3')})
+
+    def test_csv_upload(self):
+        text = (
+            "record,name,base_unit,sales_price,dish,ingredient,quantity_required\n"
+            "product,Papa,KG,,,,\n"
+            "dish,Salteña,,8,,,\n"
+            "recipe,,,,Salteña,Papa,0.1\n"
+        )
+        upload = SimpleUploadedFile('carta.csv', text.encode('utf-8'), content_type='text/csv')
+        response = self.client.post('/api/inventory/catalog/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.recipe('Salteña'), {'Papa': Decimal('0.1')})
+        self.assertEqual(Product.objects.get(name='Salteña').sales_price, Decimal('8'))
+
+    def test_existing_dish_cannot_be_turned_into_an_ingredient(self):
+        self.load(self.CATALOG)
+        response = self.load({'products': [{'name': 'Majadito'}], 'dishes': [{'name': 'Arroz', 'sales_price': '1'}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'products', 'dishes'})
+        dish = Product.objects.get(name='Majadito')
+        self.assertTrue(dish.is_dish)
+        self.assertEqual(dish.sales_price, Decimal('25'))
+
+    def test_omitted_fields_keep_their_current_value(self):
+        self.load(self.CATALOG)
+        self.assertEqual(self.load({'products': [{'name': 'Huevo'}], 'dishes': [{'name': 'Majadito'}]}).status_code, 200)
+        self.assertEqual(Product.objects.get(name='Huevo').base_unit, BaseUnit.UNIT)
+        self.assertEqual(Product.objects.get(name='Majadito').sales_price, Decimal('25'))
+        self.assertEqual(self.load({'dishes': [{'name': 'Nuevo'}]}).status_code, 400)
+
+
+@override_settings(JOBS_MODE='worker')
+class ReportParameterTests(TransactionTestCase):
+    # Estas vistas leen por la réplica (espejo del primario)
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+
+    def test_bad_ids_are_a_400(self):
+        for url in (
+            '/api/inventory/sales-analytics/?dish=abc',
+            '/api/inventory/sales-analytics/?register=1;2',
+            '/api/inventory/stock-movements/?product=abc',
+            '/api/inventory/stock-movements/at/?product=abc',
+            '/api/inventory/stock-movements/consumption/?product=abc',
+        ):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 400, url)
+
+    def test_limit_is_at_least_one(self):
+        for limit in ('-1', '0'):
+            response = self.client.get(f'/api/inventory/sales-analytics/?limit={limit}')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/inventory/sales-analytics/?limit=x').status_code, 400)
+
+
+@override_settings(JOBS_MODE='worker')
+class CachedReferenceWriteTests(TransactionTestCase):
+    """ Las unidades en memoria solo validan el id: lo que se guarda sale de la base """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+        self.unit = UnitOfMeasure.objects.create(name='Arroba', base_unit=BaseUnit.KILO, conversion_factor=Decimal('11.5'))
+        self.product = Product.objects.create(name='Arroz', base_unit=BaseUnit.KILO)
+        self.register = CashRegister.objects.create(start_amount=Decimal('500'))
+
+    def test_purchase_uses_the_current_conversion_factor(self):
+        refdata.get('inventory.units')
+        # Escritura masiva sin señales: la copia en memoria queda vieja hasta el próximo bump
+        UnitOfMeasure.objects.filter(pk=self.unit.pk).update(conversion_factor=Decimal('10'))
+        self.assertEqual(refdata.get('inventory.units')[self.unit.pk].conversion_factor, Decimal('11.5'))
+        response = self.client.post('/api/inventory/purchases/', {
+            'cash_register': self.register.pk, 'description': 'Mercado',
+            'items': [{'product_id': self.product.pk, 'unit_id': self.unit.pk, 'quantity_bought': '2', 'total_cost': '100'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(Batch.objects.get(product=self.product).initial_quantity, Decimal('20'))
+
+
+@override_settings(JOBS_MODE='worker')
+class AdminQueryTests(TestCase):
+    """ Las páginas del admin cuestan lo mismo con pocas o muchas filas """
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        self.register = CashRegister.objects.create(start_amount=Decimal('100'))
+        self.rice = Product.objects.create(name='Arroz', base_unit=BaseUnit.KILO)
+        self.dish = Product.objects.create(name='Majadito', is_dish=True, sales_price=Decimal('25'))
+
+    def add_rows(self, count):
+        for n in range(count):
+            self.rice.receive(Decimal('1'), Decimal('3'), MovementType.OPENING)
+            sale = Sale.objects.create(cash_register=self.register)
+            SaleItem.objects.bulk_create([SaleItem(
+                sale=sale, dish=self.dish, quantity=1, unit_price=Decimal('25'),
+                subtotal=Decimal('25'), cost_total=Decimal('9')
+            )])
+
+    def queries_for(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_pages_do_not_grow_with_the_rows(self):
+        pages = (
+            '/admin/inventory/product/', '/admin/inventory/batch/', '/admin/inventory/sale/',
+            '/admin/inventory/stockmovement/', f'/admin/inventory/product/{self.dish.pk}/change/',
+        )
+        self.add_rows(3)
+        few = [self.queries_for(url)[0] for url in pages]
+        self.add_rows(30)
+        self.assertEqual([self.queries_for(url)[0] for url in pages], few)
+
+    def test_dish_sales_inline_is_paginated(self):
+        self.add_rows(25)
+        url = f'/admin/inventory/product/{self.dish.pk}/change/'
+        _, first = self.queries_for(url)
+        self.assertContains(first, 'Ventas del plato')
+        self.assertContains(first, 'Página 1 de 2')
+        _, second = self.queries_for(url + '?saleitem_set-page=2')
+        self.assertContains(second, 'Página 2 de 2')
+        _, ingredient = self.queries_for(f'/admin/inventory/product/{self.rice.pk}/change/')
+        self.assertNotContains(ingredient, 'Ventas del plato')
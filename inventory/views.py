@@ -1,10 +1,27 @@
+import json
 from rest_framework import viewsets, views, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.parsers import MultiPartParser
+from django.db import IntegrityError
+from django.db.models import Sum, F, DecimalField
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time, timedelta
 
 # Modelos
-from .models import Product, Sale, Production, Purchase, UnitOfMeasure
+from .models import (
+    Product, Sale, Production, Purchase, UnitOfMeasure, StockMovement, MovementType, StockAlert, InsufficientStock,
+    SalesCube
+)
 from finance.models import CashRegister
+from backend_restaurant.db_router import ReplicaReadMixin
+from backend_restaurant.renderers import ORJSONParser, money
+from backend_restaurant.fieldsets import SparseFieldsViewMixin
+from .forecast import production_plan
 
 # Serializers
 from .serializers import (
@@ -12,50 +29,335 @@ from .serializers import (
     SaleSerializer, 
     ProductionSerializer, 
     PurchaseSerializer, 
-    UnitSerializer
+    UnitSerializer,
+    StockMovementSerializer,
+    StockAlertSerializer,
+    CatalogSerializer,
+    ProductionPlanSerializer,
+    SaleSyncSerializer
 )
 
 # 1. PRODUCTOS
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
 
+    SEARCH_FIELDS = ('id', 'name', 'is_dish', 'base_unit', 'sales_price', 'current_stock')
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """ Autocompletado del POS: ?q=pol&limit=10&is_dish=true, por relevancia.
+        Sin tildes ni mayúsculas, con el índice del nombre normalizado """
+        params = request.query_params
+        try:
+            limit = min(int(params.get('limit', 20)), 50)
+        except ValueError:
+            return Response({"error": "limit debe ser un número entero."}, status=400)
+        products = Product.objects.search(params.get('q', ''))
+        if params.get('is_dish') in ('true', 'false'):
+            products = products.filter(is_dish=params['is_dish'] == 'true')
+        return Response(list(products.values(*self.SEARCH_FIELDS)[:max(limit, 1)]))
+
 # 2. VENTAS
-class SaleViewSet(viewsets.ModelViewSet):
+class SaleViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     queryset = Sale.objects.all()
     serializer_class = SaleSerializer
     permission_classes = [IsAuthenticated]
 
+    def create(self, request, *args, **kwargs):
+        # El POS reintenta con la misma clave (cabecera o cuerpo): se devuelve la venta ya hecha
+        key = request.headers.get('Idempotency-Key') or request.data.get('idempotency_key')
+        max_length = Sale._meta.get_field('idempotency_key').max_length
+        if key is not None and (not isinstance(key, str) or len(key) > max_length):
+            # La cabecera no pasa por el serializer: se valida antes de buscarla o guardarla
+            return Response(
+                {"idempotency_key": [f"Debe ser un texto de hasta {max_length} caracteres."]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if key:
+            existing = Sale.objects.filter(idempotency_key=key).first()
+            if existing:
+                return Response(self.get_serializer(existing).data, status=status.HTTP_200_OK)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            serializer.save(idempotency_key=key or None)
+        except IntegrityError:
+            # Dos reintentos simultáneos: el índice único decide cuál vale
+            existing = Sale.objects.filter(idempotency_key=key).first() if key else None
+            if existing is None:
+                raise
+            return Response(self.get_serializer(existing).data, status=status.HTTP_200_OK)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'])
+    def sync(self, request):
+        """ Ventas hechas sin conexión: en orden, sin duplicar, en una sola transacción """
+        caja = CashRegister.objects.for_request(request)
+        if not caja:
+            return Response({"error": "¡No hay ninguna CAJA ABIERTA en esta terminal!"}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = SaleSyncSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = serializer.save(cash_register=caja)
+        return Response({
+            "cash_register": caja.id,
+            "created": sum(r['status'] == 'created' for r in results),
+            "duplicate": sum(r['status'] == 'duplicate' for r in results),
+            "rejected": sum(r['status'] == 'rejected' for r in results),
+            "results": results,
+        })
+
 # 3. CAJA ACTUAL
 class CurrentCashRegisterView(views.APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        caja = CashRegister.objects.filter(is_closed=False).last()
+        caja = CashRegister.objects.for_request(request)
         if caja:
             return Response({
                 "id": caja.id, 
                 "date": caja.date, 
-                "start_amount": caja.start_amount
+                "start_amount": caja.start_amount,
+                "terminal": caja.terminal,
+                "balance": caja.calculate_balance()
             })
         else:
             return Response({"error": "No hay caja abierta"}, status=status.HTTP_404_NOT_FOUND)
 
 # 4. PRODUCCIÓN
-class ProductionViewSet(viewsets.ModelViewSet):
+class ProductionViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     queryset = Production.objects.all().order_by('-date')
     serializer_class = ProductionSerializer
     permission_classes = [IsAuthenticated]
 
+    @action(detail=False, methods=['post'])
+    def plan(self, request):
+        """ Varios platos en una sola operación: todo o nada """
+        serializer = ProductionPlanSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            productions = serializer.save()
+        except InsufficientStock as e:
+            return Response({"error": str(e), "shortages": e.shortages}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "productions": [
+                {
+                    "id": p.id, "dish_id": p.dish_id, "quantity_produced": p.quantity_produced,
+                    "total_cost": p.total_cost, "unit_cost_real": p.unit_cost_real,
+                }
+                for p in productions
+            ]
+        }, status=status.HTTP_201_CREATED)
+
 # 5. COMPRAS
-class PurchaseViewSet(viewsets.ModelViewSet):
+class PurchaseViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     queryset = Purchase.objects.all().order_by('-date')
     serializer_class = PurchaseSerializer
     permission_classes = [IsAuthenticated]
 
 # 6. UNIDADES
-class UnitViewSet(viewsets.ModelViewSet):
+class UnitViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     queryset = UnitOfMeasure.objects.all()
     serializer_class = UnitSerializer
-    permission_classes = [IsAuthenticated]
\ No newline at end of file
+    permission_classes = [IsAuthenticated]
+
+# 7. KARDEX Y STOCK HISTÓRICO
+def id_param(params, name):
+    """ Id opcional de la query string: uno que no es número es un 400, no un 500 """
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({name: "Debe ser un id numérico."})
+
+def parse_instant(value, end_of_day=True):
+    """ Acepta '2025-12-05' (fin de ese día) o '2025-12-05T14:30' """
+    if not value:
+        return None
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is not None:
+        moment = datetime.combine(day, time.max if end_of_day else time.min)
+    else:
+        try:
+            moment = parse_datetime(value)
+        except ValueError:  # bien formada pero imposible, como 2025-13-40T10:00
+            moment = None
+        if moment is None:
+            return None
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+class StockMovementViewSet(ReplicaReadMixin, SparseFieldsViewMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = StockMovement.objects.all().order_by('-timestamp', '-id')
+    serializer_class = StockMovementSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        product = id_param(self.request.query_params, 'product')
+        if product is not None:
+            queryset = queryset.filter(product_id=product)
+        return queryset
+
+    @action(detail=False, methods=['get'])
+    def at(self, request):
+        """ ¿Qué había en almacén en tal fecha? Stock y valorización por producto """
+        raw = request.query_params.get('at')
+        when = parse_instant(raw) if raw else timezone.now()
+        if when is None:
+            return Response({"error": "Fecha inválida. Usa AAAA-MM-DD o AAAA-MM-DDTHH:MM."}, status=400)
+
+        product = id_param(request.query_params, 'product')
+        position = StockMovement.objects.position_at(when)
+        if product is not None:
+            position = {pk: row for pk, row in position.items() if pk == product}
+        names = dict(Product.objects.filter(pk__in=position).values_list('id', 'name'))
+        items = [
+            {"product_id": product_id, "name": names.get(product_id), "quantity": qty, "value": money(value)}
+            for product_id, (qty, value) in sorted(position.items())
+        ]
+        return Response({
+            "at": when,
+            "total_value": sum((item["value"] for item in items), money(0)),
+            "items": items,
+        })
+
+    @action(detail=False, methods=['get'])
+    def consumption(self, request):
+        """ Consumo por día y producto (cocina + ventas) en un rango de fechas """
+        product = id_param(request.query_params, 'product')
+        end = parse_instant(request.query_params.get('end')) or timezone.now()
+        start = parse_instant(request.query_params.get('start'), end_of_day=False) or end - timedelta(days=7)
+
+        movements = StockMovement.objects.filter(
+            timestamp__range=[start, end],
+            movement_type__in=[MovementType.PRODUCTION_OUT, MovementType.SALE],
+        )
+        if product is not None:
+            movements = movements.filter(product_id=product)
+        rows = (
+            movements
+            .annotate(dia=TruncDate('timestamp'))
+            .values('dia', 'product_id', 'product__name')
+            .annotate(
+                consumed=-Sum('quantity'),
+                cost=-Sum(F('quantity') * F('unit_cost'), output_field=DecimalField(max_digits=14, decimal_places=3)),
+            )
+            .order_by('dia', 'product__name')
+        )
+        return Response([{**row, 'cost': money(row['cost'])} for row in rows])
+
+# 8. ALERTAS DE STOCK BAJO
+class StockAlertViewSet(ReplicaReadMixin, SparseFieldsViewMixin, viewsets.ReadOnlyModelViewSet):
+    """ Por defecto solo las alertas abiertas; ?all=1 incluye las ya resueltas """
+    queryset = StockAlert.objects.select_related('product').order_by('-created_at')
+    serializer_class = StockAlertSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.query_params.get('all') != '1':
+            queryset = queryset.filter(resolved_at__isnull=True)
+        return queryset
+
+# 9. PRONÓSTICO DE DEMANDA Y PRODUCCIÓN SUGERIDA
+class ForecastView(ReplicaReadMixin, views.APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params = request.query_params
+        try:
+            target = parse_date(params['date']) if params.get('date') else None
+            history_days = int(params.get('days', 365))
+            alpha = float(params.get('alpha', 0.3))
+            weeks = int(params.get('weeks', 4))
+            safety = float(params.get('safety', 0.1))
+        except ValueError:
+            return Response({"error": "Parámetros inválidos."}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 < alpha <= 1 or history_days < 1 or weeks < 1:
+            return Response({"error": "alpha debe estar en (0, 1]; days y weeks deben ser positivos."}, status=400)
+
+        return Response(production_plan(
+            target=target, history_days=history_days, alpha=alpha, weeks=weeks, safety=safety
+        ))
+
+# 9.1 ANALÍTICA DE VENTAS (desde el cubo preagregado, no desde SaleItem)
+class SalesAnalyticsView(ReplicaReadMixin, views.APIView):
+    """ Más vendidos, mapa de calor por día de semana y hora, ventas por caja o cajero:
+    ?group_by=dish|hour|day|weekday|heatmap|register|cashier &start= &end= &dish= &register=
+    &terminal= &order=quantity|revenue &limit= """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params = request.query_params
+        group_by = params.get('group_by', 'dish')
+        if group_by not in SalesCube.GROUPS:
+            return Response({"error": f"group_by debe ser uno de: {', '.join(SalesCube.GROUPS)}"}, status=400)
+        order = params.get('order')
+        if order not in (None, 'quantity', 'revenue'):
+            return Response({"error": "order debe ser quantity o revenue."}, status=400)
+        try:
+            end = parse_date(params['end']) if params.get('end') else timezone.localdate()
+            start = parse_date(params['start']) if params.get('start') else end - timedelta(days=29)
+            limit = max(int(params['limit']), 1) if params.get('limit') else None
+        except ValueError:
+            return Response({"error": "Parámetros inválidos."}, status=status.HTTP_400_BAD_REQUEST)
+        if start is None or end is None or start > end:
+            return Response({"error": "Rango de fechas inválido (AAAA-MM-DD)."}, status=400)
+        dish, register = id_param(params, 'dish'), id_param(params, 'register')
+
+        cells = SalesCube.objects.filter(date__range=[start, end])
+        if dish is not None:
+            cells = cells.filter(dish_id=dish)
+        if register is not None:
+            cells = cells.filter(cash_register_id=register)
+        if params.get('terminal'):
+            cells = cells.filter(cash_register__terminal=params['terminal'])
+
+        rows = cells.rollup(group_by)
+        if order:
+            rows = rows.order_by(f"-{order}")
+        if limit:
+            rows = rows[:limit]
+
+        results = []
+        totals = {"quantity": 0, "revenue": money(0), "cost": money(0)}
+        for row in rows:
+            row['revenue'], row['cost'] = money(row['revenue']), money(row['cost'])
+            row['margin'] = row['revenue'] - row['cost']
+            for key in totals:
+                totals[key] += row[key]
+            results.append(row)
+        totals['margin'] = totals['revenue'] - totals['cost']
+        return Response({"group_by": group_by, "start": start, "end": end, "summary": totals, "rows": results})
+
+# 10. CARGA MASIVA DEL CATÁLOGO
+class CatalogImportView(views.APIView):
+    """ Recibe el catálogo como JSON o como archivo (.json / .csv) en el campo 'file' """
+    permission_classes = [IsAdminUser]
+    parser_classes = [ORJSONParser, MultiPartParser]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload:
+            text = upload.read().decode('utf-8-sig')
+            try:
+                data = CatalogSerializer.from_csv(text) if upload.name.lower().endswith('.csv') else json.loads(text)
+            except ValueError:
+                return Response({"error": "Archivo de catálogo inválido."}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            data = request.data
+
+        serializer = CatalogSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.save(), status=status.HTTP_200_OK)
+